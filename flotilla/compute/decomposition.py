@@ -160,6 +160,64 @@ class DataFrameICA(DataFrameReducerBase, decomposition.FastICA):
     pass
 
 
+class DataFrameNMF(DataFrameReducerBase, decomposition.NMF):
+    """Perform Non-negative Matrix Factorization on a DataFrame
+    """
+
+    def fit(self, X):
+        """Perform a scikit-learn fit and relabel dimensions to be
+        informative names
+
+        scikit-learn's NMF fits by calling fit_transform, which here would
+        call this fit again, so fit with NMF's own fit_transform instead.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            A (n_samples, n_features) Dataframe of data to reduce
+
+        Returns
+        -------
+        self : DataFrameNMF
+            A instance of the data, now with a components_ attribute
+        """
+        self._check_dataframe(X)
+        self.X = X
+        decomposition.NMF.fit_transform(self, X)
+        self.components_ = pd.DataFrame(self.components_,
+                                        columns=self.X.columns).rename_axis(
+            self.relabel_pcs, 0)
+        return self
+
+    def transform(self, X):
+        """Transform a matrix into the component space
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            A (n_samples, n_features) sized DataFrame to transform into the
+            current compoment space
+
+        Returns
+        -------
+        component_space : pandas.DataFrame
+            A (n_samples, self.n_components) sized DataFrame transformed into
+            component space
+        """
+        self._check_dataframe(X)
+        # NMF solves for the transform with the plain array of components
+        components = self.components_
+        self.components_ = components.values
+        try:
+            component_space = decomposition.NMF.transform(self, X)
+        finally:
+            self.components_ = components
+        component_space = pd.DataFrame(component_space,
+                                       index=X.index).rename_axis(
+            self.relabel_pcs, 1)
+        return component_space
+
+
 class DataFrameTSNE(DataFrameReducerBase):
     """Perform t-Distributed Stochastic Neighbor Embedding on a DataFrame
 
@@ -10,10 +10,13 @@ import itertools
 import math
 import sys
 
+from joblib import Parallel, delayed
 import numpy as np
 from scipy import stats
 import pandas as pd
 
+CONTRAST_REST = 'rest'
+
 
 def benjamini_hochberg(p_values, fdr=0.1):
     """Benjamini-Hochberg correction for multiple hypothesis testing
@@ -39,20 +42,92 @@ def benjamini_hochberg(p_values, fdr=0.1):
     -------
     sigs : numpy.array
         Boolean array of whether or not the provided p-values are significant
-        given the FDR cutoff
+        given the FDR cutoff. NaN p-values are never significant
+    """
+    q_values = benjamini_hochberg_q_values(p_values)
+    return np.asarray(q_values <= fdr)
+
+
+def benjamini_hochberg_q_values(p_values):
+    """Benjamini-Hochberg adjusted p-values ("q-values")
+
+    The q-value of a p-value is the smallest false discovery rate at which
+    it would be called significant by :py:func:`benjamini_hochberg`.
+
+    Parameters
+    ----------
+    p_values : list-like
+        p-values. NaNs are ignored and stay NaN
+
+    Returns
+    -------
+    q_values : numpy.array or pandas.Series
+        The adjusted p-values, in the same order as the input. If the input
+        was a pandas.Series, returns a Series with the same index
+    """
+    p = np.asarray(p_values, dtype=float)
+    q = np.nan * np.ones(p.shape)
+    tested = np.flatnonzero(np.isfinite(p))
+    n_tests = len(tested)
+
+    if n_tests > 0:
+        order = tested[np.argsort(p[tested])]
+        ranked = p[order] * n_tests / np.arange(1, n_tests + 1)
+        # Each q-value is the smallest adjusted value at its rank or above
+        ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+        q[order] = np.minimum(ranked, 1)
+
+    if isinstance(p_values, pd.Series):
+        return pd.Series(q, index=p_values.index, name=p_values.name)
+    return q
+
+
+def _local_mean_std(x, ranks, local_count):
+    """Mean and standard deviation of each value's neighbors in rank
+
+    Each value's neighborhood is the values ranked from
+    ``rank - floor(local_count / 2)`` to ``rank + ceil(local_count / 2)``
+    (inclusive), shifted to fit at the lowest and highest ranks. Uses
+    cumulative sums over the rank-sorted values, so all windows take O(n).
+
+    Parameters
+    ----------
+    x : numpy.array
+        A (n,) array of values
+    ranks : numpy.array
+        A (n,) permutation of ``range(n)``, the rank of each value
+    local_count : int
+        Size of the neighborhood
+
+    Returns
+    -------
+    local_mean, local_std : numpy.array
+        (n,) arrays of the (population) mean and standard deviation of each
+        value's neighborhood
     """
-    nComps = len(p_values) + 0.0
-    pSorter = np.argsort(p_values)
-    pRank = np.argsort(np.argsort(p_values)) + 1
-    BHcalc = (pRank / nComps) * fdr
-    sigs = np.ndarray(shape=(nComps, ), dtype='bool')
-    issig = True
-    for (p, b, r) in itertools.izip(p_values[pSorter], BHcalc[pSorter],
-                                    pSorter):
-        if p > b:
-            issig = False
-        sigs[r] = issig
-    return sigs
+    n = len(x)
+    start = ranks - int(math.floor(local_count / 2.))
+    stop = ranks + int(math.ceil(local_count / 2.))
+    start[ranks < local_count] = 0
+    stop[ranks < local_count] = local_count
+    high = (ranks > n - local_count) & (ranks >= local_count)
+    start[high] = n - local_count
+    stop[high] = n
+    stop = np.minimum(stop, n - 1) + 1
+
+    # Center before summing squares to avoid catastrophic cancellation
+    sorted_x = np.empty(n)
+    sorted_x[ranks] = x
+    center = sorted_x.mean() if n > 0 else 0
+    sorted_x -= center
+    sums = np.concatenate([[0], np.cumsum(sorted_x)])
+    sums_of_squares = np.concatenate([[0], np.cumsum(sorted_x ** 2)])
+
+    counts = stop - start
+    local_mean = (sums[stop] - sums[start]) / counts
+    local_var = (sums_of_squares[stop] - sums_of_squares[start]) / counts \
+        - local_mean ** 2
+    return local_mean + center, np.sqrt(np.maximum(local_var, 0))
 
 
 class TwoWayGeneComparisonLocal(object):
@@ -122,34 +197,16 @@ class TwoWayGeneComparisonLocal(object):
         self.log2_ratio = np.log2(sample2 / sample1)
         self.average_expression = (sample2 + sample1) / 2.
         self.ranks = np.argsort(np.argsort(self.average_expression))
-        self.p_values = pd.Series(index=labels)
-        self.local_mean = pd.Series(index=labels)
-        self.local_std = pd.Series(index=labels)
-        self.local_z = pd.Series(index=labels)
         self.dtype = dtype
 
-        for g, r in itertools.izip(self.ranks.index, self.ranks):
-            if r < local_count:
-                start = 0
-                stop = local_count
-
-            elif r > self.n_genes - local_count:
-                start = self.n_genes - local_count
-                stop = self.n_genes
-
-            else:
-                start = r - int(math.floor(local_count / 2.))
-                stop = r + int(math.ceil(local_count / 2.))
-
-            local_genes = self.ranks[self.ranks.between(start, stop)].index
-            self.local_mean.ix[g] = np.mean(self.log2_ratio.ix[local_genes])
-            self.local_std.ix[g] = np.std(self.log2_ratio.ix[local_genes])
-            self.p_values.ix[g] = stats.norm.pdf(self.log2_ratio.ix[g],
-                                                 self.local_mean.ix[g],
-                                                 self.local_std.ix[
-                                                     g]) * correction
-            self.local_z.ix[g] = (self.log2_ratio.ix[g] - self.local_mean.ix[
-                g]) / self.local_std.ix[g]
+        local_mean, local_std = _local_mean_std(
+            self.log2_ratio.values, np.asarray(self.ranks), local_count)
+        self.local_mean = pd.Series(local_mean, index=labels)
+        self.local_std = pd.Series(local_std, index=labels)
+        self.p_values = pd.Series(
+            stats.norm.pdf(self.log2_ratio.values, local_mean, local_std)
+            * correction, index=labels)
+        self.local_z = (self.log2_ratio - self.local_mean) / self.local_std
 
         data = pd.DataFrame(index=labels)
         data["rank"] = self.ranks
@@ -170,15 +227,13 @@ class TwoWayGeneComparisonLocal(object):
 
         self.result_ = data
 
-        for label, (pVal, logratio, isSig) in data.get(
-                ["pValue", "log2_ratio", "isSig"]).iterrows():
-            if (pVal < p_value_cutoff) and isSig:
-                if logratio > 0:
-                    self.upregulated_genes.add(label)
-                elif logratio < 0:
-                    self.downregulated_genes.add(label)
-                else:
-                    raise ValueError
+        significant = (data.pValue < p_value_cutoff) & data.isSig
+        if (data.log2_ratio[significant] == 0).any():
+            raise ValueError
+        self.upregulated_genes.update(
+            labels[(significant & (data.log2_ratio > 0)).values])
+        self.downregulated_genes.update(
+            labels[(significant & (data.log2_ratio < 0)).values])
 
     def gstats(self):
         """Write general statistics of the two-way comparison to standard output
@@ -198,7 +253,505 @@ class TwoWayGeneComparisonLocal(object):
                                  *self.sample_names))
 
 
-def differential_expression(data, groupby):
+def _two_way_comparison(values, sample_ids, feature_ids, pairs, **kwargs):
+    """Up- and down-regulated genes of the given pairs of rows of values"""
+    results = []
+    for i, j in pairs:
+        df = pd.DataFrame(values[[i, j]], index=sample_ids[[i, j]],
+                          columns=feature_ids)
+        comparison = TwoWayGeneComparisonLocal(sample_ids[i], sample_ids[j],
+                                               df, **kwargs)
+        results.append((comparison.n_genes, len(comparison.expressed_genes),
+                        sorted(comparison.upregulated_genes),
+                        sorted(comparison.downregulated_genes)))
+    return results
+
+
+def two_way_comparisons(data, sample_pairs=None, p_value_cutoff=0.001,
+                        local_fraction=0.1, bonferroni=True, fdr=None,
+                        n_jobs=1, chunksize=None):
+    """Local two-way gene expression comparison of many pairs of samples
+
+    Runs :py:class:`TwoWayGeneComparisonLocal` over each pair. The
+    expression matrix is shared across the worker processes as a single
+    read-only array, and the pairs are sent in chunks.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        A (n_samples, n_features) dataframe of (not log-transformed)
+        expression values, e.g. of pooled samples or of phenotype means
+    sample_pairs : list of tuples, optional (default=None)
+        Pairs of (control, treatment) sample ids, i.e. rows of ``data``. If
+        None, compares all pairs of samples
+    p_value_cutoff : float, optional (default=0.001)
+        Cutoff for the p-values
+    local_fraction : float, optional (default=0.1)
+        What fraction of genes to use for *local* z-score calculation
+    bonferroni : bool, optional (default=True)
+        Whether or not to use the Bonferonni correction on p-values
+    fdr : float, optional (default=None)
+        If provided, also require the genes to pass Benjamini-Hochberg
+        FDR filtering at this rate
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the pairs across. -1 uses all CPUs.
+    chunksize : int, optional (default=None)
+        Number of pairs per task. By default, splits the pairs evenly into
+        4 tasks per process
+
+    Returns
+    -------
+    summary : pandas.DataFrame
+        A (n_pairs, 4) dataframe indexed by (sample1, sample2), of the number
+        of genes measured in both samples, expressed in either, and up- and
+        down-regulated in sample2 relative to sample1
+    regulated : pandas.DataFrame
+        A tidy dataframe of the sample1, sample2, feature_id and direction
+        ('up' or 'down') of every differentially expressed gene of every
+        pair
+    """
+    if sample_pairs is None:
+        sample_pairs = list(itertools.combinations(data.index, 2))
+    else:
+        sample_pairs = list(sample_pairs)
+    positions = [(data.index.get_loc(sample1), data.index.get_loc(sample2))
+                 for sample1, sample2 in sample_pairs]
+
+    if chunksize is None:
+        n_tasks = 4 * (n_jobs if n_jobs > 0 else 1)
+        chunksize = max(1, int(math.ceil(len(positions) / n_tasks)))
+    chunks = [positions[i:i + chunksize]
+              for i in range(0, len(positions), chunksize)]
+
+    kwargs = dict(p_value_cutoff=p_value_cutoff,
+                  local_fraction=local_fraction, bonferroni=bonferroni,
+                  fdr=fdr)
+    values = data.values.astype(float)
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_two_way_comparison)(values, data.index, data.columns, chunk,
+                                     **kwargs)
+        for chunk in chunks)
+    results = list(itertools.chain(*results))
+
+    index = pd.MultiIndex.from_tuples(sample_pairs,
+                                      names=['sample1', 'sample2']) \
+        if len(sample_pairs) > 0 else None
+    summary = pd.DataFrame(
+        [(n_genes, n_expressed, len(up), len(down))
+         for n_genes, n_expressed, up, down in results], index=index,
+        columns=['n_genes', 'n_expressed', 'n_upregulated',
+                 'n_downregulated'])
+
+    regulated = [(sample1, sample2, feature_id, direction)
+                 for (sample1, sample2), (_, _, up, down)
+                 in zip(sample_pairs, results)
+                 for direction, feature_ids in (('up', up), ('down', down))
+                 for feature_id in feature_ids]
+    regulated = pd.DataFrame(regulated, columns=['sample1', 'sample2',
+                                                 'feature_id', 'direction'])
+    return summary, regulated
+
+
+def _tie_blocks(x):
+    """Sort each column and find its blocks of tied values
+
+    Parameters
+    ----------
+    x : numpy.array
+        A (n_samples, n_features) array. NaNs sort last, each in its own
+        block
+
+    Returns
+    -------
+    order : numpy.array
+        A (n_samples, n_features) array of the argsort of each column
+    is_first : numpy.array
+        A (n_features * n_samples,) boolean array of whether each value, in
+        the sorted values of each column laid out one column after another,
+        starts a new block of ties
+    ties : numpy.array
+        A (n_features * n_samples,) array of the block of each sorted value,
+        numbered across all columns
+    sizes : numpy.array
+        Number of values in each block
+    """
+    order = np.argsort(x, axis=0, kind='mergesort')
+    sorted_x = x[order, np.arange(x.shape[1])].T
+
+    is_first = np.ones(sorted_x.shape, dtype=bool)
+    is_first[:, 1:] = sorted_x[:, 1:] != sorted_x[:, :-1]
+    is_first = is_first.ravel()
+    ties = np.cumsum(is_first) - 1
+    sizes = np.bincount(ties)
+    return order, is_first, ties, sizes
+
+
+def _rank_columns(x, tie_blocks=None):
+    """Rank each column, averaging the ranks of ties
+
+    Parameters
+    ----------
+    x : numpy.array
+        A (n_samples, n_features) array. NaNs are not ranked
+    tie_blocks : tuple, optional
+        Output of :py:func:`_tie_blocks` for x, if already computed
+
+    Returns
+    -------
+    ranks : numpy.array
+        A (n_samples, n_features) array of ranks from 1 within each column,
+        NaN where x is NaN
+    tie_sums : numpy.array
+        A (n_features,) array of the sum of ``t ** 3 - t`` over the sizes
+        ``t`` of each group of ties in each column
+    """
+    n_samples, n_features = x.shape
+    if tie_blocks is None:
+        tie_blocks = _tie_blocks(x)
+    order, is_first, ties, sizes = tie_blocks
+    columns = np.arange(n_features)
+
+    positions = np.tile(np.arange(1, n_samples + 1), n_features)
+    average_ranks = positions[is_first] + (sizes - 1) / 2.
+
+    ranks = np.empty(x.shape)
+    ranks[order, columns] = average_ranks[ties].reshape(
+        n_features, n_samples).T
+    ranks[np.isnan(x)] = np.nan
+
+    tie_columns = np.repeat(columns, n_samples)[is_first]
+    tie_sums = np.bincount(tie_columns, weights=sizes ** 3. - sizes,
+                           minlength=n_features)
+    return ranks, tie_sums
+
+
+def _mann_whitney_u_null(n1, n2):
+    """Probability of each U statistic of two groups without ties
+
+    The number of ways of getting each U are the coefficients of the
+    Gaussian binomial coefficient ``[n1 + n2, n1]``, which is built up as
+    the product of ``(1 - q ** (n2 + i)) / (1 - q ** i)`` for ``i`` from 1
+    to n1.
+    """
+    counts = np.zeros(n1 * n2 + 1)
+    counts[0] = 1
+    for i in range(1, n1 + 1):
+        if n2 + i < len(counts):
+            counts[n2 + i:] -= counts[:-(n2 + i)].copy()
+        for start in range(i):
+            counts[start::i] = np.cumsum(counts[start::i])
+    return counts / counts.sum()
+
+
+def _mann_whitney_p_values(u, n1, n2, tie_sums, method='asymptotic',
+                           exact_max=8):
+    """Two-sided p-values of Mann-Whitney U statistics
+
+    Parameters
+    ----------
+    u : numpy.array
+        (n_features,) array of U statistics of the first group
+    n1, n2 : numpy.array
+        (n_features,) arrays of the number of samples in each group
+    tie_sums : numpy.array
+        (n_features,) array of the sum of ``t ** 3 - t`` over the sizes of
+        each group of ties, across both groups
+    method : 'asymptotic' | 'exact' | 'auto', optional
+        See :py:func:`rank_sum_tests`
+    exact_max : int, optional (default=8)
+        See :py:func:`rank_sum_tests`
+
+    Returns
+    -------
+    p_values : numpy.array
+        (n_features,) array of p-values
+    """
+    n = n1 + n2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(n1 * n2 * (n + 1) / 12.
+                      * (1 - tie_sums / (n ** 3 - n)))
+        z = (np.abs(u - n1 * n2 / 2.) - 0.5) / std
+        p_values = np.minimum(2 * stats.norm.sf(z), 1)
+
+    if method == 'exact':
+        exact = tie_sums == 0
+    elif method == 'auto':
+        exact = (tie_sums == 0) & (n1 <= exact_max) & (n2 <= exact_max)
+    else:
+        exact = np.zeros(len(u), dtype=bool)
+    exact &= (n1 > 0) & (n2 > 0)
+    for size1, size2 in set(zip(n1[exact], n2[exact])):
+        null = _mann_whitney_u_null(int(size1), int(size2))
+        survival = np.cumsum(null[::-1])[::-1]
+        features = exact & (n1 == size1) & (n2 == size2)
+        largest_u = np.maximum(u[features], size1 * size2 - u[features])
+        p_values[features] = np.minimum(
+            2 * survival[np.round(largest_u).astype(int)], 1)
+    return p_values
+
+
+def rank_sum_tests(data, groupby, method='asymptotic', exact_max=8):
+    """Mann-Whitney U or Kruskal-Wallis test of every feature at once
+
+    All features are ranked in one pass, and the per-group rank sums of all
+    features are a single matrix product of the group memberships with the
+    ranks.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        A (n_samples, n_features) matrix. NaNs are ignored
+    groupby : pandas.Series
+        A (n_samples,) Series describing the group membership of the samples
+    method : 'asymptotic' | 'exact' | 'auto', optional
+        How to get Mann-Whitney U p-values. 'asymptotic' uses the
+        tie-corrected normal approximation with continuity correction.
+        'exact' uses the exact distribution of U for features without ties.
+        'auto' uses the exact distribution for features without ties where
+        both groups have at most ``exact_max`` samples. Kruskal-Wallis
+        p-values always use the chi-squared approximation
+    exact_max : int, optional (default=8)
+        Largest group size to use the exact distribution for when method is
+        'auto'
+
+    Returns
+    -------
+    statistics : numpy.array
+        (n_features,) array of the U statistic of the first group (in sorted
+        order), or the tie-corrected Kruskal-Wallis H statistic if there are
+        more than two groups
+    p_values : numpy.array
+        (n_features,) array of the two-sided p-values
+
+    Raises
+    ------
+    ValueError
+        If the number of groups in the groupby is fewer than 2.
+    """
+    groupby = groupby.reindex(data.index)
+    groups = sorted(groupby.dropna().unique())
+    n_groups = len(groups)
+    if n_groups < 2:
+        raise ValueError('Must have at least two groups to calculate '
+                         'differential expression')
+
+    memberships = np.array([(groupby == group).values for group in groups],
+                           dtype=float)
+    values = data.values.astype(float)
+    values[~memberships.any(axis=0)] = np.nan
+
+    ranks, tie_sums = _rank_columns(values)
+    measured = ~np.isnan(ranks)
+    rank_sums = np.dot(memberships, np.where(measured, ranks, 0))
+    sizes = np.dot(memberships, measured)
+    n = sizes.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tie_correction = 1 - tie_sums / (n ** 3 - n)
+        if n_groups == 2:
+            n1, n2 = sizes
+            statistics = rank_sums[0] - n1 * (n1 + 1) / 2.
+            p_values = _mann_whitney_p_values(
+                statistics, n1, n2, tie_sums, method, exact_max)
+        else:
+            h = 12. / (n * (n + 1)) * (rank_sums ** 2 / sizes).sum(axis=0) \
+                - 3 * (n + 1)
+            statistics = h / tie_correction
+            p_values = stats.chi2.sf(statistics, n_groups - 1)
+    return statistics, p_values
+
+
+def _contrast_u_statistics(codes, n_groups, ties, n_samples, contrasts):
+    """Mann-Whitney U statistics of contrasts, from one shared sort
+
+    All per-block and per-feature sums are differences of cumulative sums
+    at segment boundaries, so each contrast takes a few linear passes.
+
+    Parameters
+    ----------
+    codes : numpy.array
+        (n_features * n_samples,) array of the group code of each value, in
+        the sorted order of each feature's values, laid out one feature
+        after another. -1 for values that are NaN or in no group
+    n_groups : int
+        Number of group codes
+    ties : numpy.array
+        Block of tied values of each sorted value, from
+        :py:func:`_tie_blocks`
+    n_samples : int
+        Number of samples of each feature
+    contrasts : list
+        Pairs of lists of group codes to compare
+
+    Returns
+    -------
+    results : list
+        (u, n1, n2, tie_sums) tuple of (n_features,) arrays for each
+        contrast, of the U statistic of the first side, the number of
+        samples on each side and the tie sums of both sides
+    """
+    n_features = len(codes) // n_samples
+    feature_starts = np.arange(n_features + 1) * n_samples
+
+    results = []
+    for codes1, codes2 in contrasts:
+        # The last entry of each lookup table is for code -1
+        sides = np.zeros(n_groups + 1, dtype=int)
+        sides[codes1] = 1
+        sides[codes2] = 2
+        sides = sides[codes]
+        selected = np.flatnonzero(sides)
+        is1 = sides[selected] == 1
+        cumsum1 = np.concatenate([[0], np.cumsum(is1)])
+        cumsum2 = np.arange(len(selected) + 1) - cumsum1
+
+        features = np.searchsorted(selected, feature_starts)
+        n1 = np.diff(cumsum1[features])
+        n2 = np.diff(cumsum2[features])
+
+        # Blocks of ties among the selected values
+        selected_ties = ties[selected]
+        is_first = np.ones(len(selected), dtype=bool)
+        is_first[1:] = selected_ties[1:] != selected_ties[:-1]
+        starts = np.flatnonzero(is_first)
+        edges = np.concatenate([starts, [len(selected)]])
+        blocks1 = np.diff(cumsum1[edges])
+        blocks2 = np.diff(cumsum2[edges])
+
+        # Number of values of the second side below each block, within its
+        # feature
+        block_features = np.searchsorted(starts, features)
+        below2 = cumsum2[starts] - np.repeat(
+            cumsum2[features[:-1]], np.diff(block_features))
+
+        u = np.concatenate([[0], np.cumsum(
+            blocks1 * (below2 + blocks2 / 2.))])
+        tied = blocks1 + blocks2
+        tie_sums = np.concatenate([[0], np.cumsum(tied ** 3. - tied)])
+        results.append((np.diff(u[block_features]), n1, n2,
+                        np.diff(tie_sums[block_features])))
+    return results
+
+
+def differential_expression_contrasts(data, groupby, contrasts='all_pairs',
+                                      method='asymptotic', exact_max=8,
+                                      n_jobs=1):
+    """Mann-Whitney U tests of many contrasts of groups, sharing one sort
+
+    Each feature is sorted and ranked once. Contrasts of all the groups,
+    e.g. one-vs-rest, are tested from the per-group rank sums. Other
+    contrasts are tested from cumulative counts of their groups' samples
+    along the shared sorted values, instead of ranking their samples again.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        A (n_samples, n_features) matrix. NaNs are ignored
+    groupby : pandas.Series
+        A (n_samples,) Series describing the group membership of the samples
+    contrasts : 'all_pairs' | 'one_vs_rest' | list, optional
+        Which groups to compare. 'all_pairs' compares every pair of groups,
+        'one_vs_rest' every group against all other groups. Otherwise, a
+        list of (group1, group2) tuples, where group2 may be
+        ``CONTRAST_REST``
+    method : 'asymptotic' | 'exact' | 'auto', optional
+        How to get p-values, see :py:func:`rank_sum_tests`
+    exact_max : int, optional (default=8)
+        See :py:func:`rank_sum_tests`
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the contrasts across. -1 uses all
+        CPUs.
+
+    Returns
+    -------
+    de_results : pandas.DataFrame
+        A tidy dataframe of the group1, group2, gene_id, U_statistic (of
+        group1), p_value and Benjamini-Hochberg q_value (within each
+        contrast) of every feature of every contrast
+    """
+    groupby = groupby.reindex(data.index)
+    groups = sorted(groupby.dropna().unique())
+    if contrasts == 'all_pairs':
+        contrasts = list(itertools.combinations(groups, 2))
+    elif contrasts == 'one_vs_rest':
+        contrasts = [(group, CONTRAST_REST) for group in groups]
+    else:
+        contrasts = list(contrasts)
+
+    group_codes = dict((group, i) for i, group in enumerate(groups))
+    coded = []
+    for group1, group2 in contrasts:
+        codes1 = [group_codes[group1]]
+        if group2 == CONTRAST_REST:
+            codes2 = [code for group, code in group_codes.items()
+                      if group != group1]
+        else:
+            codes2 = [group_codes[group2]]
+        coded.append((codes1, codes2))
+
+    values = data.values.astype(float)
+    sample_codes = np.array([group_codes.get(group, -1)
+                             for group in groupby.values])
+    values[sample_codes < 0] = np.nan
+    tie_blocks = _tie_blocks(values)
+    order, _, ties, _ = tie_blocks
+
+    # Contrasts of all samples, e.g. one-vs-rest, are tested directly from
+    # the rank sums of each group
+    ranks, all_tie_sums = _rank_columns(values, tie_blocks)
+    memberships = np.array([sample_codes == code
+                            for code in range(len(groups))], dtype=float)
+    measured = ~np.isnan(ranks)
+    rank_sums = np.dot(memberships, np.where(measured, ranks, 0))
+    sizes = np.dot(memberships, measured)
+    covers_all = [len(codes1) + len(codes2) == len(groups)
+                  for codes1, codes2 in coded]
+
+    codes = np.where(measured, sample_codes[:, np.newaxis], -1)
+    codes = codes[order, np.arange(values.shape[1])].T.ravel()
+    subsets = [contrast for contrast, covers in zip(coded, covers_all)
+               if not covers]
+    n_chunks = max(1, min(len(subsets), 4 * (n_jobs if n_jobs > 0 else 1)))
+    chunksize = int(math.ceil(len(subsets) / n_chunks)) if subsets else 1
+    subset_results = Parallel(n_jobs=n_jobs)(
+        delayed(_contrast_u_statistics)(codes, len(groups), ties,
+                                        values.shape[0],
+                                        subsets[i:i + chunksize])
+        for i in range(0, len(subsets), chunksize))
+    subset_results = iter(itertools.chain(*subset_results))
+
+    results = []
+    for (codes1, codes2), covers in zip(coded, covers_all):
+        if covers:
+            n1 = sizes[codes1].sum(axis=0)
+            n2 = sizes[codes2].sum(axis=0)
+            u = rank_sums[codes1].sum(axis=0) - n1 * (n1 + 1) / 2.
+            results.append((u, n1, n2, all_tie_sums))
+        else:
+            results.append(next(subset_results))
+
+    dfs = []
+    for (group1, group2), (u, n1, n2, tie_sums) in zip(contrasts, results):
+        p_values = _mann_whitney_p_values(u, n1, n2, tie_sums, method,
+                                          exact_max)
+        missing = (n1 == 0) | (n2 == 0)
+        u[missing] = np.nan
+        p_values[missing] = np.nan
+        dfs.append(pd.DataFrame({'group1': group1, 'group2': group2,
+                                 'gene_id': data.columns, 'U_statistic': u,
+                                 'p_value': p_values,
+                                 'q_value': benjamini_hochberg_q_values(
+                                     p_values)},
+                                columns=['group1', 'group2', 'gene_id',
+                                         'U_statistic', 'p_value',
+                                         'q_value']))
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=['group1', 'group2', 'gene_id',
+                                     'U_statistic', 'p_value', 'q_value'])
+    return pd.concat(dfs, ignore_index=True)
+
+
+def differential_expression(data, groupby, method='asymptotic'):
     """Calculate probability that a feature's values are skewed towards a group
 
     Uses a Mann-Whitney U test when the number of groups is equal to 2, and
@@ -211,6 +764,8 @@ def differential_expression(data, groupby):
         A (n_samples, n_features) matrix
     groupby : pandas.Series
         A (n_samples,) Series describing the group membership of the samples
+    method : 'asymptotic' | 'exact' | 'auto', optional
+        How to get Mann-Whitney U p-values, see :py:func:`rank_sum_tests`
 
     Returns
     -------
@@ -223,20 +778,10 @@ def differential_expression(data, groupby):
         If the number of groups in the groupby is fewer than 2.
     """
 
-    n_groups = len(groupby.groupby(groupby).size())
-    if n_groups == 2:
-        statistical_test = stats.mannwhitneyu
-    elif n_groups > 2:
-        statistical_test = stats.kruskal
-    else:
-        raise ValueError('Must have at least two groups to calculate '
-                         'differential expression')
-    de_results = dict(
-        (col, pd.Series(statistical_test(
-            *[s for group, s in series.groupby(groupby)]),
-            index=['U_statistic', 'p_value']))
-        for col, series in data.iteritems())
-    de_results = pd.DataFrame.from_records(de_results).T
+    statistics, p_values = rank_sum_tests(data, groupby, method=method)
+    de_results = pd.DataFrame({'U_statistic': statistics,
+                               'p_value': p_values}, index=data.columns,
+                              columns=['U_statistic', 'p_value'])
     de_results['bonferonni_p_value'] = de_results.p_value*de_results.shape[0]
     de_results = de_results.sort('bonferonni_p_value')
     df = de_results.reset_index()
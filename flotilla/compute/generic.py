@@ -9,20 +9,43 @@ import sys
 
 import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed
 from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor
 from scipy import stats
 
+from .expression import _rank_columns
 from ..util import timeout, TimeoutError
 
+CORRELATION_METHODS = {stats.pearsonr: 'pearson', stats.spearmanr: 'spearman'}
+HUBER_T = 1.345
+
+# Number of samples from which the O(n log^2 n) distance covariance
+# algorithm is faster than the full distance matrices
+DCOR_FAST_MIN_SAMPLES = 300
+# Number of pairwise distances to keep in memory at a time
+DCOR_CHUNK_ELEMENTS = 2 ** 22
+
+
+def _grow_forest(clf, n_estimators, x, y):
+    """Add trees to a warm-started forest until it has ``n_estimators``"""
+    return clf.set_params(n_estimators=n_estimators).fit(x, y)
+
 
 def get_regressor(x, y, n_estimators=1500, n_tries=5,
-                  verbose=False):
+                  verbose=False, n_jobs=1, n_stages=5, margin=0.02):
     """Calculate an ExtraTreesRegressor on predictor and target variables
 
+    Each try is a forest with a different random state. All tries grow
+    together in ``n_stages`` stages of trees on a pool of ``n_jobs``
+    threads, which fit the trees on one shared copy of the predictors.
+    After each stage, tries whose out of bag score is more than ``margin``
+    below the best score of the stage are dropped. Growing a forest in
+    stages gives the same trees as growing it at once.
+
     Parameters
     ----------
-    x : numpy.array
-        Predictor vector
+    x : pandas.DataFrame
+        Predictor variables
     y : numpy.array
         Target vector
     n_estimators : int, optional
@@ -31,30 +54,53 @@ def get_regressor(x, y, n_estimators=1500, n_tries=5,
         Number of attempts to calculate regression
     verbose : bool, optional
         If True, output progress statements
+    n_jobs : int, optional (default=1)
+        Number of threads to fit the tries on. -1 uses all CPUs
+    n_stages : int, optional (default=5)
+        Number of stages to grow the forests in, checking their scores
+        after each one
+    margin : float, optional (default=0.02)
+        How far below the best out of bag score of a stage a try can be
+        and still continue. Use numpy.inf to grow all the tries fully
 
     Returns
     -------
     classifier : sklearn.ensemble.ExtraTreesRegressor
         The classifier with the highest out of bag scores of all the
         attempted "tries"
-    oob_scores : numpy.array
-        Out of bag scores of the classifier
+    oob_scores : pandas.DataFrame
+        A (n_tries, n_stages) DataFrame of the out of bag score of each try
+        (indexed by its random state) after each stage (labeled by the
+        number of trees). NaN after a try was dropped
     """
     if verbose:
         sys.stderr.write('Getting regressor\n')
-    clfs = []
-    oob_scores = []
-
-    for i in range(n_tries):
+    # Convert once to the dtype of the trees, so the tries don't each copy
+    # the predictors
+    x_values = np.ascontiguousarray(x, dtype=np.float32)
+    stages = np.unique(np.linspace(0, n_estimators, n_stages + 1)[1:]
+                       .astype(int))
+    stages = stages[stages > 0]
+    clfs = [ExtraTreesRegressor(oob_score=True, bootstrap=True,
+                                max_features='sqrt', warm_start=True,
+                                n_jobs=1, random_state=i)
+            for i in range(n_tries)]
+    oob_scores = pd.DataFrame(np.nan, index=pd.Index(range(n_tries),
+                                                     name='random_state'),
+                              columns=pd.Index(stages, name='n_estimators'))
+
+    tries = np.arange(n_tries)
+    for n in stages:
         if verbose:
-            sys.stderr.write('%d.' % i)
-
-        clf = ExtraTreesRegressor(n_estimators=n_estimators, oob_score=True,
-                                  bootstrap=True, max_features='sqrt',
-                                  n_jobs=1, random_state=i).fit(x, y)
-        clfs.append(clf)
-        oob_scores.append(clf.oob_score_)
-    clf = clfs[np.argmax(oob_scores)]
+            sys.stderr.write('%d tries with %d trees.' % (len(tries), n))
+        Parallel(n_jobs=n_jobs, backend='threading')(
+            delayed(_grow_forest)(clfs[i], n, x_values, y) for i in tries)
+        scores = np.array([clfs[i].oob_score_ for i in tries])
+        oob_scores.loc[tries, n] = scores
+        tries = tries[scores >= scores.max() - margin]
+
+    clf = clfs[oob_scores[stages[-1]].idxmax()]
+    clf.set_params(warm_start=False)
     clf.feature_importances = pd.Series(clf.feature_importances_,
                                         index=x.columns)
 
@@ -116,7 +162,6 @@ def get_unstarted_events(mongodb):
             yield event
 
 
-@timeout(5)  # because these sometimes hang
 def get_slope(x, y):
     """Get the linear regression slope of x and y
 
@@ -130,13 +175,26 @@ def get_slope(x, y):
     Returns
     -------
     slope : float
-        Scipy.stats.linregress slope
+        Slope of the least squares line of y on x, as scipy.stats.linregress
+        reports it. Samples missing in either are ignored
 
+    See Also
+    --------
+    linear_regression
+        This is the underlying function which calculates the slope
     """
-    return stats.linregress(x, y)[0]
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    slope = linear_regression(pd.DataFrame(x[:, np.newaxis]), pd.Series(y))[0]
+    return slope.iloc[0]
+
 
+def _event_gene(s_1, s_2, *args, **kwargs):
+    """(event, gene) pair of a call of do_r, to report if it times out"""
+    return getattr(s_2, 'name', None), getattr(s_1, 'name', None)
 
-@timeout(5)  # because these sometimes hang
+
+@timeout(5, key=_event_gene)  # because these sometimes hang
 def do_r(s_1, s_2, method=stats.pearsonr, min_items=12):
     """Calculate correlation ("R-value") between two vectors
 
@@ -198,12 +256,11 @@ def get_robust_values(x, y):
     return results
 
 
-@timeout(5)
 def get_dcor(x, y):
     """Calculate distance correlation between two vectors
 
-    Uses the distance correlation package from:
-    https://github.com/andrewdyates/dcor
+    Calculates the same statistics as the distance correlation package
+    from https://github.com/andrewdyates/dcor
 
     Parameters
     ----------
@@ -223,22 +280,275 @@ def get_dcor(x, y):
         Distance variance on x
     dvy : float
         Distance variance on y
+
+    See Also
+    --------
+    distance_correlation
+        The same statistics of many features at once
     """
-    # cython version of dcor
-    try:
-        import dcor_cpy as dcor
-    except ImportError as e:
-        sys.stderr.write("Please install dcor_cpy.")
-        raise e
-
-    dc, dr, dvx, dvy = dcor.dcov_all(x, y)
+    results = distance_correlation(pd.DataFrame(np.asarray(x, dtype=float)),
+                                   pd.Series(np.asarray(y, dtype=float)))
+    dc, dr, dvx, dvy = results.iloc[0]
     return dc, dr, dvx, dvy
 
 
-@timeout(100)
-def apply_calc_rs(X, y, method=stats.pearsonr):
+def _masked_moments(X, Y):
+    """Means, variances and covariances of all pairs of columns of X and Y
+
+    Each pair of columns uses only the rows measured in both, via sums of
+    the centered values masked by the other's measured rows.
+
+    Parameters
+    ----------
+    X : numpy.array
+        A (n_samples, n_features1) array
+    Y : numpy.array
+        A (n_samples, n_features2) array
+
+    Returns
+    -------
+    n : numpy.array
+        A (n_features1, n_features2) array of the number of samples measured
+        in both columns
+    mean_x, mean_y, variance_x, variance_y, covariance : numpy.array
+        (n_features1, n_features2) arrays of the moments of each pair. The
+        (co)variances are sums of squares, not divided by the counts
+    """
+    measured_x = ~np.isnan(X)
+    measured_y = ~np.isnan(Y)
+    # Centering on each column's mean avoids cancellation in the moments
+    X = np.where(measured_x, X, 0)
+    Y = np.where(measured_y, Y, 0)
+    center_x = X.sum(axis=0) / np.maximum(measured_x.sum(axis=0), 1)
+    center_y = Y.sum(axis=0) / np.maximum(measured_y.sum(axis=0), 1)
+    X -= center_x
+    Y -= center_y
+    X[~measured_x] = 0
+    Y[~measured_y] = 0
+    measured_x = measured_x.astype(float)
+    measured_y = measured_y.astype(float)
+
+    n = np.dot(measured_x.T, measured_y)
+    sum_x = np.dot(X.T, measured_y)
+    sum_y = np.dot(measured_x.T, Y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = np.dot(X.T, Y) - sum_x * sum_y / n
+        variance_x = np.dot((X ** 2).T, measured_y) - sum_x ** 2 / n
+        variance_y = np.dot(measured_x.T, Y ** 2) - sum_y ** 2 / n
+        mean_x = sum_x / n + center_x[:, np.newaxis]
+        mean_y = sum_y / n + center_y[np.newaxis, :]
+    return n, mean_x, mean_y, variance_x, variance_y, covariance
+
+
+def _masked_pearson(X, Y):
+    """Pearson correlations of all columns of X and Y, ignoring NaNs
+
+    Parameters
+    ----------
+    X : numpy.array
+        A (n_samples, n_features1) array
+    Y : numpy.array
+        A (n_samples, n_features2) array
+
+    Returns
+    -------
+    r : numpy.array
+        A (n_features1, n_features2) array of correlation coefficients
+    n : numpy.array
+        A (n_features1, n_features2) array of the number of samples measured
+        in both columns
+    """
+    n, _, _, variance_x, variance_y, covariance = _masked_moments(X, Y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = covariance / np.sqrt(variance_x * variance_y)
+    return np.clip(r, -1, 1), n
+
+
+def _paired_pearson(A, B):
+    """Pearson correlation of each column of A with the same column of B
+
+    Both A and B must be NaN in the same places, which are ignored.
+    """
+    measured = ~np.isnan(A)
+    n = measured.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        A = A - np.nansum(A, axis=0) / n
+        B = B - np.nansum(B, axis=0) / n
+        r = np.nansum(A * B, axis=0) / np.sqrt(
+            np.nansum(A ** 2, axis=0) * np.nansum(B ** 2, axis=0))
+    return np.clip(r, -1, 1), n
+
+
+def _masked_spearman(X, y):
+    """Spearman correlations of all columns of X with y, ignoring NaNs
+
+    Both are re-ranked within the samples measured in each pair: the rank
+    of each y value among the samples measured in each column of X is one
+    matrix product of the pairwise comparisons of y with the measured
+    samples of X.
+
+    Returns
+    -------
+    r : numpy.array
+        A (n_features,) array of correlation coefficients
+    n : numpy.array
+        A (n_features,) array of the number of samples measured in both
+    """
+    rows = ~np.isnan(y)
+    X = X[rows]
+    y = y[rows]
+    x_ranks, _ = _rank_columns(X)
+    measured = ~np.isnan(X)
+
+    if measured.all():
+        y_ranks, _ = _rank_columns(y[:, np.newaxis])
+        y_ranks = np.repeat(y_ranks, X.shape[1], axis=1)
+    else:
+        comparisons = (y[:, np.newaxis] > y[np.newaxis, :]) \
+            + 0.5 * (y[:, np.newaxis] == y[np.newaxis, :])
+        comparisons[np.diag_indices_from(comparisons)] = 0
+        y_ranks = 1 + np.dot(comparisons, measured)
+        y_ranks[~measured] = np.nan
+    return _paired_pearson(x_ranks, y_ranks)
+
+
+def correlation_p_values(r, n):
+    """Two-sided p-values of correlation coefficients
+
+    Uses the t-distribution with ``n - 2`` degrees of freedom, as
+    scipy.stats.pearsonr and scipy.stats.spearmanr do.
+
+    Parameters
+    ----------
+    r : numpy.array
+        Correlation coefficients
+    n : numpy.array
+        Number of samples of each correlation
+
+    Returns
+    -------
+    p_values : numpy.array
+        p-values of the correlations, the same shape as r
+    """
+    r = np.asarray(r, dtype=float)
+    n = np.asarray(n, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.abs(r) * np.sqrt((n - 2) / (1 - r ** 2))
+        p_values = 2 * stats.t.sf(t, n - 2)
+    p_values = np.where(np.abs(r) == 1, 0, p_values)
+    return np.where(np.isnan(r), np.nan, p_values)
+
+
+def correlations(X, Y, method='pearson', min_items=12):
+    """Correlations of every column of X with every column of Y
+
+    Every pair of columns is correlated over the samples measured in both.
+    Pearson correlations of all pairs are computed at once from masked
+    sums of centered values; Spearman correlations from ranks within the
+    measured samples, one column of Y at a time.
+
+    Parameters
+    ----------
+    X : pandas.DataFrame
+        A (n_samples, n_features1) DataFrame
+    Y : pandas.DataFrame or pandas.Series
+        A (n_samples, n_features2) DataFrame, or a single (n_samples,)
+        Series. Aligned to the rows of X by index
+    method : 'pearson' | 'spearman', optional
+        Which correlation to calculate. scipy.stats.pearsonr and
+        scipy.stats.spearmanr are also accepted
+    min_items : int, optional (default=12)
+        Pairs of columns measured in this many samples or fewer are NaN
+
+    Returns
+    -------
+    r_coefficients : pandas.DataFrame or pandas.Series
+        A (n_features1, n_features2) DataFrame of correlation coefficients,
+        or a (n_features1,) Series if Y is a Series
+    p_values : pandas.DataFrame or pandas.Series
+        Correlation significances, the same shape as r_coefficients
+    """
+    method = CORRELATION_METHODS.get(method, method)
+    if method not in ('pearson', 'spearman'):
+        raise ValueError('"{}" is not a valid correlation method, must be '
+                         '"pearson" or "spearman"'.format(method))
+    is_series = isinstance(Y, pd.Series)
+    if is_series:
+        name = Y.name
+        Y = Y.to_frame()
+    X, Y = X.align(Y, join='inner', axis=0)
+    x = X.values.astype(float)
+    y = Y.values.astype(float)
+
+    if method == 'pearson':
+        r, n = _masked_pearson(x, y)
+    else:
+        r, n = zip(*[_masked_spearman(x, y[:, i])
+                     for i in range(y.shape[1])])
+        r = np.array(r).T.reshape(x.shape[1], y.shape[1])
+        n = np.array(n).T.reshape(x.shape[1], y.shape[1])
+    r[n <= min_items] = np.nan
+    p = correlation_p_values(r, n)
+
+    if is_series:
+        return (pd.Series(r[:, 0], index=X.columns, name=name),
+                pd.Series(p[:, 0], index=X.columns, name=name))
+    return (pd.DataFrame(r, index=X.columns, columns=Y.columns),
+            pd.DataFrame(p, index=X.columns, columns=Y.columns))
+
+
+def linear_regression(X, Y):
+    """Least squares lines of every column of Y on every column of X
+
+    All lines are calculated at once from the masked moments of each pair
+    of columns, over the samples measured in both.
+
+    Parameters
+    ----------
+    X : pandas.DataFrame
+        A (n_samples, n_features1) DataFrame of predictor variable values
+    Y : pandas.DataFrame or pandas.Series
+        A (n_samples, n_features2) DataFrame, or a single (n_samples,)
+        Series, of response variable values. Aligned to the rows of X by
+        index
+
+    Returns
+    -------
+    slope, intercept, r_value, p_value, stderr : pandas.DataFrame
+        (n_features1, n_features2) DataFrames of the slope, intercept,
+        correlation coefficient, two-sided p-value of the slope and standard
+        error of the slope, as scipy.stats.linregress reports them. Series
+        if Y is a Series
+    """
+    is_series = isinstance(Y, pd.Series)
+    if is_series:
+        name = Y.name
+        Y = Y.to_frame()
+    X, Y = X.align(Y, join='inner', axis=0)
+
+    n, mean_x, mean_y, variance_x, variance_y, covariance = _masked_moments(
+        X.values.astype(float), Y.values.astype(float))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = covariance / variance_x
+        intercept = mean_y - slope * mean_x
+        r = np.clip(covariance / np.sqrt(variance_x * variance_y), -1, 1)
+        stderr = np.sqrt((1 - r ** 2) * variance_y / variance_x / (n - 2))
+    p = correlation_p_values(r, n)
+
+    if is_series:
+        return tuple(pd.Series(values[:, 0], index=X.columns, name=name)
+                     for values in (slope, intercept, r, p, stderr))
+    return tuple(pd.DataFrame(values, index=X.columns, columns=Y.columns)
+                 for values in (slope, intercept, r, p, stderr))
+
+
+def apply_calc_rs(X, y, method=stats.pearsonr, min_items=12):
     """Apply R calculation method on each column of X versus the values of y
 
+    Pearson and Spearman correlations are calculated for all columns at
+    once by :py:func:`correlations`. Any other method is called on each
+    column.
+
     Parameters
     ----------
     X : pandas.DataFrame
@@ -250,6 +560,8 @@ def apply_calc_rs(X, y, method=stats.pearsonr):
     method : function, optional
         Which correlation method to use on each feature in X versus the
         values in y
+    min_items : int, optional
+        Minimum number of items occuring in both x and y (default 12)
 
     Returns
     -------
@@ -260,15 +572,25 @@ def apply_calc_rs(X, y, method=stats.pearsonr):
 
     See Also
     --------
+    correlations
+        This calculates Pearson and Spearman correlations
     do_r
-        This is the underlying function which calculates correlation
+        This is the underlying function which calculates other correlations
+
+    Notes
+    -----
+    Features whose correlation with another method times out are NaN, and
+    their (event, gene) pairs are kept in ``flotilla.util.timeout_stats``.
     """
+    if CORRELATION_METHODS.get(method, method) in ('pearson', 'spearman'):
+        return correlations(X, y, method=method, min_items=min_items)
+
     out_R = pd.Series(index=X.columns, name=y.name)
     out_P = pd.Series(index=X.columns, name=y.name)
     for this_id, data in X.iteritems():
         x = pd.Series(data, name=this_id)
         try:
-            r, p = do_r(x, y, method=method)
+            r, p = do_r(x, y, method=method, min_items=min_items)
 
         except TimeoutError:
             sys.stderr.write(
@@ -279,7 +601,149 @@ def apply_calc_rs(X, y, method=stats.pearsonr):
     return out_R, out_P
 
 
-@timeout(220)
+def _huber_weights(z, t=HUBER_T):
+    """Weights of the Huber norm: 1 within t, t / |z| outside"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(np.abs(z) <= t, 1., t / np.abs(z))
+
+
+def _huber_rho(z, t=HUBER_T):
+    """Huber's objective function"""
+    return np.where(np.abs(z) <= t, z ** 2 / 2., t * np.abs(z) - t ** 2 / 2.)
+
+
+def _huber_deviance(resid, weights, measured):
+    """Convergence criterion of statsmodels' RLM after a weighted fit
+
+    As in ``RLM.deviance``, the residuals are scaled by the residual
+    variance of the weighted least squares fit, not by the robust scale.
+    """
+    variance = (weights * resid ** 2).sum(axis=0) / (measured.sum(axis=0) - 2)
+    return (_huber_rho(resid / variance) * measured).sum(axis=0)
+
+
+def _mad_scale(resid, measured):
+    """Median absolute deviation from 0 of each column, as a normal scale"""
+    # Sort the missing values last, and take the middle of the measured ones
+    resid = np.sort(np.where(measured, np.abs(resid), np.inf), axis=0)
+    n_measured = measured.sum(axis=0)
+    columns = np.arange(resid.shape[1])
+    lower = resid[np.maximum((n_measured - 1) // 2, 0), columns]
+    upper = resid[n_measured // 2, columns]
+    with np.errstate(invalid='ignore'):
+        median = np.where(n_measured > 0, (lower + upper) / 2., np.nan)
+    return median / stats.norm.ppf(0.75)
+
+
+def _weighted_line(x, y, weights):
+    """Weighted least squares intercepts and slopes of each column"""
+    sum_w = weights.sum(axis=0)
+    mean_x = (weights * x).sum(axis=0) / sum_w
+    mean_y = (weights * y).sum(axis=0) / sum_w
+    dx = x - mean_x
+    slope = (weights * dx * (y - mean_y)).sum(axis=0) \
+        / (weights * dx ** 2).sum(axis=0)
+    return mean_y - slope * mean_x, slope
+
+
+def robust_linear_regression(X, y, maxiter=50, tol=1e-8):
+    """Huber robust linear regression of y on every column of X at once
+
+    Fits the same model as ``statsmodels.api.RLM(y, add_constant(x),
+    missing='drop').fit()`` for each column x of X: iteratively
+    reweighted least squares with Huber's T norm and a MAD scale, with
+    H1 covariances. Each iteration updates all features that have not
+    yet converged as array operations.
+
+    Parameters
+    ----------
+    X : pandas.DataFrame
+        A (n_samples, n_features) Dataframe of the predictor variable
+    y : pandas.Series
+        A (n_samples,) Series of the response variable
+    maxiter : int, optional (default=50)
+        Maximum number of iterations
+    tol : float, optional (default=1e-8)
+        A feature has converged when its Huber deviance changes by no more
+        than this between iterations
+
+    Returns
+    -------
+    results : pandas.DataFrame
+        A (n_features, 6) DataFrame of the intercept, slope, their
+        t-statistics (intercept_t, slope_t) and their normal-approximation
+        p-values (intercept_p, slope_p). Features with fewer than 3 samples
+        measured in both X and y are NaN
+    """
+    X, y = X.align(y, join='inner', axis=0)
+    x = X.values.astype(float)
+    y = np.repeat(y.values.astype(float)[:, np.newaxis], x.shape[1], axis=1)
+    measured = ~np.isnan(x) & ~np.isnan(y)
+    x = np.where(measured, x, 0)
+    y = np.where(measured, y, 0)
+    n = measured.sum(axis=0).astype(float)
+    n_features = x.shape[1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weights = measured.astype(float)
+        intercept, slope = _weighted_line(x, y, weights)
+        resid = y - intercept - slope * x
+
+        active = np.flatnonzero(n >= 3)
+        measured_active = measured[:, active]
+        scale = np.nan * np.ones(n_features)
+        scale[active] = _mad_scale(resid[:, active], measured_active)
+        deviance = np.inf * np.ones(n_features)
+        deviance[active] = _huber_deviance(
+            resid[:, active], weights[:, active], measured_active)
+
+        for iteration in range(1, maxiter):
+            active = active[scale[active] > 0]
+            if len(active) == 0:
+                break
+            measured_active = measured[:, active]
+            weights = _huber_weights(resid[:, active] / scale[active]) \
+                * measured_active
+            intercept[active], slope[active] = _weighted_line(
+                x[:, active], y[:, active], weights)
+            resid[:, active] = y[:, active] - intercept[active] \
+                - slope[active] * x[:, active]
+            scale[active] = _mad_scale(resid[:, active], measured_active)
+
+            new_deviance = _huber_deviance(resid[:, active], weights,
+                                           measured_active)
+            converged = np.abs(new_deviance - deviance[active]) <= tol
+            deviance[active] = new_deviance
+            active = active[~converged]
+
+        # Huber's H1 covariance of the parameters
+        sresid = resid / scale
+        psi_deriv = (np.abs(sresid) <= HUBER_T) & measured
+        psi = np.clip(sresid, -HUBER_T, HUBER_T) * measured
+        m = psi_deriv.sum(axis=0) / n
+        var_psi_deriv = m - m ** 2
+        k = 1 + 2. / n * var_psi_deriv / m ** 2
+        variance = k ** 2 * (psi ** 2).sum(axis=0) / (n - 2) * scale ** 2 \
+            / m ** 2
+
+        sum_x = x.sum(axis=0)
+        sum_xx = (x ** 2).sum(axis=0)
+        determinant = n * sum_xx - sum_x ** 2
+        intercept_t = intercept / np.sqrt(variance * sum_xx / determinant)
+        slope_t = slope / np.sqrt(variance * n / determinant)
+
+    invalid = n < 3
+    results = pd.DataFrame(
+        {'intercept': intercept, 'slope': slope,
+         'intercept_t': intercept_t, 'slope_t': slope_t,
+         'intercept_p': 2 * stats.norm.sf(np.abs(intercept_t)),
+         'slope_p': 2 * stats.norm.sf(np.abs(slope_t))},
+        index=X.columns, columns=['intercept', 'slope', 'intercept_t',
+                                  'slope_t', 'intercept_p', 'slope_p'])
+    results[invalid] = np.nan
+    return results
+
+
 def apply_calc_robust(X, y, verbose=False):
     """Calculate robust regression between the columns of X and y
 
@@ -287,8 +751,8 @@ def apply_calc_robust(X, y, verbose=False):
     ----------
     X : pandas.DataFrame
         A (n_samples, n_features) Dataframe of the predictor variable
-    y : pandas.DataFrame
-        A (n_samples, m_features) DataFrame of the response variable
+    y : pandas.Series
+        A (n_samples,) Series of the response variable
     verbose : bool, optional
         If True, output status messages as the calculation is happening
 
@@ -305,43 +769,28 @@ def apply_calc_robust(X, y, verbose=False):
 
     See Also
     --------
+    robust_linear_regression
+        This is the underlying function which fits all the features at once
     get_robust_values
-        This is the underlying function which calculates the slope,
-        intercept, t-value, and p-value of the fit
+        The same fit of a single feature
     """
     if verbose:
         sys.stderr.write("getting robust regression\n")
-    out_I = pd.Series(index=X.columns, name=y.name)  # intercept
-    out_S = pd.Series(index=X.columns, name=y.name)  # slope
-    out_T = pd.Series(index=X.columns, name=y.name)  # t-value
-    out_P = pd.Series(index=X.columns, name=y.name)  # p-value
-
-    for this_id, data in X.iteritems():
-        x = pd.Series(data, name=this_id)
-        try:
-            i, s, t, p = get_robust_values(x, y)
-        except TimeoutError:
-            sys.stderr.write(
-                "robust timeout event:%s, gene:%s\n" % (y.name, x.name))
-            i, s, t, p = np.nan, np.nan, np.nan, np.nan
-        out_I.ix[this_id] = i
-        out_S.ix[this_id] = s
-        out_T.ix[this_id] = t
-        out_P.ix[this_id] = p
-    return out_I, out_S, out_T, out_P
+    results = robust_linear_regression(X, y)
+    # Same parameters as reported by get_robust_values
+    return tuple(results[column].rename(y.name) for column in
+                 ('intercept', 'slope', 'intercept_t', 'intercept_p'))
 
 
-@timeout(50)
 def apply_calc_slope(X, y, verbose=False):
-    """X and y are dataframes, returns slope, t-value and p-value of robust
-    regression
+    """Slopes of the linear regressions of y on each column of X
 
     Parameters
     ----------
     X : pandas.DataFrame
         A (n_samples, n_features) Dataframe of predictor variable values
-    y : pandas.DataFrame
-        A (n_samples, m_features) Dataframe of response variable values
+    y : pandas.Series
+        A (n_samples,) Series of response variable values
     verbose : bool, optional
         If True, output status messages
 
@@ -352,39 +801,333 @@ def apply_calc_slope(X, y, verbose=False):
 
     See Also
     --------
-    get_slope
-        This is the underlying function which calculates the slope
+    linear_regression
+        This is the underlying function which calculates the slopes of all
+        the features at once
     """
     if verbose:
         sys.stderr.write("getting slope\n")
+    return linear_regression(X, y)[0]
 
-    out_S = pd.Series(index=X.columns, name=y.name)
 
-    for this_id, data in X.iteritems():
-        x = pd.Series(data, name=this_id)
-        try:
-            s = get_slope(x, y)
-        except TimeoutError:
-            sys.stderr.write(
-                "linregress timeout event:%s, gene:%s\n" % (y.name, x.name))
-            s = np.nan
-        out_S.ix[this_id] = s
+def _double_centered_distances(y):
+    """Double-centered (n_samples, n_samples) distance matrix of a vector"""
+    distances = np.abs(y[:, np.newaxis] - y[np.newaxis, :])
+    means = distances.mean(axis=0)
+    return distances - means[:, np.newaxis] - means[np.newaxis, :] \
+        + means.mean()
+
+
+def _distance_sums_naive(X, B):
+    """Sums of products of double-centered distances, from the full matrices
+
+    As B is double-centered, the sum of its products with the
+    double-centered distances of a column of X equals the sum of its
+    products with the plain distances, so only B needs centering.
+
+    Parameters
+    ----------
+    X : numpy.array
+        A (n_samples, n_features) array without missing values
+    B : numpy.array
+        The (n_samples, n_samples) double-centered distance matrix of y
+
+    Returns
+    -------
+    cross : numpy.array
+        Sum of A * B over all pairs of samples, for each column of X
+    square : numpy.array
+        Sum of A * A over all pairs of samples, for each column of X
+    """
+    n = X.shape[0]
+    distances = np.abs(X[:, np.newaxis, :] - X[np.newaxis, :, :])
+    cross = np.einsum('klc,kl->c', distances, B)
+    row_sums = distances.sum(axis=1)
+    total = row_sums.sum(axis=0)
+    centered = X - X.mean(axis=0)
+    square = 2 * n * (centered ** 2).sum(axis=0) \
+        - 2 * (row_sums ** 2).sum(axis=0) / n + total ** 2 / n ** 2
+    return cross, square
+
+
+def _distance_row_sums(X):
+    """Sums of the distances of every sample to all others, for each column
+
+    Calculated from the cumulative sums of the sorted values, in
+    O(n log n) time.
+
+    Parameters
+    ----------
+    X : numpy.array
+        A (n_samples, n_features) array without missing values
+
+    Returns
+    -------
+    row_sums : numpy.array
+        A (n_samples, n_features) array
+    """
+    n, n_features = X.shape
+    columns = np.arange(n_features)
+    order = np.argsort(X, axis=0, kind='mergesort')
+    x = X[order, columns]
+    smaller = np.cumsum(x, axis=0) - x
+    larger = x.sum(axis=0) - smaller - x
+    n_smaller = np.arange(n)[:, np.newaxis]
+    row_sums = np.empty_like(x)
+    row_sums[order, columns] = (n_smaller * x - smaller) \
+        + (larger - (n - 1 - n_smaller) * x)
+    return row_sums
+
+
+def _distance_cross_sums(X, y):
+    """Sums of |x_k - x_l| * |y_k - y_l| over all pairs, for each column of X
+
+    Every pair of samples is counted in exactly one merge step of a merge
+    sort on x: when merging two sorted halves, each sample k of the upper
+    half is paired with the samples l of the lower half, which all have
+    x_l <= x_k. Sorting each merged block by y, cumulative sums of 1, x_l,
+    y_l and x_l * y_l over the lower half give the sums of
+    (x_k - x_l) * |y_k - y_l| for the samples with y_l below and above y_k.
+    Each of the log2(n) merge levels is array operations over all columns
+    at once, so the whole sum is O(n log^2 n) per column instead of the
+    O(n^2) of the distance matrices.
+
+    Parameters
+    ----------
+    X : numpy.array
+        A (n_samples, n_features) array without missing values
+    y : numpy.array
+        A (n_samples,) array without missing values
+
+    Returns
+    -------
+    cross : numpy.array
+        A (n_features,) array
+    """
+    n, n_features = X.shape
+    columns = np.repeat(np.arange(n_features), n)
+    x_ranks = np.empty(X.shape, dtype=int)
+    x_ranks[np.argsort(X, axis=0, kind='mergesort'),
+            np.arange(n_features)] = np.arange(n)[:, np.newaxis]
+    x_ranks = x_ranks.T.ravel()
+    y_ranks = np.empty(n, dtype=int)
+    y_ranks[np.argsort(y, kind='mergesort')] = np.arange(n)
+    y_ranks = np.tile(y_ranks, n_features)
+    x = X.T.ravel()
+    y = np.tile(y, n_features)
+    values = np.vstack([np.ones_like(x), x, y, x * y])
+
+    cross = np.zeros(n_features)
+    width = 1
+    while width < n:
+        blocks = columns * n + x_ranks // (2 * width)
+        upper = (x_ranks // width) % 2 == 1
+        order = np.lexsort((y_ranks, blocks))
+        blocks = blocks[order]
+        upper = upper[order]
+        lower_values = values[:, order] * ~upper
+        cumulative = np.cumsum(lower_values, axis=1)
+        starts = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1]])
+        ends = np.r_[starts[1:], len(blocks)] - 1
+        block_index = np.repeat(np.arange(len(starts)), np.diff(
+            np.r_[starts, len(blocks)]))
+        offsets = cumulative[:, starts] - lower_values[:, starts]
+        below = (cumulative - lower_values - offsets[:, block_index])[:, upper]
+        above = (cumulative[:, ends] - offsets)[:, block_index[upper]] - below
+
+        xk = x[order][upper]
+        yk = y[order][upper]
+        products = (xk * yk * below[0] - xk * below[2] - yk * below[1]
+                    + below[3]) \
+            - (xk * yk * above[0] - xk * above[2] - yk * above[1] + above[3])
+        cross += np.bincount(columns[order][upper], products,
+                             minlength=n_features)
+        width *= 2
+    return 2 * cross
+
+
+def _distance_sums_fast(X, y):
+    """Sums of products of double-centered distances, in O(n log^2 n)
+
+    Expands the double centering into the sums of products of the plain
+    distances, their row sums and their totals, so no distance matrix is
+    ever built.
 
-    return out_S
+    Parameters
+    ----------
+    X : numpy.array
+        A (n_samples, n_features) array without missing values
+    y : numpy.array
+        A (n_samples,) array without missing values
 
+    Returns
+    -------
+    cross : numpy.array
+        Sum of A * B over all pairs of samples, for each column of X
+    square : numpy.array
+        Sum of A * A over all pairs of samples, for each column of X
+    """
+    n = X.shape[0]
+    # Centering keeps the cumulative sums of the products small
+    X = X - X.mean(axis=0)
+    y = y - y.mean()
+    a = _distance_row_sums(X)
+    b = _distance_row_sums(y[:, np.newaxis])
+    a_total = a.sum(axis=0)
+    cross = _distance_cross_sums(X, y) - 2 * (a * b).sum(axis=0) / n \
+        + a_total * b.sum() / n ** 2
+    square = 2 * n * (X ** 2).sum(axis=0) - 2 * (a ** 2).sum(axis=0) / n \
+        + a_total ** 2 / n ** 2
+    return cross, square
+
+
+def _distance_covariance_chunk(X, y, B=None, fast=False):
+    """Distance covariance sums of a chunk of columns of X with y
 
-@timeout(50)
-def apply_dcor(X, y, verbose=False):
-    """Calcualte distance correlation between the columns of two dataframes
+    Parameters
+    ----------
+    X : numpy.array
+        A (n_samples, n_features_in_chunk) array without missing values
+    y : numpy.array
+        A (n_samples,) array without missing values
+    B : numpy.array, optional
+        The double-centered distance matrix of y, if already calculated.
+        Not used by the fast algorithm
+    fast : bool, optional
+        If True, use the O(n log^2 n) algorithm instead of the distance
+        matrices
+
+    Returns
+    -------
+    n : int
+        Number of samples
+    cross, square_x : numpy.array
+        Sums of A * B and A * A for each column
+    square_y : float
+        Sum of B * B
+    """
+    n = X.shape[0]
+    if fast:
+        cross, square_x = _distance_sums_fast(X, y)
+        square_y = _distance_sums_fast(y[:, np.newaxis], y)[1][0]
+    else:
+        if B is None:
+            B = _double_centered_distances(y)
+        cross, square_x = _distance_sums_naive(X, B)
+        square_y = (B ** 2).sum()
+    return n, cross, square_x, square_y
+
+
+def distance_correlation(X, y, method='auto', chunksize=None, n_jobs=1):
+    """Distance covariance and correlation of every column of X with y
+
+    Calculates the same V-statistics as ``dcov_all`` of
+    https://github.com/andrewdyates/dcor, for all features at once. With
+    the full distance matrices, the double-centered distance matrix of y is
+    calculated once and shared by every column of X that is measured in
+    all the samples of y. The fast algorithm never builds the distance
+    matrices and takes O(n log^2 n) instead of O(n^2) time and memory per
+    feature, for large numbers of samples.
 
     Parameters
     ----------
     X : pandas.DataFrame
         A (n_samples, n_features) Dataframe of predictor variable values
-    y : pandas.DataFrame
-        A (n_samples, m_features) Dataframe of response variable values
+    y : pandas.Series
+        A (n_samples,) Series of response variable values. Aligned to the
+        rows of X by index
+    method : 'auto' | 'naive' | 'fast', optional (default='auto')
+        Whether to use the full distance matrices ('naive') or the fast
+        algorithm ('fast'). 'auto' uses the fast algorithm for at least
+        ``DCOR_FAST_MIN_SAMPLES`` samples
+    chunksize : int, optional (default=None)
+        Number of features to calculate at a time. By default, as many as
+        fit in ``DCOR_CHUNK_ELEMENTS`` pairwise distances
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the chunks across. -1 uses all CPUs
+
+    Returns
+    -------
+    results : pandas.DataFrame
+        A (n_features, 4) DataFrame of the distance covariance (dc),
+        distance correlation (dr), and distance variances of x (dvx) and y
+        (dvy). Each feature uses the samples measured in both it and y, and
+        is NaN with fewer than 2 of them
+
+    Notes
+    -----
+    Features with missing values don't share the distance matrix of y, and
+    are calculated one at a time.
+    """
+    if method not in ('auto', 'naive', 'fast'):
+        raise ValueError('method must be "auto", "naive" or "fast", not '
+                         '"{}"'.format(method))
+    X, y = X.align(y, join='inner', axis=0)
+    y = y.values.astype(float)
+    measured = ~np.isnan(y)
+    x = X.values.astype(float)[measured]
+    y = y[measured]
+    n_samples, n_features = x.shape
+
+    fast = method == 'fast' or (method == 'auto' and
+                                n_samples >= DCOR_FAST_MIN_SAMPLES)
+    if chunksize is None:
+        pairs = n_samples if fast else n_samples ** 2
+        chunksize = max(DCOR_CHUNK_ELEMENTS // max(pairs, 1), 1)
+
+    complete = np.flatnonzero(~np.isnan(x).any(axis=0))
+    incomplete = np.flatnonzero(np.isnan(x).any(axis=0))
+    B = None if fast or len(complete) == 0 \
+        else _double_centered_distances(y)
+
+    features = []
+    tasks = []
+    for start in range(0, len(complete), chunksize):
+        chunk = complete[start:start + chunksize]
+        features.append(chunk)
+        tasks.append(delayed(_distance_covariance_chunk)(x[:, chunk], y, B,
+                                                         fast))
+    for i in incomplete:
+        rows = ~np.isnan(x[:, i])
+        features.append([i])
+        tasks.append(delayed(_distance_covariance_chunk)(
+            x[rows][:, [i]], y[rows], None, fast))
+
+    n = np.zeros(n_features)
+    cross = np.zeros(n_features)
+    square_x = np.zeros(n_features)
+    square_y = np.zeros(n_features)
+    for chunk, result in zip(features, Parallel(n_jobs=n_jobs)(tasks)):
+        n[chunk], cross[chunk], square_x[chunk], square_y[chunk] = result
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Rounding can make the sums slightly negative when they are ~0
+        dc = np.sqrt(np.maximum(cross, 0)) / n
+        dvx = np.sqrt(np.maximum(square_x, 0)) / n
+        dvy = np.sqrt(np.maximum(square_y, 0)) / n
+        denominator = np.sqrt(dvx * dvy)
+        dr = np.where(denominator > 0, dc / denominator, 0)
+    results = pd.DataFrame({'dc': dc, 'dr': dr, 'dvx': dvx, 'dvy': dvy},
+                           index=X.columns, columns=['dc', 'dr', 'dvx', 'dvy'])
+    results[n < 2] = np.nan
+    return results
+
+
+def apply_dcor(X, y, verbose=False, method='auto', n_jobs=1):
+    """Calcualte distance correlation between the columns of X and y
+
+    Parameters
+    ----------
+    X : pandas.DataFrame
+        A (n_samples, n_features) Dataframe of predictor variable values
+    y : pandas.Series
+        A (n_samples,) Series of response variable values
     verbose : bool, optional
         If True, output status messages
+    method : 'auto' | 'naive' | 'fast', optional (default='auto')
+        Algorithm to calculate the distance covariances with
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the features across
 
     Returns
     -------
@@ -399,32 +1142,15 @@ def apply_dcor(X, y, verbose=False):
 
     See Also
     --------
-    get_dcor
-        This is the underlying function that gets called to calculate the
-        distance correlation
+    distance_correlation
+        This is the underlying function which calculates the distance
+        correlations of all the features at once
     """
     if verbose:
         sys.stderr.write("getting dcor\n")
-
-    out_DC = pd.Series(index=X.columns, name=y.name)
-    out_DR = pd.Series(index=X.columns, name=y.name)
-    out_DVX = pd.Series(index=X.columns, name=y.name)
-    out_DVY = pd.Series(index=X.columns, name=y.name)
-
-    for this_id, data in X.iteritems():
-        x = pd.Series(data, name=this_id)
-        try:
-            dc, dr, dvx, dvy = get_dcor(*map(np.array, [x, y]))
-
-        except TimeoutError:
-            sys.stderr.write("dcor timeout event:%s, gene:%s\n" % (y.name,
-                                                                   x.name))
-            dc, dr, dvx, dvy = [np.nan] * 4
-        out_DC.ix[this_id] = dc
-        out_DR.ix[this_id] = dr
-        out_DVX.ix[this_id] = dvx
-        out_DVY.ix[this_id] = dvy
-    return out_DC, out_DR, out_DVX, out_DVY
+    results = distance_correlation(X, y, method=method, n_jobs=n_jobs)
+    return tuple(results[column].rename(y.name) for column in
+                 ('dc', 'dr', 'dvx', 'dvy'))
 
 
 def dropna_mean(x):
@@ -455,9 +1181,16 @@ def spearmanr_series(x, y):
     return stats.spearmanr(x, y)
 
 
-def spearmanr_dataframe(A, B, axis=0):
+def spearmanr_dataframe(A, B, axis=0, top_k=None, block_size=1000):
     """Calculate spearman correlations between dataframes A and B
 
+    A and B are each ranked once, and the correlations are Pearson
+    correlations of the ranks, calculated with matrix products for blocks of
+    ``block_size`` features of A at a time. Missing values are ignored
+    pairwise: the features with missing values are re-ranked within the
+    samples measured in both features of each pair, as in
+    :py:func:`correlations`.
+
     Parameters
     ----------
     A : pandas.DataFrame
@@ -470,27 +1203,82 @@ def spearmanr_dataframe(A, B, axis=0):
         Which axis to compare. If 0, calculate correlations between all the
         columns of A vs te columns of B. If 1, calculate between rows.
         (default 0)
+    top_k : int, optional
+        If provided, only keep the ``top_k`` features of B with the largest
+        absolute correlation to each feature of A, so memory is bounded by
+        ``top_k * n_features1`` instead of ``n_features2 * n_features1``
+    block_size : int, optional
+        Number of features of A to correlate at a time (default 1000)
 
     Returns
     -------
-    correlations : pandas.DataFrame
-        A n_features2 x n_features1 DataFrame of (spearman_r, spearman_p)
-        tuples
-
-    Notes
-    -----
-    Use "applymap" to get just the R- and p-values of the resulting dataframe
-
+    spearman_r : pandas.DataFrame or pandas.Series
+        A n_features2 x n_features1 DataFrame of spearman correlations. If
+        ``top_k`` is provided, a Series indexed by (feature of A, feature of
+        B), with the top partners of each feature of A in order of
+        decreasing absolute correlation
+    spearman_p : pandas.DataFrame or pandas.Series
+        p-values of the correlations, the same shape as spearman_r
+
+    Examples
+    --------
     >>> import pandas as pd
     >>> import numpy as np
     >>> A = pd.DataFrame(np.random.randn(100).reshape(5, 20))
     >>> B = pd.DataFrame(np.random.randn(55).reshape(5, 11))
-    >>> correls = spearmanr_dataframe(A, B)
-    >>> correls.shape
+    >>> spearman_r, spearman_p = spearmanr_dataframe(A, B)
+    >>> spearman_r.shape
     (11, 20)
-    >>> spearman_r = correls.applymap(lambda x: x[0])
-    >>> spearman_p = correls.applymap(lambda x: x[1])
     """
-    return A.apply(lambda x: B.apply(lambda y: spearmanr_series(x, y),
-                                     axis=axis),
-                   axis=axis)
+    if axis == 1:
+        A = A.T
+        B = B.T
+    a_values = A.values.astype(float)
+    b_values = B.values.astype(float)
+    a_ranks, _ = _rank_columns(a_values)
+    b_ranks, _ = _rank_columns(b_values)
+    a_incomplete = np.flatnonzero(np.isnan(a_values).any(axis=0))
+    b_incomplete = np.flatnonzero(np.isnan(b_values).any(axis=0))
+
+    r_blocks = []
+    p_blocks = []
+    partners = []
+    for start in range(0, A.shape[1], block_size):
+        block = slice(start, start + block_size)
+        r, n = _masked_pearson(b_ranks, a_ranks[:, block])
+        # Ranks over all the measured samples are only the ranks within a
+        # pair when both features are measured in every sample
+        for i in b_incomplete:
+            r[i], n[i] = _masked_spearman(a_values[:, block], b_values[:, i])
+        for j in a_incomplete[(a_incomplete >= start)
+                              & (a_incomplete < start + block_size)]:
+            r[:, j - start], n[:, j - start] = _masked_spearman(
+                b_values, a_values[:, j])
+        p = correlation_p_values(r, n)
+        if top_k is not None:
+            # Sort NaNs last, then keep the top features of B of each column
+            order = np.argsort(np.where(np.isnan(r), np.inf, -np.abs(r)),
+                               axis=0, kind='mergesort')[:top_k]
+            columns = np.arange(r.shape[1])
+            r = r[order, columns]
+            p = p[order, columns]
+            partners.append(order)
+        r_blocks.append(r)
+        p_blocks.append(p)
+
+    if len(r_blocks) == 0:
+        r = np.zeros((B.shape[1] if top_k is None else 0, 0))
+        p = r.copy()
+    else:
+        r = np.hstack(r_blocks)
+        p = np.hstack(p_blocks)
+    if top_k is None:
+        return (pd.DataFrame(r, index=B.columns, columns=A.columns),
+                pd.DataFrame(p, index=B.columns, columns=A.columns))
+
+    partners = np.hstack(partners) if partners else r.astype(int)
+    index = pd.MultiIndex.from_arrays(
+        [np.repeat(A.columns.values, r.shape[0]),
+         B.columns.values[partners.T.ravel()]])
+    return (pd.Series(r.T.ravel(), index=index),
+            pd.Series(p.T.ravel(), index=index))
@@ -5,12 +5,32 @@ Information-theoretic calculations
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+import itertools
+import math
+
 import numpy as np
 import pandas as pd
-from sklearn import cross_validation
+from joblib import Parallel, delayed
+from scipy.special import xlogy
+from sklearn.utils import check_random_state
+
+from .expression import benjamini_hochberg_q_values
 
 EPSILON = 100 * np.finfo(float).eps
 
+# Python float, so float32 arrays stay float32 when divided by it
+LOG_2 = math.log(2)
+
+# Number of bootstrap iterations computed together by one worker
+BOOTSTRAP_BLOCK_SIZE = 10
+
+# Number of label permutations computed together by one worker
+PERMUTATION_BLOCK_SIZE = 50
+
+# Number of one-hot bin codes of samples and features to keep in memory at a
+# time, by default
+JSD_CHUNK_ELEMENTS = 2 ** 22
+
 
 def bin_range_strings(bins):
     """Given a list of bins, make a list of strings of those bin ranges
@@ -31,23 +51,95 @@ def bin_range_strings(bins):
     return ['{}-{}'.format(i, j) for i, j in zip(bins, bins[1:])]
 
 
-def _check_prob_dist(x):
+def _check_prob_dist(x, axis=0):
+    """Raise a ValueError if x is not made of probability distributions
+
+    Checks for negative values and distributions which don't sum to 1 in
+    one pass over the array. Distributions containing NaNs are not checked
+    for their sum, as their divergences are NaN anyways.
+
+    Parameters
+    ----------
+    x : numpy.array or pandas.DataFrame or pandas.Series
+        Probability distributions along ``axis``
+    axis : int, optional (default=0)
+        Axis along which each distribution lies
+    """
+    x = np.asarray(x)
     if np.any(x < 0):
         raise ValueError('Each column of the input dataframes must be '
                          '**non-negative** probability distributions')
-    try:
-        if np.any(np.abs(x.sum() - np.ones(x.shape[1])) > EPSILON):
-            raise ValueError('Each column of the input dataframe must be '
-                             'probability distributions that **sum to 1**')
-    except IndexError:
-        if np.any(np.abs(x.sum() - 1) > EPSILON):
-            raise ValueError('Each column of the input dataframe must be '
-                             'probability distributions that **sum to 1**')
+    if np.issubdtype(x.dtype, np.floating):
+        tolerance = max(EPSILON, 100 * np.finfo(x.dtype).eps)
+    else:
+        tolerance = EPSILON
+    if np.any(np.abs(x.sum(axis=axis) - 1) > tolerance):
+        raise ValueError('Each column of the input dataframe must be '
+                         'probability distributions that **sum to 1**')
+
+
+def _bin_codes(values, bins):
+    """Assign every value of a 2D array to the index of its bin
+
+    Bins follow the same convention as :py:func:`numpy.histogram`: all bins
+    are half-open, e.g. [0, 0.5), except the last, which is closed, e.g.
+    [0.5, 1].
+
+    Parameters
+    ----------
+    values : numpy.array
+        A (n_samples, n_features) array of values
+    bins : iterable
+        Bin edges, including the final bin value
+
+    Returns
+    -------
+    codes : numpy.array
+        A (n_samples, n_features) integer array of the bin index of each
+        value. NaNs and values outside the range of ``bins`` are -1
+    """
+    bins = np.asarray(bins, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n_bins = len(bins) - 1
+
+    codes = np.searchsorted(bins, values, side='right') - 1
+    # The last bin includes its right edge
+    codes[values == bins[-1]] = n_bins - 1
+    codes[(codes < 0) | (codes >= n_bins) | np.isnan(values)] = -1
+    return codes
+
+
+def _count_bin_codes(codes, n_bins):
+    """Histogram every column of a bin code array with a single bincount
+
+    Parameters
+    ----------
+    codes : numpy.array
+        A (n_samples, n_features) integer array of bin indices, as created by
+        :py:func:`_bin_codes`. Negative codes are not counted
+    n_bins : int
+        Number of bins
+
+    Returns
+    -------
+    counts : numpy.array
+        A (n_bins, n_features) integer array of the number of samples in each
+        bin, for each feature
+    """
+    n_features = codes.shape[1]
+    valid = codes >= 0
+    # Offset each feature's codes so all features are counted at once
+    offsets = codes + n_bins * np.arange(n_features)
+    counts = np.bincount(offsets[valid], minlength=n_bins * n_features)
+    return counts.reshape(n_features, n_bins).T
 
 
-def binify(df, bins):
+def binify(df, bins, normalize=True):
     """Makes a histogram of each column the provided binsize
 
+    All columns are binned in one pass over the whole array. NaNs, and
+    values which fall outside of ``bins``, are not counted.
+
     Parameters
     ----------
     data : pandas.DataFrame
@@ -57,6 +149,10 @@ def binify(df, bins):
         Bins you would like to use for this data. Must include the final bin
         value, e.g. (0, 0.5, 1) for the two bins (0, 0.5) and (0.5, 1).
         nbins = len(bins) - 1
+    normalize : bool, optional (default=True)
+        If True, normalize each column to sum to 1. Columns without any
+        values in the bins are then all NaN. If False, return the integer
+        number of samples in each bin
 
     Returns
     -------
@@ -65,14 +161,98 @@ def binify(df, bins):
     """
     if bins is None:
         raise ValueError('Must specify "bins"')
-    binned = df.apply(lambda x: pd.Series(np.histogram(x, bins=bins)[0]))
-    binned.index = bin_range_strings(bins)
-
-    # Normalize so each column sums to 1
-    binned = binned / binned.sum().astype(float)
+    codes = _bin_codes(df.values, bins)
+    counts = _count_bin_codes(codes, len(bins) - 1)
+
+    if normalize:
+        # Normalize so each column sums to 1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            counts = counts / counts.sum(axis=0).astype(float)
+    binned = pd.DataFrame(counts, index=bin_range_strings(bins),
+                          columns=df.columns)
     return binned
 
 
+def _kld(p, q, axis=0):
+    """Kullback-Leibler divergence of arrays of distributions along ``axis``
+
+    The inputs are not validated. Terms where either p or q is 0 are 0.
+    The dtype of the inputs is kept, e.g. float32 stays float32.
+
+    Parameters
+    ----------
+    p, q : numpy.array
+        Probability distributions along ``axis``, of the same shape
+    axis : int, optional (default=0)
+        Axis along which each distribution lies
+
+    Returns
+    -------
+    kld : numpy.array
+        Divergence of each distribution in p from q, in bits
+    """
+    terms = np.where(q > 0, xlogy(p, p) - xlogy(p, q), 0)
+    return terms.sum(axis=axis) / LOG_2
+
+
+def _jsd(p, q, axis=0):
+    """Jensen-Shannon divergence of arrays of distributions along ``axis``
+
+    The inputs are not validated. Written as H(m) - (H(p) + H(q))/2, so no
+    division is needed and every term where a probability is 0 is 0.
+    Distributions containing NaNs, e.g. from histograms without any values,
+    give NaN. The dtype of the inputs is kept, e.g. float32 stays float32.
+
+    Parameters
+    ----------
+    p, q : numpy.array
+        Probability distributions along ``axis``, of the same shape
+    axis : int, optional (default=0)
+        Axis along which each distribution lies
+
+    Returns
+    -------
+    jsd : numpy.array
+        Divergence between each distribution in p and q, in bits
+    """
+    m = 0.5 * (p + q)
+    result = 0.5 * (xlogy(p, p).sum(axis=axis) + xlogy(q, q).sum(axis=axis)) \
+        - xlogy(m, m).sum(axis=axis)
+    # Rounding errors can make identical distributions slightly negative
+    return np.maximum(result / LOG_2, 0)
+
+
+def _entropy(p, axis=0, base=2):
+    """Entropy of an array of distributions along ``axis``
+
+    The inputs are not validated. Terms where p is 0 are 0. The dtype of
+    the input is kept, e.g. float32 stays float32.
+
+    Parameters
+    ----------
+    p : numpy.array
+        Probability distributions along ``axis``
+    axis : int, optional (default=0)
+        Axis along which each distribution lies
+    base : numeric, optional (default=2)
+        The log-base of the entropy
+
+    Returns
+    -------
+    entropy : numpy.array
+        Entropy of each distribution
+    """
+    return -xlogy(p, p).sum(axis=axis) / math.log(base)
+
+
+def _like_input(values, x):
+    """Wrap the result of a kernel like its input: one value per column of a
+    DataFrame, or a single value for a Series or 1D array"""
+    if isinstance(x, pd.DataFrame):
+        return pd.Series(values, index=x.columns)
+    return values[()] if np.ndim(values) == 0 else values
+
+
 def kld(p, q):
     """Kullback-Leiber divergence of two probability distributions pandas
     dataframes, p and q
@@ -102,6 +282,8 @@ def kld(p, q):
     The input to this function must be probability distributions, not raw
     values. Otherwise, the output makes no sense.
     """
+    if isinstance(p, (pd.DataFrame, pd.Series)):
+        p, q = p.align(q)
     try:
         _check_prob_dist(p)
         _check_prob_dist(q)
@@ -109,10 +291,7 @@ def kld(p, q):
         return np.nan
     # If one of them is zero, then the other should be considered to be 0.
     # In this problem formulation, log0 = 0
-    p = p.replace(0, np.nan)
-    q = q.replace(0, np.nan)
-
-    return (np.log2(p / q) * p).sum(axis=0)
+    return _like_input(_kld(np.asarray(p), np.asarray(q)), p)
 
 
 def jsd(p, q):
@@ -141,16 +320,14 @@ def jsd(p, q):
         If the data provided is not a probability distribution, i.e. it has
         negative values or its columns do not sum to 1, raise ValueError
     """
+    if isinstance(p, (pd.DataFrame, pd.Series)):
+        p, q = p.align(q)
     try:
         _check_prob_dist(p)
         _check_prob_dist(q)
     except ValueError:
         return np.nan
-    weight = 0.5
-    m = weight * (p + q)
-
-    result = weight * kld(p, m) + (1 - weight) * kld(q, m)
-    return result
+    return _like_input(_jsd(np.asarray(p), np.asarray(q)), p)
 
 
 def entropy(binned, base=2):
@@ -179,8 +356,8 @@ def entropy(binned, base=2):
     try:
         _check_prob_dist(binned)
     except ValueError:
-        np.nan
-    return -((np.log(binned) / np.log(base)) * binned).sum(axis=0)
+        return np.nan
+    return _like_input(_entropy(np.asarray(binned), base=base), binned)
 
 
 def binify_and_jsd(df1, df2, pair, bins):
@@ -194,9 +371,162 @@ def binify_and_jsd(df1, df2, pair, bins):
     return series
 
 
-def cross_phenotype_jsd(data, groupby, bins, n_iter=100):
+def _normalize_counts(counts, axis=0):
+    """Make probability distributions of bin counts along ``axis``
+
+    Distributions without any counts are all NaN
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts / counts.sum(axis=axis, keepdims=True).astype(float)
+
+
+def _bootstrap_weights(n_samples, n_iter, random_state, train_size=0.5):
+    """Draw all bootstrap resampling index sets at once
+
+    Each iteration randomly partitions the samples into two halves, then
+    resamples each half with replacement, just like
+    ``sklearn.cross_validation.Bootstrap``.
+
+    Parameters
+    ----------
+    n_samples : int
+        Number of samples to resample
+    n_iter : int
+        Number of bootstrap iterations
+    random_state : numpy.random.RandomState
+        Random number generator to draw the resamplings from
+    train_size : float, optional (default=0.5)
+        Fraction of the samples in the first half of each partition
+
+    Returns
+    -------
+    weights1, weights2 : numpy.array
+        (n_iter, n_samples) arrays of how many times each sample was drawn
+        into the first and second half of each iteration
+    """
+    n_train = int(np.ceil(train_size * n_samples))
+    n_test = n_samples - n_train
+    iterations = np.arange(n_iter)[:, np.newaxis]
+
+    # Random partition of the samples, for every iteration at once
+    permutations = np.argsort(random_state.rand(n_iter, n_samples), axis=1)
+
+    weights = []
+    for start, size in ((0, n_train), (n_train, n_test)):
+        half = permutations[:, start:start + size]
+        draws = half[iterations,
+                     random_state.randint(0, size, size=(n_iter, size))]
+        offsets = draws + n_samples * iterations
+        weights.append(np.bincount(offsets.ravel(),
+                                   minlength=n_iter * n_samples)
+                       .reshape(n_iter, n_samples))
+    return weights
+
+
+def _one_hot_bin_codes(codes, n_bins):
+    """Expand (n_samples, n_features) bin codes to a one-hot float matrix
+
+    Returns
+    -------
+    one_hot : numpy.array
+        A (n_samples, n_bins * n_features) array, where column
+        ``bin * n_features + feature`` is 1 for the samples whose ``feature``
+        fell into ``bin``. Multiplying with a (n_iter, n_samples) weight
+        matrix gives all the bootstrapped bin counts at once.
+    """
+    n_samples, n_features = codes.shape
+    one_hot = np.zeros((n_samples, n_bins * n_features))
+    valid = codes >= 0
+    samples = np.repeat(np.arange(n_samples), n_features).reshape(codes.shape)
+    columns = codes * n_features + np.arange(n_features)
+    one_hot[samples[valid], columns[valid]] = 1
+    return one_hot
+
+
+def _bootstrap_jsd(one_hot, n_bins, n_iter, random_state):
+    """Within-group Jensen-Shannon distances of bootstrap resamplings
+
+    Instead of binning every resampling separately, build the
+    (n_iter, n_bins, n_features) tensor of bin counts from the one-hot bin
+    codes of the samples with one matrix multiplication, and take all the
+    divergences with array operations.
+
+    Parameters
+    ----------
+    one_hot : numpy.array
+        A (n_samples, n_bins * n_features) one-hot matrix of the bin codes
+        of a single group, from :py:func:`_one_hot_bin_codes`
+    n_bins : int
+        Number of bins
+    n_iter : int
+        Number of bootstrap iterations
+    random_state : numpy.random.RandomState
+        Random number generator for the resampling
+
+    Returns
+    -------
+    jsd : numpy.array
+        A (n_iter, n_features) array of the square root of the JSD between
+        the two halves of each iteration. NaN if the feature was not measured
+        in one of the halves
+    """
+    n_samples = one_hot.shape[0]
+    n_features = one_hot.shape[1] // n_bins
+    if n_samples < 2:
+        return np.nan * np.ones((n_iter, n_features))
+    weights1, weights2 = _bootstrap_weights(n_samples, n_iter, random_state)
+
+    shape = n_iter, n_bins, n_features
+    p = _normalize_counts(np.dot(weights1, one_hot).reshape(shape), axis=1)
+    q = _normalize_counts(np.dot(weights2, one_hot).reshape(shape), axis=1)
+    return np.sqrt(_jsd(p, q, axis=1))
+
+
+def _bootstrap_jsd_block(one_hot, n_bins, n_iter, seed):
+    """Sum the bootstrapped within-group distances of one block of iterations
+
+    Every block has its own random number generator, seeded from ``seed``,
+    so the result does not depend on which worker runs the block.
+
+    Parameters
+    ----------
+    one_hot : numpy.array
+        A (n_samples, n_bins * n_features) one-hot matrix of the bin codes
+        of a single group, shared by all of its blocks
+
+    Returns
+    -------
+    total : numpy.array
+        (n_features,) sum of the distances of all iterations where the
+        feature was measured
+    n_measured : numpy.array
+        (n_features,) number of iterations where the feature was measured
+    """
+    distances = _bootstrap_jsd(one_hot, n_bins, n_iter,
+                               np.random.RandomState(seed))
+    measured = np.isfinite(distances)
+    return np.where(measured, distances, 0).sum(axis=0), measured.sum(axis=0)
+
+
+def _between_jsd(counts1, counts2):
+    """Jensen-Shannon distance of features between two groups' bin counts"""
+    return np.sqrt(_jsd(_normalize_counts(counts1),
+                        _normalize_counts(counts2)))
+
+
+def _jsd_chunksize(n_samples, n_bins):
+    """Number of features whose one-hot bin codes fit in JSD_CHUNK_ELEMENTS"""
+    return max(JSD_CHUNK_ELEMENTS // max(n_samples * n_bins, 1), 1)
+
+
+def cross_phenotype_jsd(data, groupby, bins, n_iter=100, random_state=None,
+                        n_jobs=1, chunksize=None, counts=None):
     """Jensen-Shannon divergence of features across phenotypes
 
+    Each sample is assigned to a bin only once, and all bootstrap
+    resamplings of the within-group comparisons are drawn at once and
+    counted from these bin codes.
+
     Parameters
     ----------
     data : pandas.DataFrame
@@ -208,41 +538,358 @@ def cross_phenotype_jsd(data, groupby, bins, n_iter=100):
         within-group comparisons
     n_bins : int
         Number of bins to binify the singles data on
+    random_state : None, int or numpy.random.RandomState, optional
+        Seed or random number generator for the bootstrap resampling, to
+        make the within-group comparisons reproducible
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the phenotype pairs and blocks of
+        bootstrap iterations across. -1 uses all CPUs. The results are the
+        same for any number of processes.
+    chunksize : int, optional (default=None)
+        Bin and compare only this many features at a time, and write each
+        chunk's divergences into the output before starting the next one.
+        Peak memory then depends on the chunk size instead of the number of
+        features. By default, as many features as have one-hot bin codes of
+        at most ``JSD_CHUNK_ELEMENTS`` values. The results are the same for
+        any chunk size.
+    counts : dict, optional (default=None)
+        Mapping of each phenotype to a (n_bins, n_features) array of the bin
+        counts of its samples, e.g. from a cache of histograms. If not
+        provided, these are counted from the data.
 
     Returns
     -------
     jsd_df : pandas.DataFrame
         A (n_features, n_phenotypes^2) dataframe of the JSD between each
         feature between and within phenotypes
+
+    Notes
+    -----
+    The bin codes are computed once and shared with the worker processes.
+    joblib memory-maps large arrays instead of pickling them to every worker.
+    """
+    random_state = check_random_state(random_state)
+    n_features = data.shape[1]
+    n_bins = len(bins) - 1
+    if chunksize is None:
+        chunksize = _jsd_chunksize(data.shape[0], n_bins)
+    indices = data.groupby(groupby).indices
+    phenotypes = sorted(indices.keys())
+    pairs = list(itertools.combinations_with_replacement(phenotypes, 2))
+
+    # Split the bootstrap into fixed blocks, each with its own seed, so the
+    # random draws don't depend on how the blocks are spread across workers,
+    # and every chunk of features is resampled the same way
+    n_blocks = int(np.ceil(n_iter / BOOTSTRAP_BLOCK_SIZE))
+    block_sizes = [min(BOOTSTRAP_BLOCK_SIZE, n_iter - i * BOOTSTRAP_BLOCK_SIZE)
+                   for i in range(n_blocks)]
+    seeds = dict((phenotype1, random_state.randint(np.iinfo(np.int32).max,
+                                                   size=n_blocks))
+                 for phenotype1, phenotype2 in pairs
+                 if phenotype1 == phenotype2)
+
+    jsds = np.empty((n_features, len(pairs)))
+    for start in range(0, n_features, max(chunksize, 1)):
+        chunk = slice(start, start + chunksize)
+        codes = _bin_codes(data.iloc[:, chunk].values, bins)
+        if counts is None:
+            chunk_counts = dict(
+                (phenotype, _count_bin_codes(codes[indices[phenotype]],
+                                             n_bins))
+                for phenotype in phenotypes)
+        else:
+            chunk_counts = dict((phenotype, counts[phenotype][:, chunk])
+                                for phenotype in phenotypes)
+        jsds[chunk] = _cross_phenotype_jsd_chunk(
+            codes, n_bins, indices, chunk_counts, pairs, block_sizes, seeds,
+            n_jobs)
+
+    jsds = pd.DataFrame(jsds, index=data.columns,
+                        columns=pd.MultiIndex.from_tuples(pairs))
+    return jsds.dropna(how='all')
+
+
+def _cross_phenotype_jsd_chunk(codes, n_bins, indices, counts, pairs,
+                               block_sizes, seeds, n_jobs):
+    """Jensen-Shannon distances of all phenotype pairs for a chunk of features
+
+    Parameters
+    ----------
+    codes : numpy.array
+        A (n_samples, n_features_in_chunk) array of bin codes
+    n_bins : int
+        Number of bins
+    indices : dict
+        Mapping of phenotypes to the row positions of their samples
+    counts : dict
+        Mapping of phenotypes to the (n_bins, n_features_in_chunk) bin counts
+        of their samples
+    pairs : list
+        (phenotype1, phenotype2) tuples to compare
+    block_sizes : list
+        Number of bootstrap iterations in each block
+    seeds : dict
+        Mapping of phenotypes to the random seed of each bootstrap block
+    n_jobs : int
+        Number of processes
+
+    Returns
+    -------
+    jsds : numpy.array
+        A (n_features_in_chunk, n_pairs) array
+    """
+    task_pairs = []
+    tasks = []
+    for phenotype1, phenotype2 in pairs:
+        if phenotype1 == phenotype2:
+            # Built once per group, and shared by all of its blocks
+            one_hot = _one_hot_bin_codes(codes[indices[phenotype1]], n_bins)
+            for size, seed in zip(block_sizes, seeds[phenotype1]):
+                task_pairs.append((phenotype1, phenotype2))
+                tasks.append(delayed(_bootstrap_jsd_block)(
+                    one_hot, n_bins, size, seed))
+        else:
+            task_pairs.append((phenotype1, phenotype2))
+            tasks.append(delayed(_between_jsd)(counts[phenotype1],
+                                               counts[phenotype2]))
+    results = Parallel(n_jobs=n_jobs)(tasks)
+
+    n_features = codes.shape[1]
+    totals = dict((pair, np.zeros(n_features)) for pair in pairs)
+    n_measured = dict((pair, np.zeros(n_features)) for pair in pairs)
+    for pair, result in zip(task_pairs, results):
+        if pair[0] == pair[1]:
+            totals[pair] += result[0]
+            n_measured[pair] += result[1]
+        else:
+            totals[pair] = result
+
+    jsds = np.empty((n_features, len(pairs)))
+    for i, pair in enumerate(pairs):
+        if pair[0] == pair[1]:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                jsds[:, i] = totals[pair] / n_measured[pair]
+        else:
+            jsds[:, i] = totals[pair]
+    return jsds
+
+
+def _permuted_jsd(one_hot, n_bins, n1, labels):
+    """Jensen-Shannon distances between two groups for many labelings
+
+    Parameters
+    ----------
+    one_hot : numpy.array
+        A (n_samples, n_bins * n_features) one-hot matrix of the bin codes of
+        the samples of both groups, from :py:func:`_one_hot_bin_codes`
+    n_bins : int
+        Number of bins
+    n1 : int
+        Number of samples in the first group
+    labels : numpy.array
+        A (n_labelings, n_samples) array with the sample order of each
+        labeling. The first ``n1`` samples are assigned to the first group
+
+    Returns
+    -------
+    jsd : numpy.array
+        A (n_labelings, n_features) array of the square root of the JSD
+    """
+    n_labelings, n_samples = labels.shape
+    n_features = one_hot.shape[1] // n_bins
+    iterations = np.arange(n_labelings)[:, np.newaxis]
+    offsets = labels[:, :n1] + n_samples * iterations
+    membership = np.bincount(offsets.ravel(),
+                             minlength=n_labelings * n_samples)
+    membership = membership.reshape(n_labelings, n_samples)
+
+    # Relabeling only changes which samples' counts are added up
+    shape = n_labelings, n_bins, n_features
+    counts1 = np.dot(membership, one_hot).reshape(shape)
+    counts2 = one_hot.sum(axis=0).reshape(1, n_bins, n_features) - counts1
+    return np.sqrt(_jsd(_normalize_counts(counts1, axis=1),
+                        _normalize_counts(counts2, axis=1), axis=1))
+
+
+def _permutation_block(one_hot, n_bins, n1, observed, n_permutations,
+                       seed):
+    """Count the permutations at least as divergent as the observed labels
+
+    Parameters
+    ----------
+    one_hot : numpy.array
+        A (n_samples, n_bins * n_features) one-hot matrix of the bin codes of
+        the samples of both groups, shared by all the blocks of the pair
+    n_bins : int
+        Number of bins
+    n1 : int
+        Number of samples in the first group
+    observed : numpy.array
+        (n_features,) Jensen-Shannon distance between the two groups
+    n_permutations : int
+        Number of label permutations in this block
+    seed : int
+        Seed of the random number generator of this block
+
+    Returns
+    -------
+    n_extreme : numpy.array
+        (n_features,) number of permutations with a distance at least as
+        large as the observed one
+    n_valid : numpy.array
+        (n_features,) number of permutations where the feature was measured
+        in both permuted groups
+    """
+    random_state = np.random.RandomState(seed)
+    n_samples = one_hot.shape[0]
+    labels = np.argsort(random_state.rand(n_permutations, n_samples), axis=1)
+    permuted = _permuted_jsd(one_hot, n_bins, n1, labels)
+
+    valid = np.isfinite(permuted)
+    with np.errstate(invalid='ignore'):
+        extreme = valid & (permuted >= observed - EPSILON)
+    return extreme.sum(axis=0), valid.sum(axis=0)
+
+
+def jsd_permutation_test(data, groupby, bins, n_permutations=1000,
+                         random_state=None, n_jobs=1, chunksize=None):
+    """Permutation test of the divergence of features between phenotypes
+
+    For every pair of phenotypes, the phenotype labels of their samples are
+    shuffled ``n_permutations`` times, and the Jensen-Shannon distance of
+    each feature is compared to its distance under the shuffled labels.
+    The samples are binned only once, so every permutation only adds up
+    the bin counts of the relabeled samples.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        A (n_samples, n_features) Dataframe
+    groupby : mappable
+        A samples to phenotypes mapping
+    bins : iterable
+        Bins to binify the data on, including the final bin value
+    n_permutations : int, optional (default=1000)
+        Number of label permutations per phenotype pair
+    random_state : None, int or numpy.random.RandomState, optional
+        Seed or random number generator for the permutations
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the phenotype pairs and blocks of
+        permutations across. The results are the same for any number of
+        processes.
+    chunksize : int, optional (default=None)
+        Test only this many features at a time. By default, as many features
+        as have one-hot bin codes of at most ``JSD_CHUNK_ELEMENTS`` values.
+        Every chunk is tested with the same permutations, so the results are
+        the same for any chunk size.
+
+    Returns
+    -------
+    permutation_test : pandas.DataFrame
+        A tidy dataframe with one row per phenotype pair and feature, and
+        the columns "phenotype1", "phenotype2", "feature_id", "jsd" (the
+        square root of the Jensen-Shannon divergence, as in
+        :py:func:`cross_phenotype_jsd`), "p_value" (the empirical p-value)
+        and "q_value" (the Benjamini-Hochberg adjusted p-value, across the
+        features of each phenotype pair)
+    """
+    random_state = check_random_state(random_state)
+    n_features = data.shape[1]
+    n_bins = len(bins) - 1
+    if chunksize is None:
+        chunksize = _jsd_chunksize(data.shape[0], n_bins)
+    indices = data.groupby(groupby).indices
+    pairs = list(itertools.combinations(sorted(indices.keys()), 2))
+    if len(pairs) == 0:
+        raise ValueError('Must have at least two phenotypes to compare')
+
+    n_blocks = int(np.ceil(n_permutations / PERMUTATION_BLOCK_SIZE))
+    block_sizes = [min(PERMUTATION_BLOCK_SIZE,
+                       n_permutations - i * PERMUTATION_BLOCK_SIZE)
+                   for i in range(n_blocks)]
+    seeds = dict((pair, random_state.randint(np.iinfo(np.int32).max,
+                                             size=n_blocks))
+                 for pair in pairs)
+
+    observed = dict((pair, np.empty(n_features)) for pair in pairs)
+    n_extreme = dict((pair, np.empty(n_features)) for pair in pairs)
+    n_valid = dict((pair, np.empty(n_features)) for pair in pairs)
+    for start in range(0, n_features, max(chunksize, 1)):
+        chunk = slice(start, start + chunksize)
+        codes = _bin_codes(data.iloc[:, chunk].values, bins)
+        results = _jsd_permutation_chunk(codes, n_bins, indices, pairs,
+                                         block_sizes, seeds, n_jobs)
+        for pair, (jsd, extreme, valid) in zip(pairs, results):
+            observed[pair][chunk] = jsd
+            n_extreme[pair][chunk] = extreme
+            n_valid[pair][chunk] = valid
+
+    dfs = []
+    for phenotype1, phenotype2 in pairs:
+        pair = phenotype1, phenotype2
+        p_values = (1 + n_extreme[pair]) / (1 + n_valid[pair])
+        p_values[~np.isfinite(observed[pair])] = np.nan
+        df = pd.DataFrame({'phenotype1': phenotype1,
+                           'phenotype2': phenotype2,
+                           'feature_id': data.columns,
+                           'jsd': observed[pair],
+                           'p_value': p_values,
+                           'q_value': benjamini_hochberg_q_values(p_values)},
+                          columns=['phenotype1', 'phenotype2', 'feature_id',
+                                   'jsd', 'p_value', 'q_value'])
+        dfs.append(df.dropna(subset=['jsd']))
+    return pd.concat(dfs, ignore_index=True)
+
+
+def _jsd_permutation_chunk(codes, n_bins, indices, pairs, block_sizes, seeds,
+                           n_jobs):
+    """Permutation tests of all phenotype pairs for a chunk of features
+
+    Parameters
+    ----------
+    codes : numpy.array
+        A (n_samples, n_features_in_chunk) array of bin codes
+    n_bins : int
+        Number of bins
+    indices : dict
+        Mapping of phenotypes to the row positions of their samples
+    pairs : list
+        (phenotype1, phenotype2) tuples to compare
+    block_sizes : list
+        Number of permutations in each block
+    seeds : dict
+        Mapping of phenotype pairs to the random seed of each block
+    n_jobs : int
+        Number of processes
+
+    Returns
+    -------
+    results : list
+        (observed, n_extreme, n_valid) tuple of (n_features_in_chunk,) arrays
+        for each pair
     """
-    grouped = data.groupby(groupby)
-    jsds = []
-
-    seen = set([])
-
-    for phenotype1, df1 in grouped:
-        for phenotype2, df2 in grouped:
-            pair = tuple(sorted([phenotype1, phenotype2]))
-            if pair in seen:
-                continue
-            seen.add(pair)
-
-            if phenotype1 == phenotype2:
-                seriess = []
-                bs = cross_validation.Bootstrap(df1.shape[0], n_iter=n_iter,
-                                                train_size=0.5)
-                for i, (ind1, ind2) in enumerate(bs):
-                    df1_subset = df1.iloc[ind1, :]
-                    df2_subset = df2.iloc[ind2, :]
-                    seriess.append(
-                        binify_and_jsd(df1_subset, df2_subset, None, bins))
-                series = pd.concat(seriess, axis=1, names=None).mean(axis=1)
-                series.name = pair
-                jsds.append(series)
-            else:
-                series = binify_and_jsd(df1, df2, pair, bins)
-                jsds.append(series)
-    return pd.concat(jsds, axis=1)
+    observed = []
+    task_pairs = []
+    tasks = []
+    for i, (phenotype1, phenotype2) in enumerate(pairs):
+        # Built once per pair, and shared by all of its blocks
+        one_hot = _one_hot_bin_codes(codes[np.concatenate(
+            [indices[phenotype1], indices[phenotype2]])], n_bins)
+        n1 = len(indices[phenotype1])
+        observed.append(_permuted_jsd(
+            one_hot, n_bins, n1, np.arange(one_hot.shape[0])[np.newaxis])[0])
+        for size, seed in zip(block_sizes, seeds[phenotype1, phenotype2]):
+            task_pairs.append(i)
+            tasks.append(delayed(_permutation_block)(
+                one_hot, n_bins, n1, observed[i], size, seed))
+
+    n_features = codes.shape[1]
+    n_extreme = [np.zeros(n_features) for _ in pairs]
+    n_valid = [np.zeros(n_features) for _ in pairs]
+    for i, (extreme, valid) in zip(task_pairs, Parallel(n_jobs=n_jobs)(tasks)):
+        n_extreme[i] += extreme
+        n_valid[i] += valid
+    return list(zip(observed, n_extreme, n_valid))
 
 
 def jsd_df_to_2d(jsd_df):
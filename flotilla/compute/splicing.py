@@ -5,7 +5,19 @@ Calculate splicing-specific operations
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+from joblib import Parallel, delayed
 import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .infotheory import _bin_codes, _count_bin_codes
+
+EXCLUDED = '~0'
+INCLUDED = '~1'
+MIDDLE = 'middle'
+BIMODAL = 'bimodal'
+MULTIMODAL = 'multimodal'
+MODALITIES = (EXCLUDED, MIDDLE, INCLUDED, BIMODAL, MULTIMODAL)
 
 
 def switchy_score(array):
@@ -33,18 +45,358 @@ def switchy_score(array):
     return variance * mean_value
 
 
+def switchy_scores(x):
+    """Vectorized switchy scores of every column of a 2D array
+
+    Same as applying :py:func:`switchy_score` to each column, but the
+    standard deviation of the sines and the mean of the cosines are taken
+    with sums over the non-NaN values of the whole array at once.
+
+    Parameters
+    ----------
+    x : numpy.array
+        A 2-D numpy array or pandas.DataFrame in the shape
+        [n_samples, n_events], which may contain NaNs
+
+    Returns
+    -------
+    switchy_scores : numpy.array
+        A 1-D array of the switchy score of each event. NaN for events
+        without any values
+    """
+    x = np.asarray(x, dtype=float)
+    measured = ~np.isnan(x)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n_measured = measured.sum(axis=0).astype(float)
+        sines = np.where(measured, np.sin(x * np.pi), 0)
+        cosines = np.where(measured, np.cos(x * np.pi), 0)
+
+        sine_mean = sines.sum(axis=0) / n_measured
+        sine_deviation = np.where(measured, sines - sine_mean, 0)
+        sine_std = np.sqrt((sine_deviation ** 2).sum(axis=0) / n_measured)
+        cosine_mean = cosines.sum(axis=0) / n_measured
+    return (1 - sine_std) * -cosine_mean
+
+
 def get_switchy_score_order(x):
     """Apply switchy scores to a 2D array of data scores
 
     Parameters
     ----------
     x : numpy.array
-        A 2-D numpy array in the shape [n_events, n_samples]
+        A 2-D numpy array in the shape [n_samples, n_events]
 
     Returns
     -------
     score_order : numpy.array
         A 1-D array of the ordered indices, in switchy score order
     """
-    switchy_scores = np.apply_along_axis(switchy_score, axis=0, arr=x)
-    return np.argsort(switchy_scores)
+    return np.argsort(switchy_scores(x))
+
+
+def summed_abs_differences(x, y):
+    """Summed absolute difference of each row of y from all rows of x
+
+    Equivalent to ``np.nansum(np.abs(x - row), axis=0)`` for every row of
+    ``y``, but without the (n_x_rows, n_columns) temporary per row. Each
+    column of ``x`` is sorted and cumulatively summed once, so the sum over
+    the values below and above each value of ``y`` can be looked up.
+
+    Parameters
+    ----------
+    x : numpy.array
+        A (n_x_rows, n_columns) array, which may contain NaNs
+    y : numpy.array
+        A (n_y_rows, n_columns) array, which may contain NaNs
+
+    Returns
+    -------
+    summed : numpy.array
+        A (n_y_rows, n_columns) array of the summed absolute differences.
+        NaN where ``y`` is NaN or the column of ``x`` has no values
+    n_measured : numpy.array
+        The number of non-NaN values of each column of ``x``
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n_columns = x.shape[1]
+    columns = np.arange(n_columns)
+
+    # NaNs are sorted to the end of each column
+    x_sorted = np.sort(x, axis=0)
+    n_measured = (~np.isnan(x)).sum(axis=0)
+    cumulative = np.vstack([np.zeros(n_columns),
+                            np.nancumsum(x_sorted, axis=0)])
+    totals = cumulative[n_measured, columns]
+
+    # Shift each column into its own range so a single searchsorted over
+    # the flattened, measured values finds the position within every column
+    measured = np.arange(x.shape[0])[:, np.newaxis] < n_measured
+    values = x_sorted.T[measured.T]
+    finite = np.concatenate([values, y[~np.isnan(y)]])
+    low = finite.min() if finite.size > 0 else 0.
+    span = finite.max() - low + 1 if finite.size > 0 else 1.
+    offsets = columns * span - low
+    starts = np.concatenate([[0], np.cumsum(n_measured)[:-1]])
+    keys = values + np.repeat(offsets, n_measured)
+
+    y_measured = ~np.isnan(y)
+    queries = np.where(y_measured, y, 0) + offsets
+    n_below = np.searchsorted(keys, queries, side='left') - starts
+    n_below = np.clip(n_below, 0, n_measured)
+    below = cumulative[n_below, columns]
+
+    summed = y * n_below - below + (totals - below) \
+        - y * (n_measured - n_below)
+    summed[~y_measured | (n_measured == 0)] = np.nan
+    return summed, n_measured
+
+
+def pooled_inconsistent_sweep(singles, pooled, singles_expression,
+                              pooled_expression, thresholds,
+                              fraction_diff_thresh=0.1):
+    """Events whose pooled psi is inconsistent with the singles, at each
+    expression threshold
+
+    A psi score is only used at a threshold if its expression is at least the
+    threshold. Rather than filtering and comparing from scratch at every
+    threshold, the differences of the pooled samples from the singles are
+    calculated once at the lowest threshold, and then the psi scores are
+    removed in order of their expression, subtracting their contribution
+    as the threshold rises.
+
+    Parameters
+    ----------
+    singles : numpy.array
+        A (n_singles, n_events) array of psi scores of single cells
+    pooled : numpy.array
+        A (n_pooled, n_events) array of psi scores of pooled samples
+    singles_expression : numpy.array
+        A (n_singles, n_events) array of the expression of each single cell
+        psi score, e.g. of the event's gene. -np.inf to use the psi score
+        only when there is no threshold
+    pooled_expression : numpy.array
+        A (n_pooled, n_events) array of the expression of each pooled psi
+        score
+    thresholds : list-like
+        Expression thresholds
+    fraction_diff_thresh : float, optional (default=0.1)
+        Minimum mean absolute difference of a pooled sample's psi from the
+        singles' psi for the event to be inconsistent
+
+    Returns
+    -------
+    n_pooled : numpy.array
+        Number of events measured in the pooled samples at each threshold
+    n_inconsistent : numpy.array
+        Number of those events with a pooled sample inconsistent with the
+        single cells at each threshold
+    """
+    singles = np.asarray(singles, dtype=float)
+    pooled = np.asarray(pooled, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    n_events = singles.shape[1]
+    n_pooled = np.zeros(len(thresholds), dtype=int)
+    n_inconsistent = np.zeros(len(thresholds), dtype=int)
+    if len(thresholds) == 0:
+        return n_pooled, n_inconsistent
+
+    order = np.argsort(thresholds, kind='mergesort')
+    lowest = thresholds[order[0]]
+    singles_expression = np.asarray(singles_expression, dtype=float)
+    pooled_expression = np.asarray(pooled_expression, dtype=float)
+    with np.errstate(invalid='ignore'):
+        singles_kept = ~np.isnan(singles) & (singles_expression >= lowest)
+        pooled_kept = ~np.isnan(pooled) & (pooled_expression >= lowest)
+    summed, n_singles = summed_abs_differences(
+        np.where(singles_kept, singles, np.nan),
+        np.where(pooled_kept, pooled, np.nan))
+    n_singles = n_singles.astype(float)
+
+    # Every kept psi score, in the order they drop out as the threshold rises
+    singles_rows, singles_events = np.nonzero(singles_kept)
+    singles_removal = np.argsort(
+        singles_expression[singles_rows, singles_events], kind='mergesort')
+    singles_rows = singles_rows[singles_removal]
+    singles_events = singles_events[singles_removal]
+    singles_removal = singles_expression[singles_rows, singles_events]
+
+    pooled_rows, pooled_events = np.nonzero(pooled_kept)
+    pooled_removal = np.argsort(
+        pooled_expression[pooled_rows, pooled_events], kind='mergesort')
+    pooled_rows = pooled_rows[pooled_removal]
+    pooled_events = pooled_events[pooled_removal]
+    pooled_removal = pooled_expression[pooled_rows, pooled_events]
+
+    singles_start, pooled_start = 0, 0
+    for i in order:
+        # Remove the psi scores below this threshold
+        singles_stop = np.searchsorted(singles_removal, thresholds[i])
+        rows = singles_rows[singles_start:singles_stop]
+        events = singles_events[singles_start:singles_stop]
+        if len(events) > 0:
+            np.subtract.at(summed.T, events, np.abs(
+                singles[rows, events][:, np.newaxis] - pooled[:, events].T))
+            n_singles -= np.bincount(events, minlength=n_events)
+        singles_start = singles_stop
+
+        pooled_stop = np.searchsorted(pooled_removal, thresholds[i])
+        pooled_kept[pooled_rows[pooled_start:pooled_stop],
+                    pooled_events[pooled_start:pooled_stop]] = False
+        pooled_start = pooled_stop
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            inconsistent = (summed / n_singles >= fraction_diff_thresh) \
+                & (n_singles > 0)
+        n_pooled[i] = pooled_kept.any(axis=0).sum()
+        n_inconsistent[i] = (inconsistent & pooled_kept).any(axis=0).sum()
+    return n_pooled, n_inconsistent
+
+
+def modality_models(excluded_max=0.2, included_min=0.8, mass=0.9):
+    """Parametric distributions of the splicing modalities
+
+    The excluded and included models are Beta distributions with ``mass``
+    of their probability below ``excluded_max`` and above ``included_min``,
+    respectively. The middle model is a symmetric Beta distribution with the
+    mean of their parameters, the bimodal model its inverse, and the
+    multimodal model is uniform.
+
+    Parameters
+    ----------
+    excluded_max : float, optional (default=0.2)
+        Maximum value of the "excluded" psi scores
+    included_min : float, optional (default=0.8)
+        Minimum value of the "included" psi scores
+    mass : float, optional (default=0.9)
+        Fraction of the excluded and included models' probability in their
+        ranges
+
+    Returns
+    -------
+    models : dict
+        Mapping of each modality in :py:data:`MODALITIES` to a frozen
+        scipy.stats distribution
+    """
+    excluded = np.log(1 - mass) / np.log(1 - excluded_max)
+    included = np.log(1 - mass) / np.log(included_min)
+    parameter = (excluded + included) / 2.
+    return {EXCLUDED: stats.beta(1, excluded),
+            INCLUDED: stats.beta(included, 1),
+            MIDDLE: stats.beta(parameter, parameter),
+            BIMODAL: stats.beta(1. / parameter, 1. / parameter),
+            MULTIMODAL: stats.uniform(0, 1)}
+
+
+def _modality_log_likelihoods(codes, n_bins, log_probabilities, counts=None):
+    """Multinomial log-likelihoods of binned events under every model
+
+    Parameters
+    ----------
+    codes : numpy.array
+        A (n_samples, n_events) array of bin codes of one phenotype
+    n_bins : int
+        Number of bins
+    log_probabilities : numpy.array
+        A (n_bins, n_models) array of the log-probability of each bin under
+        each model
+    counts : numpy.array, optional
+        Precomputed (n_bins, n_events) bin counts of the codes
+
+    Returns
+    -------
+    log_likelihoods : numpy.array
+        A (n_models, n_events) array
+    n_samples : numpy.array
+        Number of samples measured in each event
+    """
+    if counts is None:
+        counts = _count_bin_codes(codes, n_bins)
+    return np.dot(log_probabilities.T, counts), counts.sum(axis=0)
+
+
+def estimate_modalities(data, groupby, bins, excluded_max=0.2,
+                        included_min=0.8, log_likelihood_ratio_thresh=3,
+                        min_samples=10, n_jobs=1, counts=None):
+    """Assign every event in every phenotype to a splicing modality
+
+    The psi scores of each phenotype are binned once, and the multinomial
+    log-likelihoods of all events under all models of
+    :py:func:`modality_models` are taken in a single matrix product of the
+    bin counts with the models' log-probabilities of each bin.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        A (n_samples, n_events) dataframe of psi scores
+    groupby : mappable
+        A samples to phenotypes mapping
+    bins : iterable
+        Bin edges between 0 and 1, including the final bin value
+    excluded_max : float, optional (default=0.2)
+        Maximum value of the "excluded" psi scores
+    included_min : float, optional (default=0.8)
+        Minimum value of the "included" psi scores
+    log_likelihood_ratio_thresh : float, optional (default=3)
+        Minimum log-likelihood ratio of the best model over the uniform
+        model. Events whose best model doesn't pass this are "multimodal"
+    min_samples : int, optional (default=10)
+        Minimum number of samples of a phenotype with a psi score for an
+        event to be assigned a modality in that phenotype
+    n_jobs : int, optional (default=1)
+        Number of processes to spread the phenotypes across. -1 uses all
+        CPUs.
+    counts : dict, optional (default=None)
+        Mapping of each phenotype to a (n_bins, n_events) array of the bin
+        counts of its samples, e.g. from a cache of histograms. If not
+        provided, these are counted from the data.
+
+    Returns
+    -------
+    modalities : pandas.DataFrame
+        A tidy dataframe with the phenotype, feature_id, modality, number of
+        samples and log-likelihood ratio of the best non-uniform model over
+        the uniform model of every event with at least ``min_samples`` in
+        each phenotype
+    """
+    models = modality_models(excluded_max, included_min)
+    cdfs = np.array([models[modality].cdf(bins) for modality in MODALITIES])
+    probabilities = np.diff(cdfs, axis=1).T
+    log_probabilities = np.log(np.maximum(probabilities,
+                                          np.finfo(float).tiny))
+
+    n_bins = len(bins) - 1
+    indices = data.groupby(groupby).indices
+    phenotypes = sorted(indices.keys())
+    if counts is None:
+        codes = _bin_codes(data.values, bins)
+        tasks = (delayed(_modality_log_likelihoods)(
+            codes[indices[phenotype]], n_bins, log_probabilities)
+            for phenotype in phenotypes)
+    else:
+        tasks = (delayed(_modality_log_likelihoods)(
+            None, n_bins, log_probabilities, counts[phenotype])
+            for phenotype in phenotypes)
+    results = Parallel(n_jobs=n_jobs)(tasks)
+
+    uniform = MODALITIES.index(MULTIMODAL)
+    parametric = [i for i, modality in enumerate(MODALITIES)
+                  if modality != MULTIMODAL]
+    dfs = []
+    for phenotype, (log_likelihoods, n_samples) in zip(phenotypes, results):
+        best = np.argmax(log_likelihoods[parametric], axis=0)
+        ratios = log_likelihoods[parametric].max(axis=0) \
+            - log_likelihoods[uniform]
+        modalities = np.where(ratios >= log_likelihood_ratio_thresh,
+                              np.array(MODALITIES, dtype=object)[
+                                  np.array(parametric)[best]],
+                              MULTIMODAL)
+        df = pd.DataFrame({'phenotype': phenotype,
+                           'feature_id': data.columns,
+                           'modality': modalities,
+                           'n_samples': n_samples,
+                           'log_likelihood_ratio': ratios},
+                          columns=['phenotype', 'feature_id', 'modality',
+                                   'n_samples', 'log_likelihood_ratio'])
+        dfs.append(df[df.n_samples >= max(min_samples, 1)])
+    return pd.concat(dfs, ignore_index=True)
@@ -17,7 +17,8 @@ from sklearn.preprocessing import StandardScaler
 from scipy.cluster.vq import whiten
 
 from ..compute.decomposition import DataFramePCA
-from ..compute.infotheory import binify, cross_phenotype_jsd, jsd_df_to_2d
+from ..compute.infotheory import bin_range_strings, binify, \
+    cross_phenotype_jsd, jsd_df_to_2d, jsd_permutation_test
 from ..compute.predict import PredictorConfigManager, \
     PredictorDataSetManager, CLASSIFIER
 from ..compute.outlier import OutlierDetection
@@ -26,10 +27,14 @@ from ..visualize.decomposition import DecompositionViz
 from ..visualize.generic import violinplot, simple_twoway_scatter
 from ..visualize.network import NetworkerViz
 from ..visualize.predict import ClassifierViz
+from ..util import MemoryBoundedCache
 
 
 MINIMUM_FEATURE_SUBSET = 20
 
+# Maximum size of the stored histograms of the data, in bytes
+HISTOGRAM_CACHE_MAX_BYTES = 2 ** 28
+
 
 class BaseData(object):
     """Base class for biological data measurements.
@@ -60,6 +65,11 @@ class BaseData(object):
         Dict of {"subset_name" : list_of_feature_ids} for feature subsets
         specified as either boolean columns in ``feature_data``. All columns in
         ``feature_ignore_subset_cols`` are ignored
+    histogram_cache : flotilla.util.MemoryBoundedCache
+        Bin counts of groups of samples, shared by :py:meth:`.binify`,
+        :py:meth:`.reduce`, :py:meth:`.jsd_df` and :py:meth:`.jsd_2d`. Emptied
+        whenever :py:attr:`.data` is replaced. If you modify
+        :py:attr:`.data` in place, call :py:meth:`.invalidate_histograms`
     predictor_config_manager : PredictorConfigManager
         Manage different combinations of predictor on different data subtypes
     variant : pandas.Index
@@ -148,6 +158,8 @@ class BaseData(object):
             raise ValueError('flotilla does not currently support '
                              'multi-indexed dataframes')
 
+        self._data_version = 0
+        self.histogram_cache = MemoryBoundedCache(HISTOGRAM_CACHE_MAX_BYTES)
         self.data = data
         self.data_original = data.copy()
         self.thresh = thresh if thresh is not None else -np.inf
@@ -203,6 +215,81 @@ class BaseData(object):
 
         self.networks = NetworkerViz(self)
 
+    @property
+    def data(self):
+        """A (n_samples, m_features) DataFrame of the filtered input data"""
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self.invalidate_histograms()
+
+    def invalidate_histograms(self):
+        """Forget all stored histograms of the data
+
+        Called automatically when :py:attr:`.data` is replaced, but must be
+        called manually after modifying :py:attr:`.data` in place.
+        """
+        self._data_version += 1
+        self.histogram_cache.clear()
+
+    def _histograms(self, bins, groups):
+        """Bin counts of all features for groups of samples, stored in cache
+
+        Parameters
+        ----------
+        bins : iterable
+            Bin edges, including the final bin value
+        groups : dict
+            Mapping of group names to the sample ids in each group
+
+        Returns
+        -------
+        counts : dict
+            Mapping of group names to a (n_bins, n_features) integer array of
+            the bin counts of the group's samples, for every feature in
+            :py:attr:`.data`
+        """
+        key = (self._data_version, tuple(bins),
+               frozenset((group, frozenset(sample_ids))
+                         for group, sample_ids in groups.items()))
+        counts = self.histogram_cache.get(key)
+        if counts is None:
+            counts = dict((group, binify(self.data.ix[sample_ids], bins,
+                                         normalize=False).values)
+                          for group, sample_ids in groups.items())
+            self.histogram_cache.set(
+                key, counts, nbytes=sum(c.nbytes for c in counts.values()))
+        return counts
+
+    def _binned(self, bins, sample_ids=None, feature_ids=None):
+        """Normalized histogram of each feature, from the histogram cache
+
+        Parameters
+        ----------
+        bins : iterable
+            Bin edges, including the final bin value
+        sample_ids : list-like, optional (default=None)
+            Samples to bin. If None, use all samples
+        feature_ids : list-like, optional (default=None)
+            Features to bin. If None, use all features
+
+        Returns
+        -------
+        binned : pandas.DataFrame
+            A (n_bins, n_features) DataFrame where each column sums to 1.
+            Features without any values in the samples are removed
+        """
+        sample_ids = self.data.index if sample_ids is None else sample_ids
+        counts = self._histograms(bins, {None: sample_ids})[None]
+        binned = pd.DataFrame(counts, index=bin_range_strings(bins),
+                              columns=self.data.columns)
+        if feature_ids is not None:
+            binned = binned[feature_ids]
+        binned = binned / binned.sum().astype(float)
+        return binned.dropna(how='all', axis=1)
+
     def _threshold(self, data, other=None):
         """Only take features with expression greater than the threshold,
         in at least the minimum number of samples.
@@ -383,7 +470,8 @@ class BaseData(object):
             feature_ids = self.data.columns
         return feature_ids
 
-    def jsd_df(self, groupby=None, n_iter=100, n_bins=10):
+    def jsd_df(self, groupby=None, n_iter=100, n_bins=10, random_state=None,
+               n_jobs=1, chunksize=None):
         """Jensen-Shannon divergence of features across phenotypes
 
         Parameters
@@ -395,6 +483,14 @@ class BaseData(object):
             within-group comparisons
         n_bins : int
             Number of bins to binify the singles data on
+        random_state : None, int or numpy.random.RandomState, optional
+            Seed for the bootstrap resampling of the within-group comparisons
+        n_jobs : int, optional (default=1)
+            Number of processes to spread the comparisons across
+        chunksize : int, optional (default=None)
+            Compare only this many features at a time to bound the memory
+            use on very wide data. By default, derived from
+            ``flotilla.compute.infotheory.JSD_CHUNK_ELEMENTS``
 
         Returns
         -------
@@ -402,12 +498,16 @@ class BaseData(object):
             A (n_features, n_phenotypes^2) dataframe of the JSD between each
             feature between and within phenotypes
         """
-        bins = np.linspace(self.singles.min().min(), self.singles.max().max(),
-                           n_bins)
-        return cross_phenotype_jsd(self.singles, groupby=groupby,
-                                   bins=bins, n_iter=n_iter)
-
-    def jsd_2d(self, groupby=None, n_iter=100, n_bins=10):
+        singles = self.singles
+        bins = np.linspace(singles.min().min(), singles.max().max(), n_bins)
+        counts = self._histograms(bins, singles.groupby(groupby).groups)
+        return cross_phenotype_jsd(singles, groupby=groupby,
+                                   bins=bins, n_iter=n_iter,
+                                   random_state=random_state, n_jobs=n_jobs,
+                                   chunksize=chunksize, counts=counts)
+
+    def jsd_2d(self, groupby=None, n_iter=100, n_bins=10, random_state=None,
+               n_jobs=1, chunksize=None):
         """Mean Jensen-Shannon divergence of features across phenotypes
 
         Parameters
@@ -419,6 +519,14 @@ class BaseData(object):
             within-group comparisons
         n_bins : int
             Number of bins to binify the singles data on
+        random_state : None, int or numpy.random.RandomState, optional
+            Seed for the bootstrap resampling of the within-group comparisons
+        n_jobs : int, optional (default=1)
+            Number of processes to spread the comparisons across
+        chunksize : int, optional (default=None)
+            Compare only this many features at a time to bound the memory
+            use on very wide data. By default, derived from
+            ``flotilla.compute.infotheory.JSD_CHUNK_ELEMENTS``
 
         Returns
         -------
@@ -427,7 +535,45 @@ class BaseData(object):
             between and within phenotypes
         """
         return jsd_df_to_2d(self.jsd_df(groupby=groupby, n_iter=n_iter,
-                                        n_bins=n_bins))
+                                        n_bins=n_bins,
+                                        random_state=random_state,
+                                        n_jobs=n_jobs, chunksize=chunksize))
+
+    def jsd_permutation_test(self, groupby=None, n_permutations=1000,
+                             n_bins=10, random_state=None, n_jobs=1,
+                             chunksize=None):
+        """Significance of the divergence of features between phenotypes
+
+        Parameters
+        ----------
+        groupby : mappable
+            A samples to phenotypes mapping
+        n_permutations : int
+            Number of phenotype label permutations per phenotype pair
+        n_bins : int
+            Number of bins to binify the singles data on
+        random_state : None, int or numpy.random.RandomState, optional
+            Seed for the permutations
+        n_jobs : int, optional (default=1)
+            Number of processes to spread the permutations across
+        chunksize : int, optional (default=None)
+            Test only this many features at a time to bound the memory use
+            on very wide data. By default, derived from
+            ``flotilla.compute.infotheory.JSD_CHUNK_ELEMENTS``
+
+        Returns
+        -------
+        permutation_test : pandas.DataFrame
+            A tidy dataframe of the Jensen-Shannon distance, empirical
+            p-value and Benjamini-Hochberg q-value of each feature between
+            each pair of phenotypes
+        """
+        bins = np.linspace(self.singles.min().min(), self.singles.max().max(),
+                           n_bins)
+        return jsd_permutation_test(self.singles, groupby=groupby, bins=bins,
+                                    n_permutations=n_permutations,
+                                    random_state=random_state, n_jobs=n_jobs,
+                                    chunksize=chunksize)
 
     def plot_classifier(self, trait, sample_ids=None, feature_ids=None,
                         predictor_name=None, standardize=True,
@@ -910,7 +1056,14 @@ class BaseData(object):
             means = means[ind]
 
         if bins is not None:
-            subset = self.binify(subset, bins)
+            measured = self.data.ix[subset.index, subset.columns].notnull()
+            if not standardize and measured.values.all():
+                # Filling with the means changed nothing, so the stored
+                # histograms of the data are those of the subset
+                subset = self._binned(bins, sample_ids=subset.index,
+                                      feature_ids=subset.columns)
+            else:
+                subset = self.binify(subset, bins)
 
         if featurewise:
             subset = subset.T
@@ -1001,7 +1154,26 @@ class BaseData(object):
                                                   linkage_method)
         return subset, row_linkage, col_linkage
 
-    def binify(self, data, bins=None):
+    def binify(self, data=None, bins=None):
+        """Normalized histogram of each feature
+
+        Parameters
+        ----------
+        data : pandas.DataFrame, optional (default=None)
+            A (n_samples, n_features) DataFrame to bin. If None, bin all of
+            :py:attr:`.data`, using the stored histograms
+        bins : iterable
+            Bin edges, including the final bin value
+
+        Returns
+        -------
+        binned : pandas.DataFrame
+            A (n_bins, n_features) DataFrame where each column sums to 1
+        """
+        if data is None:
+            if bins is None:
+                raise ValueError('Must specify "bins"')
+            return self._binned(bins)
         return binify(data, bins).dropna(how='all', axis=1)
 
     def _violinplot(self, feature_id, sample_ids=None,
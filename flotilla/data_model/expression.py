@@ -10,6 +10,7 @@ import sys
 import numpy as np
 
 from .base import BaseData
+from ..compute.expression import two_way_comparisons
 from ..util import timestamp
 
 EXPRESSION_THRESH = -np.inf
@@ -67,3 +68,52 @@ class ExpressionData(BaseData):
             self.data, sample_ids=sample_ids, feature_ids=feature_ids,
             standardize=standardize, metric=metric,
             linkage_method=linkage_method)
+
+    def two_way_comparisons(self, sample_pairs=None, groupby=None,
+                            p_value_cutoff=0.001, local_fraction=0.1,
+                            bonferroni=True, fdr=None, n_jobs=1):
+        """Up- and down-regulated genes of many pairs of samples
+
+        Parameters
+        ----------
+        sample_pairs : list of tuples, optional (default=None)
+            Pairs of (control, treatment) pooled sample ids, or phenotypes
+            if ``groupby`` is provided. If None, compares all pairs
+        groupby : mappable, optional (default=None)
+            A samples to phenotypes mapping. If provided, compares the mean
+            expression of the single cells of each phenotype instead of the
+            pooled samples
+        p_value_cutoff : float, optional (default=0.001)
+            Cutoff for the p-values
+        local_fraction : float, optional (default=0.1)
+            What fraction of genes to use for *local* z-score calculation
+        bonferroni : bool, optional (default=True)
+            Whether or not to use the Bonferonni correction on p-values
+        fdr : float, optional (default=None)
+            If provided, also require the genes to pass Benjamini-Hochberg
+            FDR filtering at this rate
+        n_jobs : int, optional (default=1)
+            Number of processes to spread the pairs across
+
+        Returns
+        -------
+        summary : pandas.DataFrame
+            Number of measured, expressed, up- and down-regulated genes of
+            each (sample1, sample2) pair
+        regulated : pandas.DataFrame
+            A tidy dataframe of the sample1, sample2, feature_id and
+            direction of every differentially expressed gene of every pair
+
+        See Also
+        --------
+        flotilla.compute.expression.two_way_comparisons
+        """
+        if groupby is None:
+            data = self.data_original.ix[self.pooled_samples]
+        else:
+            data = self.data_original.ix[self.single_samples]
+            data = data.groupby(groupby).mean()
+        return two_way_comparisons(
+            data, sample_pairs, p_value_cutoff=p_value_cutoff,
+            local_fraction=local_fraction, bonferroni=bonferroni, fdr=fdr,
+            n_jobs=n_jobs)
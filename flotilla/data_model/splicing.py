@@ -12,18 +12,31 @@ import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy import sparse
 import seaborn as sns
 
 from .base import BaseData
-from ..util import timestamp
+from ..compute.decomposition import DataFrameNMF
+from ..compute.infotheory import bin_range_strings
+from ..compute.splicing import get_switchy_score_order, \
+    estimate_modalities, summed_abs_differences
+from ..util import timestamp, MemoryBoundedCache
 from ..visualize.splicing import lavalamp, hist_single_vs_pooled_diff, \
     lavalamp_pooled_inconsistent
 
 FRACTION_DIFF_THRESH = 0.1
+SWITCHY_SCORE_CACHE_MAX_BYTES = 2 ** 24
+
+
+def _csr_gather(indptr, indices, rows):
+    """Concatenate the column indices of the given rows of a CSR matrix"""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[np.arange(lengths.sum()) + offsets]
 
 
 class SplicingData(BaseData):
-    binned_reducer = None
     raw_reducer = None
 
     n_components = 2
@@ -89,6 +102,159 @@ class SplicingData(BaseData):
         self.included_min = included_min
 
         self.bins = np.arange(0, 1 + self.binsize, self.binsize)
+        self.switchy_score_cache = MemoryBoundedCache(
+            SWITCHY_SCORE_CACHE_MAX_BYTES)
+        self._binned_reducers = {}
+        self._expression_id_index = self._index_expression_ids()
+        self._expression_id_index_source = (
+            self.feature_data, self.feature_expression_id_col)
+
+    @property
+    def binned_reducer(self):
+        """NMF of the binned distributions of all events in the single cells
+
+        Fit once per set of :py:attr:`.bins` and version of the data, and
+        reused by :py:meth:`.nmf_space_positions` and
+        :py:meth:`.nmf_space_transitions`.
+        """
+        key = (self._data_version, tuple(self.bins))
+        if key not in self._binned_reducers:
+            # Forget the reducers of previous versions of the data
+            self._binned_reducers = dict(
+                (k, reducer) for k, reducer in self._binned_reducers.items()
+                if k[0] == self._data_version)
+            binned = self._binned(self.bins, self.single_samples)
+            self._binned_reducers[key] = DataFrameNMF(
+                binned.T, n_components=self.n_components)
+        return self._binned_reducers[key]
+
+    def _nmf_space(self, groupby, n=20):
+        """Positions of all (phenotype, event) distributions in NMF space
+
+        Parameters
+        ----------
+        groupby : mappable
+            A samples to phenotypes mapping
+        n : int
+            Minimum number of samples per phenotype, per event
+
+        Returns
+        -------
+        phenotypes : list
+            Sorted phenotypes of the single cells
+        positions : numpy.array
+            A (n_phenotypes, n_events, n_components) array of the position
+            of each event's distribution in each phenotype. NaN where the
+            event has fewer than ``n`` samples in the phenotype
+        """
+        counts = self._histograms(self.bins,
+                                  self.singles.groupby(groupby).groups)
+        phenotypes = sorted(counts.keys())
+        counts = np.array([counts[phenotype] for phenotype in phenotypes],
+                          dtype=float)
+        n_samples = counts.sum(axis=1)
+        measured = n_samples >= max(n, 1)
+
+        # (n_phenotypes, n_events, n_bins) normalized histograms, of which
+        # all the measured ones are projected with a single transform
+        distributions = counts.transpose(0, 2, 1)[measured] \
+            / n_samples[measured][:, np.newaxis]
+        reducer = self.binned_reducer
+        positions = np.empty(measured.shape + (reducer.n_components,))
+        positions.fill(np.nan)
+        if distributions.shape[0] > 0:
+            positions[measured] = reducer.transform(pd.DataFrame(
+                distributions, columns=bin_range_strings(self.bins))).values
+        return phenotypes, positions
+
+    def nmf_space_positions(self, groupby, n=20):
+        """Positions of the events' distributions in each phenotype in NMF
+
+        Parameters
+        ----------
+        groupby : mappable
+            A samples to phenotypes mapping
+        n : int
+            Minimum number of samples per phenotype, per event
+
+        Returns
+        -------
+        positions : pandas.DataFrame
+            A dataframe with a multiindex of (event, phenotype) and columns
+            of the position in each NMF component
+        """
+        phenotypes, positions = self._nmf_space(groupby, n=n)
+        n_components = positions.shape[-1]
+        events = np.repeat(self.data.columns.values[np.newaxis],
+                           len(phenotypes), axis=0)
+        phenotype_ids = np.repeat(np.array(phenotypes, dtype=object),
+                                  positions.shape[1]).reshape(events.shape)
+        measured = np.isfinite(positions).all(axis=-1)
+        index = pd.MultiIndex.from_arrays([events[measured],
+                                           phenotype_ids[measured]])
+        columns = [DataFrameNMF.relabel_pcs(i) for i in range(n_components)]
+        positions = pd.DataFrame(positions[measured], index=index,
+                                 columns=columns)
+        return positions.sort_index()
+
+    def nmf_space_transitions(self, groupby, phenotype_transitions, n=20):
+        """Distance traveled in NMF space by each event between phenotypes
+
+        Parameters
+        ----------
+        groupby : mappable
+            A samples to phenotypes mapping
+        phenotype_transitions : list of length-2 tuples of str
+            List of ('phenotype1', 'phenotype2') transitions whose change in
+            distribution you are interested in
+        n : int
+            Minimum number of samples per phenotype, per event
+
+        Returns
+        -------
+        transitions : pandas.DataFrame
+            A (n_events, n_transitions) dataframe of the NMF distances of
+            each event. Events without any measured transitions are removed
+        """
+        phenotypes, positions = self._nmf_space(groupby, n=n)
+        phenotype_transitions = list(phenotype_transitions)
+        transitions = np.empty((positions.shape[1],
+                                len(phenotype_transitions)))
+        transitions.fill(np.nan)
+        for i, (phenotype1, phenotype2) in enumerate(phenotype_transitions):
+            if phenotype1 in phenotypes and phenotype2 in phenotypes:
+                difference = positions[phenotypes.index(phenotype2)] \
+                    - positions[phenotypes.index(phenotype1)]
+                transitions[:, i] = np.sqrt((difference ** 2).sum(axis=1))
+        transitions = pd.DataFrame(
+            transitions, index=self.data.columns,
+            columns=pd.MultiIndex.from_tuples(phenotype_transitions))
+        return transitions.dropna(how='all')
+
+    def switchy_score_order(self, psi):
+        """Order of events in a subset of the data by their switchy score
+
+        Orders are stored in :py:attr:`.switchy_score_cache`, keyed by the
+        samples and events of the subset and the version of the data, so
+        plotting the same subset of events again skips the computation.
+
+        Parameters
+        ----------
+        psi : pandas.DataFrame
+            A (n_samples, n_events) subset of :py:attr:`.data`. Must not be
+            modified, or the wrong order will be returned from the cache
+
+        Returns
+        -------
+        order : numpy.array
+            Indices of the columns of ``psi``, in switchy score order
+        """
+        key = (self._data_version, tuple(psi.index), tuple(psi.columns))
+        order = self.switchy_score_cache.get(key)
+        if order is None:
+            order = get_switchy_score_order(psi.values)
+            self.switchy_score_cache.set(key, order, nbytes=order.nbytes)
+        return order
 
     def plot_feature(self, feature_id, sample_ids=None,
                      phenotype_groupby=None,
@@ -133,19 +299,20 @@ class SplicingData(BaseData):
             the fraction diff thresh
         """
         # singles = self._subset(self.data, singles_ids, feature_ids)
-        singles, pooled, not_measured_in_pooled, diff_from_singles = \
-            self._diff_from_singles(data, feature_ids, scaled=True)
+        singles, pooled, not_measured_in_pooled, diff_from_singles, \
+            diff_from_singles_scaled = self._diff_from_singles(data,
+                                                               feature_ids)
 
         try:
-            ind = diff_from_singles.abs() >= fraction_diff_thresh
-            large_diff = diff_from_singles[ind].dropna(axis=1, how='all')
+            ind = diff_from_singles_scaled.abs() >= fraction_diff_thresh
+            large_diff = diff_from_singles_scaled[ind].dropna(axis=1,
+                                                              how='all')
         except AttributeError:
             large_diff = None
         return singles, pooled, not_measured_in_pooled, large_diff
 
     # @memoize
-    def _diff_from_singles(self, data,
-                           feature_ids=None, scaled=True, dropna=True):
+    def _diff_from_singles(self, data, feature_ids=None, dropna=True):
         """Calculate the difference between pooled and singles' psis
 
         Parameters
@@ -154,9 +321,6 @@ class SplicingData(BaseData):
             A (n_samples, n_features) DataFrame
         feature_ids : list-like
             Subset of the features you want
-        scaled : bool
-            If True, then take the average difference between each pooled
-            sample and all singles. If False, then get the summed difference
         dropna : bool
             If True, remove events which were not measured in the pooled
             samples
@@ -170,15 +334,20 @@ class SplicingData(BaseData):
         not_measured_in_pooled : list-like
             List of features not measured in the pooled samples
         diff_from_singles : pandas.DataFrame
-            A (n_pooled, n_features) Dataframe of the summed (or scaled if
-            scaled=True)
+            A (n_pooled, n_features) Dataframe of the summed absolute
+            difference between each pooled sample and all singles
+        diff_from_singles_scaled : pandas.DataFrame
+            A (n_pooled, n_features) Dataframe of the average absolute
+            difference between each pooled sample and all singles
         """
         singles, pooled = self._subset_singles_and_pooled(
             feature_ids, data=data, require_min_samples=False)
         if pooled is None:
             not_measured_in_pooled = None
             diff_from_singles = None
-            return singles, pooled, not_measured_in_pooled, diff_from_singles
+            diff_from_singles_scaled = None
+            return singles, pooled, not_measured_in_pooled, \
+                diff_from_singles, diff_from_singles_scaled
 
         # Make sure "pooled" is always a dataframe
         if isinstance(pooled, pd.Series):
@@ -187,21 +356,74 @@ class SplicingData(BaseData):
         pooled = pooled.dropna(how='all', axis=1)
         not_measured_in_pooled = singles.columns.diff(pooled.columns)
         singles, pooled = singles.align(pooled, axis=1, join='inner')
-        # import pdb; pdb.set_trace()
 
-        diff_from_singles = pooled.apply(
-            lambda x: (singles - x.values).abs().sum(), axis=1)
+        summed, n_singles = summed_abs_differences(singles.values,
+                                                   pooled.values)
+        diff_from_singles = pd.DataFrame(summed, index=pooled.index,
+                                         columns=pooled.columns)
+        diff_from_singles_scaled = diff_from_singles / n_singles.astype(float)
 
-        if scaled:
-            diff_from_singles = \
-                diff_from_singles / singles.count().astype(float)
         if dropna:
             diff_from_singles = diff_from_singles.dropna(axis=1, how='all')
-        return singles, pooled, not_measured_in_pooled, diff_from_singles
+            diff_from_singles_scaled = diff_from_singles_scaled.dropna(
+                axis=1, how='all')
+        return singles, pooled, not_measured_in_pooled, diff_from_singles, \
+            diff_from_singles_scaled
+
+    def modalities(self, groupby=None, sample_ids=None, feature_ids=None,
+                   log_likelihood_ratio_thresh=3, min_samples=10, n_jobs=1):
+        """Splicing modality of every event in every phenotype
+
+        Psi scores are binned on :py:attr:`.bins`, reusing the histograms
+        stored in :py:attr:`.histogram_cache`, and scored against the
+        modality models defined by :py:attr:`.excluded_max` and
+        :py:attr:`.included_min`.
+
+        Parameters
+        ----------
+        groupby : mappable, optional (default=None)
+            A samples to phenotypes mapping. If None, all single cells are
+            one phenotype, "all"
+        sample_ids : list-like, optional (default=None)
+            Which samples to use. If None, use all single cells
+        feature_ids : list-like, optional (default=None)
+            Which events to use. If None, use all
+        log_likelihood_ratio_thresh : float, optional (default=3)
+            Minimum log-likelihood ratio of the best model over the uniform
+            model. Events whose best model doesn't pass this are
+            "multimodal"
+        min_samples : int, optional (default=10)
+            Minimum number of samples of a phenotype with a psi score for an
+            event to be assigned a modality in that phenotype
+        n_jobs : int, optional (default=1)
+            Number of processes to spread the phenotypes across
+
+        Returns
+        -------
+        modalities : pandas.DataFrame
+            A tidy dataframe of the phenotype, feature_id, modality, number
+            of samples and log-likelihood ratio of each event
+        """
+        data = self._subset(self.singles, sample_ids, feature_ids,
+                            require_min_samples=False)
+        if groupby is None:
+            groupby = pd.Series('all', index=self.singles.index)
+        groups = data.groupby(groupby).groups
+        columns = self.data.columns.get_indexer(data.columns)
+        counts = dict((phenotype, phenotype_counts[:, columns])
+                      for phenotype, phenotype_counts in
+                      self._histograms(self.bins, groups).items())
+        return estimate_modalities(
+            data, groupby, self.bins, excluded_max=self.excluded_max,
+            included_min=self.included_min,
+            log_likelihood_ratio_thresh=log_likelihood_ratio_thresh,
+            min_samples=min_samples, n_jobs=n_jobs, counts=counts)
 
     def plot_lavalamp(self, phenotype_to_color, sample_ids=None,
                       feature_ids=None,
                       data=None, groupby=None, order=None):
+        # Only subsets of self.data can use the stored switchy score orders
+        cache_orders = data is None
         if data is None:
             data = self._subset(self.data, sample_ids, feature_ids,
                                 require_min_samples=False)
@@ -230,8 +452,11 @@ class SplicingData(BaseData):
             except KeyError:
                 color = None
             samples = grouped.groups[name]
-            psi = data.ix[samples]
-            lavalamp(psi, color=color, ax=ax)
+            psi = data.ix[samples].dropna(how='all', axis=1)
+            switchy_score_order = self.switchy_score_order(psi) \
+                if cache_orders else None
+            lavalamp(psi, color=color, ax=ax,
+                     switchy_score_order=switchy_score_order)
             ax.set_title(name)
         sns.despine()
         fig.tight_layout()
@@ -265,10 +490,9 @@ class SplicingData(BaseData):
                                         color=None, title='',
                                         hist_kws=None):
         """Plot histogram of distances between singles and pooled"""
-        singles, pooled, not_measured_in_pooled, diff_from_singles = \
-            self._diff_from_singles(data, feature_ids)
-        singles, pooled, not_measured_in_pooled, diff_from_singles_scaled = \
-            self._diff_from_singles(data, feature_ids, scaled=True)
+        singles, pooled, not_measured_in_pooled, diff_from_singles, \
+            diff_from_singles_scaled = self._diff_from_singles(data,
+                                                               feature_ids)
         hist_single_vs_pooled_diff(diff_from_singles,
                                    diff_from_singles_scaled, color=color,
                                    title=title, hist_kws=hist_kws)
@@ -289,7 +513,7 @@ class SplicingData(BaseData):
                            metric='euclidean', linkage_method='median',
                            bins=None, standardize=False):
         if bins is not None:
-            data = self.binify(bins)
+            data = self.binify(bins=bins)
         else:
             data = self.data
         return super(SplicingData, self)._calculate_linkage(
@@ -387,14 +611,166 @@ class SplicingData(BaseData):
             metric=metric, method=method, scale_fig_by_data=scale_fig_by_data,
             norm_features=False, **kwargs)
 
+    @property
+    def expression_id_index(self):
+        """Bidirectional index of splicing events and gene ids
+
+        Splits the comma-separated ``feature_expression_id_col`` of
+        :py:attr:`.feature_data` once, when the data is constructed, and only
+        again if ``feature_data`` or ``feature_expression_id_col`` is
+        replaced.
+
+        Returns
+        -------
+        expression_ids : pandas.Index
+            All gene ids of the events
+        event_to_expression_ids : scipy.sparse.csr_matrix
+            Boolean (n_events, n_genes) mapping of each event, in the order
+            of ``feature_data.index``, to its genes, in the order they are
+            listed
+        expression_to_event_ids : scipy.sparse.csr_matrix
+            The inverse (n_genes, n_events) mapping of each gene to its events
+        """
+        source = (self.feature_data, self.feature_expression_id_col)
+        if any(x is not y for x, y in
+               zip(self._expression_id_index_source, source)):
+            self._expression_id_index = self._index_expression_ids()
+            self._expression_id_index_source = source
+        return self._expression_id_index
+
+    @property
+    def expression_ids(self):
+        """All gene ids of the splicing events"""
+        return self.expression_id_index[0]
+
+    def _index_expression_ids(self):
+        if self.feature_data is not None \
+                and self.feature_expression_id_col is not None:
+            event_ids = self.feature_data.index
+            event_gene_ids = self.feature_data[self.feature_expression_id_col]
+            is_str = event_gene_ids.map(lambda x: isinstance(x, str)).values
+            split = [x.split(',') for x in event_gene_ids.values[is_str]]
+        else:
+            event_ids = pd.Index([])
+            is_str = np.zeros(0, dtype=bool)
+            split = []
+
+        lengths = np.zeros(len(event_ids), dtype=int)
+        lengths[is_str] = [len(x) for x in split]
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        codes, expression_ids = pd.factorize(
+            np.array(list(chain(*split)), dtype=object))
+        expression_ids = pd.Index(expression_ids)
+
+        event_to_expression_ids = sparse.csr_matrix(
+            (np.ones(len(codes), dtype=bool), codes, indptr),
+            shape=(len(event_ids), len(expression_ids)))
+        expression_to_event_ids = event_to_expression_ids.T.tocsr()
+        expression_to_event_ids.sort_indices()
+        return expression_ids, event_to_expression_ids, \
+            expression_to_event_ids
+
+    def event_gene_incidence(self, gene_ids):
+        """Sparse incidence matrix of splicing events and their genes
+
+        Parameters
+        ----------
+        gene_ids : list-like
+            Gene ids of the columns, e.g. the features of the expression data
+
+        Returns
+        -------
+        incidence : scipy.sparse.csr_matrix
+            A boolean (n_events, n_genes) matrix, with rows in the order of
+            the columns of :py:attr:`.data`, which is True where the
+            event's ``feature_expression_id_col`` lists the gene
+        """
+        gene_ids = pd.Index(gene_ids)
+        expression_ids, event_to_expression_ids, _ = self.expression_id_index
+        n_events, n_genes = event_to_expression_ids.shape
+
+        rows = self.feature_data.index.get_indexer(self.data.columns) \
+            if n_events > 0 else -np.ones(self.data.shape[1], dtype=int)
+        measured = rows >= 0
+        select_events = sparse.csr_matrix(
+            (np.ones(measured.sum()),
+             (np.flatnonzero(measured), rows[measured])),
+            shape=(self.data.shape[1], n_events))
+
+        columns = gene_ids.get_indexer(expression_ids)
+        known = columns >= 0
+        select_genes = sparse.csr_matrix(
+            (np.ones(known.sum()), (np.flatnonzero(known), columns[known])),
+            shape=(n_genes, len(gene_ids)))
+
+        incidence = select_events.dot(
+            event_to_expression_ids.astype(float)).dot(select_genes)
+        incidence = incidence.astype(bool).tocsr()
+        incidence.sort_indices()
+        return incidence
+
     def splicing_to_expression_id(self, feature_ids):
-        """Get the gene ids corresponding to the splicing ids provided"""
-        return list(chain(*self.feature_data[self.feature_expression_id_col][
-            feature_ids].str.split(',').dropna().values))
+        """Get the gene ids corresponding to the splicing ids provided
+
+        Parameters
+        ----------
+        feature_ids : list-like
+            Splicing event ids. Ids not in :py:attr:`.feature_data` are
+            ignored
+
+        Returns
+        -------
+        expression_ids : list
+            Gene ids of the events, in the order of the events and of the
+            genes within each event's ``feature_expression_id_col``
+        """
+        expression_ids, event_to_expression_ids, _ = self.expression_id_index
+        if len(expression_ids) == 0:
+            return []
+        rows = self.feature_data.index.get_indexer(feature_ids)
+        indices = _csr_gather(event_to_expression_ids.indptr,
+                              event_to_expression_ids.indices,
+                              rows[rows >= 0])
+        return list(expression_ids[indices])
 
     def expression_to_splicing_id(self, expression_ids):
-        ind = self.feature_data.ensembl_id.map(
-            lambda x: expression_ids.isin(
-                x.split(',')).any() if isinstance(x, str) else False)
+        """Get the splicing ids on any of the gene ids provided
 
-        return self.feature_data.index[ind]
+        Parameters
+        ----------
+        expression_ids : list-like
+            Gene ids, as in ``feature_expression_id_col``. Unknown ids are
+            ignored
+
+        Returns
+        -------
+        feature_ids : pandas.Index
+            Splicing event ids of :py:attr:`.feature_data` on any of the
+            genes, in the order of ``feature_data.index``
+        """
+        index, _, expression_to_event_ids = self.expression_id_index
+        columns = index.get_indexer(pd.Index(expression_ids))
+        rows = _csr_gather(expression_to_event_ids.indptr,
+                           expression_to_event_ids.indices,
+                           columns[columns >= 0])
+        if len(rows) == 0:
+            return self.feature_data.index[:0] \
+                if self.feature_data is not None else pd.Index([])
+        return self.feature_data.index[np.unique(rows)]
+
+    def expression_id_pairs(self):
+        """All pairs of splicing event and gene id, e.g. for joining
+
+        Returns
+        -------
+        pairs : pandas.Series
+            Gene ids, indexed by splicing event id, one row per pair
+        """
+        expression_ids, event_to_expression_ids, _ = self.expression_id_index
+        if len(expression_ids) == 0:
+            return pd.Series([], index=pd.Index([]), dtype=object)
+        event_ids = np.repeat(self.feature_data.index.values,
+                              np.diff(event_to_expression_ids.indptr))
+        return pd.Series(
+            expression_ids[event_to_expression_ids.indices].values,
+            index=event_ids)
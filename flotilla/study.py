@@ -8,7 +8,6 @@ from __future__ import unicode_literals
 from six import iteritems
 
 import inspect
-import itertools
 import json
 import os
 import sys
@@ -29,6 +28,7 @@ from .data_model.splicing import SplicingData, FRACTION_DIFF_THRESH
 from .data_model.supplemental import SupplementalData
 
 from .compute.predict import PredictorConfigManager
+from .compute.splicing import pooled_inconsistent_sweep
 
 from .visualize.color import blue
 from .visualize import ipython_interact
@@ -1141,6 +1141,34 @@ class Study(object):
             self, sample_subset=None, feature_subset=None,
             fraction_diff_thresh=FRACTION_DIFF_THRESH,
             expression_thresh=-np.inf):
+        return self._sweep_pooled_inconsistent(
+            [expression_thresh], sample_subset=sample_subset,
+            feature_subset=feature_subset,
+            fraction_diff_thresh=fraction_diff_thresh).iloc[0]
+
+    def _sweep_pooled_inconsistent(
+            self, expression_threshs, sample_subset=None,
+            feature_subset=None, fraction_diff_thresh=FRACTION_DIFF_THRESH):
+        """Percent of events inconsistent with pooled at each expression thresh
+
+        Splicing events are filtered on the expression of their genes as in
+        :py:meth:`.filter_splicing_on_expression`, but every threshold is
+        calculated in a single pass over the psi scores of each phenotype,
+        sorted by their expression.
+
+        Parameters
+        ----------
+        expression_threshs : list-like
+            Minimum expression values, of the original input
+
+        Returns
+        -------
+        percents : pandas.DataFrame
+            A (n_threshs, n_phenotypes * 2) dataframe of the number of
+            events with a psi score above each threshold, and the percent
+            of events in the pooled samples inconsistent with the singles,
+            of each phenotype
+        """
         celltype_groups = self.metadata.data.groupby(
             self.sample_id_to_phenotype, axis=0)
 
@@ -1150,36 +1178,84 @@ class Study(object):
         else:
             # Plotting all the celltypes
             celltype_samples = self.sample_subset_to_sample_ids(sample_subset)
+        celltype_samples = set(celltype_samples)
 
         feature_ids = self.feature_subset_to_feature_ids(
             'splicing', feature_subset=feature_subset)
+        psi = self.splicing.data
+        psi = psi.ix[:, psi.columns.isin(list(feature_ids))]
+
+        # Thresholds at or below the lowest expression don't filter, so these
+        # also keep the psi scores of events without any measured genes
+        expression_threshs = np.asarray(expression_threshs, dtype=float)
+        min_expression = self.expression.data_original.min().min()
+        filtered = expression_threshs > min_expression
+        threshs = np.where(filtered, expression_threshs, -np.inf)
+        expression = self.splicing_event_expression.ix[psi.index,
+                                                       psi.columns]
+        expression = expression.fillna(-np.inf)
+
+        # Events with a psi score above the threshold, in any sample
+        event_max = expression[psi.notnull()].max().values
+        n_events = np.where(
+            filtered, (event_max >= threshs[:, np.newaxis]).sum(axis=1),
+            psi.shape[1])
 
-        celltype_and_sample_ids = iteritems(celltype_groups.groups)
         index = pd.MultiIndex.from_product([celltype_groups.groups.keys(),
                                             ['n_events', 'percent']])
-        percents = pd.Series(index=index)
-        for i, (phenotype, sample_ids) in enumerate(celltype_and_sample_ids):
-            # import pdb; pdb.set_trace()
-
-            # Assumes all samples of a sample_subset have the same color...
-            # probably wrong
+        percents = pd.DataFrame(index=np.arange(len(threshs)),
+                                columns=index, dtype=float)
+        singles_ids = set(self.splicing.single_samples)
+        pooled_ids = set(self.splicing.pooled_samples)
+        for phenotype, sample_ids in iteritems(celltype_groups.groups):
             sample_ids = celltype_samples.intersection(sample_ids)
             if len(sample_ids) == 0:
                 continue
-            data = self.filter_splicing_on_expression(expression_thresh)
-            data = data.ix[sample_ids, :]
-            if not data.empty:
-                singles, pooled, not_measured_in_pooled, pooled_inconsistent \
-                    = self.splicing.pooled_inconsistent(data, feature_ids,
-                                                        fraction_diff_thresh)
-                percent = self.splicing._divide_inconsistent_and_pooled(
-                    pooled, pooled_inconsistent)
-            else:
-                percent = np.nan
-            percents[phenotype, 'percent'] = percent
-            percents[phenotype, 'n_events'] = data.shape[1]
+            singles = psi.index.isin(list(sample_ids & singles_ids))
+            pooled = psi.index.isin(list(sample_ids & pooled_ids))
+            n_pooled, n_inconsistent = pooled_inconsistent_sweep(
+                psi.values[singles], psi.values[pooled],
+                expression.values[singles], expression.values[pooled],
+                threshs, fraction_diff_thresh=fraction_diff_thresh)
+            percent = np.where(n_pooled > 0,
+                               n_inconsistent / np.maximum(n_pooled, 1)
+                               * 100, 0.)
+            if not pooled.any():
+                percent[:] = np.nan
+            percents[phenotype, 'percent'] = np.where(n_events > 0, percent,
+                                                      np.nan)
+            percents[phenotype, 'n_events'] = n_events
         return percents
 
+    @cached_property()
+    def splicing_event_expression(self):
+        """Expression of the genes of every splicing event in every sample
+
+        Returns
+        -------
+        event_expression : pandas.DataFrame
+            A (n_samples, n_events) dataframe with the axes of the splicing
+            data, of the highest original expression value of the genes of
+            each event. NaN where none of the event's genes were measured
+        """
+        expression = self.expression.data_original
+        incidence = self.splicing.event_gene_incidence(expression.columns)
+        expression = expression.reindex(index=self.splicing.data.index)
+
+        # Gather the expression of every (event, gene) pair, then take the
+        # highest over each event's run of genes
+        gathered = expression.values[:, incidence.indices]
+        has_genes = np.diff(incidence.indptr) > 0
+        event_expression = np.empty(self.splicing.data.shape)
+        event_expression.fill(np.nan)
+        if has_genes.any():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                event_expression[:, has_genes] = np.fmax.reduceat(
+                    gathered, incidence.indptr[:-1][has_genes], axis=1)
+        return pd.DataFrame(event_expression, index=self.splicing.data.index,
+                            columns=self.splicing.data.columns)
+
     def expression_vs_inconsistent_splicing(self, bins=None):
         """Percentage of events inconsistent with pooled at expression threshs
 
@@ -1200,9 +1276,7 @@ class Study(object):
             emax = int(np.ceil(self.expression.data_original.max().max()))
             bins = np.arange(emin, emax)
 
-        expression_vs_inconsistent = pd.Series(bins).apply(
-            lambda x: self.percent_pooled_inconsistent(expression_thresh=x))
-        return expression_vs_inconsistent
+        return self._sweep_pooled_inconsistent(bins)
 
     def plot_expression_vs_inconsistent_splicing(self, bins=None):
 
@@ -1579,24 +1653,6 @@ class Study(object):
         :return:
         :rtype:
         """
-        # Establish common strings
-        splicing_common_id = self.splicing.feature_data[
-            self.splicing.feature_expression_id_col]
-
-        # print("*****************************")
-        # print("splicing data")
-        # print(self.splicing.data.head())
-        # print("*****************************")
-        # print("splicing feature_data")
-        # print(self.splicing.feature_data.head())
-        # print("*****************************")
-        # print("splicing feature_expression_id_col")
-        # print(self.splicing.feature_expression_id_col)
-        # print("*****************************")
-        # print("splicing_common_id")
-        # print(splicing_common_id.head())
-        # print("*****************************")
-
         # Tidify splicing
         splicing = self.splicing.data
         splicing_index_name = self._maybe_get_axis_name(splicing, axis=0)
@@ -1607,16 +1663,8 @@ class Study(object):
                                 value_name='psi',
                                 var_name=splicing_columns_name)
 
-        s = splicing_common_id.dropna()
-
-        # TODO more elegant code
-        templist = [zip([k] * len(v.split(u',')), v.split(u','))
-                    for k, v in iteritems(s)]
-        event_name_to_ensembl_ids = list(itertools.chain(
-            *templist))
-        index, data = zip(*event_name_to_ensembl_ids)
-        event_name_to_ensembl_ids = pd.Series(data, index=index,
-                                              name=self._common_id)
+        event_name_to_ensembl_ids = self.splicing.expression_id_pairs()
+        event_name_to_ensembl_ids.name = self._common_id
 
         rename_columns = {}
         if splicing_index_name == 'index':
@@ -1679,28 +1727,25 @@ class Study(object):
                                               alt_name=self._sample_id)
 
             sample_ids = self.sample_subset_to_sample_ids(sample_subset)
-            splicing_with_expression = \
-                self.tidy_splicing_with_expression.ix[
-                    self.tidy_splicing_with_expression.sample_id.isin(
-                        sample_ids)]
-            ind = splicing_with_expression.expression >= expression_thresh
-            splicing_high_expression = splicing_with_expression.ix[ind]
-            splicing_high_expression = \
-                splicing_high_expression.reset_index().dropna()
-
-            if isinstance(columns, list) or isinstance(index, list):
-                filtered_psi = splicing_high_expression.pivot_table(
-                    columns=columns, index=index, values='psi')
-            else:
-                filtered_psi = splicing_high_expression.pivot(
-                    columns=columns, index=index, values='psi')
+            psi = self.splicing.data
+            rows = psi.index.isin(list(sample_ids))
+            expressed = self.splicing_event_expression.values[rows] \
+                >= expression_thresh
+            filtered_psi = psi.ix[rows].where(expressed)
+            filtered_psi = filtered_psi.dropna(how='all', axis=0).dropna(
+                how='all', axis=1)
+            filtered_psi = filtered_psi.sort_index(axis=0).sort_index(axis=1)
+            if not isinstance(index, list):
+                filtered_psi.index.name = index
+            if not isinstance(columns, list):
+                filtered_psi.columns.name = columns
             return filtered_psi
         else:
             return self.splicing.data
 
     def go_enrichment(self, feature_ids, background=None, domain=None,
                       p_value_cutoff=1000000, min_feature_size=3,
-                      min_background_size=5):
+                      min_background_size=5, data_type='expression'):
         """Calculate gene ontology enrichment of provided features
 
         Parameters
@@ -1720,13 +1765,28 @@ class Study(object):
             to calculate enrichment
         min_background_size : int, optional
             Minimum number of features in the background overlapping a GO Term
+        data_type : 'expression' | 'splicing', optional
+            Which data type ``feature_ids`` and ``background`` are from.
+            Splicing events are cross-referenced to the genes they are on
+
         Returns
         -------
         enrichment : pandas.DataFrame
             A (go_categories, columns) dataframe showing the GO
             enrichment categories that were enriched in the features
         """
-        if background is None:
+        if data_type == 'splicing':
+            if background is None:
+                warnings.warn('No background provided, defaulting to the '
+                              'genes of all splicing events')
+                background = self.splicing.data.columns
+            feature_ids = pd.unique(np.asarray(
+                self.splicing.splicing_to_expression_id(feature_ids),
+                dtype=object))
+            background = pd.unique(np.asarray(
+                self.splicing.splicing_to_expression_id(background),
+                dtype=object))
+        elif background is None:
             warnings.warn('No background provided, defaulting to all '
                           'expressed genes')
             background = self.expression.data.columns
@@ -5,7 +5,7 @@ import numpy.testing as npt
 import pandas as pd
 import pandas.util.testing as pdt
 import pytest
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, NMF
 
 
 @pytest.fixture(params=[None, 2])
@@ -48,6 +48,34 @@ class TestDataFramePCA():
                                true_pca.reduced_space)
 
 
+class TestDataFrameNMF():
+
+    def test_init(self, df_norm):
+
+        from flotilla.compute.decomposition import DataFrameNMF
+
+        df_nonneg = df_norm.abs()
+        test_nmf = DataFrameNMF(df_nonneg, n_components=2)
+
+        true_nmf = NMF(n_components=2)
+        true_nmf.fit(df_nonneg.values)
+        pc_names = ['pc_1', 'pc_2']
+
+        pdt.assert_index_equal(test_nmf.components_.index,
+                               pd.Index(pc_names))
+        pdt.assert_index_equal(test_nmf.components_.columns,
+                               df_nonneg.columns)
+        # NMF's solver isn't bit-for-bit reproducible between fits, so
+        # compare how well the factorizations fit instead
+        npt.assert_allclose(test_nmf.reconstruction_err_,
+                            true_nmf.reconstruction_err_, rtol=1e-2)
+
+        true_nmf.components_ = test_nmf.components_.values
+        true_reduced_space = pd.DataFrame(true_nmf.transform(
+            df_nonneg.values), index=df_nonneg.index, columns=pc_names)
+        pdt.assert_frame_equal(test_nmf.reduced_space, true_reduced_space)
+
+
 # class TestDataFrameICA():
 #     pass
 #
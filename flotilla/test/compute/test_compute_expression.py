@@ -1,14 +1,218 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
 
-# def test_benjamini_hochberg():
-#     pass
-#
-#
-# def test_TwoWayGeneComparisonLocal():
-#     pass
-#
-#
-# def test_differential_expression():
-#     pass
+
+def test_benjamini_hochberg():
+    from flotilla.compute.expression import benjamini_hochberg
+    fdr = 0.1
+
+    p_values = np.random.uniform(size=50) ** 3
+    sigs = benjamini_hochberg(p_values, fdr=fdr)
+
+    n_tests = len(p_values)
+    sorted_p_values = np.sort(p_values)
+    passing = np.flatnonzero(
+        sorted_p_values <= np.arange(1, n_tests + 1) / n_tests * fdr)
+    true_sigs = np.zeros(n_tests, dtype=bool)
+    if len(passing) > 0:
+        true_sigs = p_values <= sorted_p_values[passing.max()]
+    npt.assert_array_equal(sigs, true_sigs)
+
+
+@pytest.fixture(params=[2, 3])
+def n_groups(request):
+    return request.param
+
+
+def test_rank_sum_tests(n_groups):
+    from scipy import stats
+    from flotilla.compute.expression import rank_sum_tests
+
+    groupby = pd.Series(np.arange(30) % n_groups, index=np.arange(30))
+    data = pd.DataFrame(np.random.randint(0, 10, size=(30, 20)).astype(float))
+    data.iloc[:, 10:] = np.random.normal(size=(30, 10))
+    data.iloc[:4, 0] = np.nan
+
+    statistics, p_values = rank_sum_tests(data, groupby)
+
+    for i, (feature_id, x) in enumerate(data.iteritems()):
+        groups = [s.dropna().values for _, s in x.groupby(groupby)]
+        if n_groups == 2:
+            true_statistic, true_p_value = stats.mannwhitneyu(
+                *groups, alternative='two-sided', method='asymptotic')
+        else:
+            true_statistic, true_p_value = stats.kruskal(*groups)
+        npt.assert_allclose(statistics[i], true_statistic)
+        npt.assert_allclose(p_values[i], true_p_value)
+
+
+def test_rank_sum_tests_exact():
+    from scipy import stats
+    from flotilla.compute.expression import rank_sum_tests
+
+    groupby = pd.Series(['a'] * 5 + ['b'] * 7)
+    data = pd.DataFrame(np.random.normal(size=(12, 10)))
+
+    statistics, p_values = rank_sum_tests(data, groupby, method='exact')
+
+    for i, (feature_id, x) in enumerate(data.iteritems()):
+        true_statistic, true_p_value = stats.mannwhitneyu(
+            x[:5], x[5:], alternative='two-sided', method='exact')
+        npt.assert_allclose(statistics[i], true_statistic)
+        npt.assert_allclose(p_values[i], true_p_value)
+
+
+def test_differential_expression():
+    from flotilla.compute.expression import differential_expression, \
+        rank_sum_tests
+
+    groupby = pd.Series(['a'] * 10 + ['b'] * 10 + ['c'] * 10)
+    data = pd.DataFrame(np.random.normal(size=(30, 20)),
+                        columns=['gene_{}'.format(i) for i in range(20)])
+
+    test = differential_expression(data, groupby)
+
+    statistics, p_values = rank_sum_tests(data, groupby)
+    true = pd.DataFrame({'U_statistic': statistics, 'p_value': p_values,
+                         'bonferonni_p_value': p_values * 20},
+                        index=data.columns,
+                        columns=['U_statistic', 'p_value',
+                                 'bonferonni_p_value'])
+    true = true.sort('bonferonni_p_value').reset_index()
+    true = true.rename(columns={'index': 'gene_id'})
+    pdt.assert_frame_equal(test, true)
+
+
+def test_TwoWayGeneComparisonLocal():
+    from scipy import stats
+    from flotilla.compute.expression import TwoWayGeneComparisonLocal
+
+    df = pd.DataFrame(np.random.lognormal(size=(2, 200)) * 10,
+                      index=['sample1', 'sample2'])
+    df.iloc[0, :10] = 0
+    local_fraction = 0.1
+
+    comparison = TwoWayGeneComparisonLocal('sample1', 'sample2', df,
+                                           local_fraction=local_fraction)
+    result = comparison.result_
+
+    n_genes = df.shape[1] - 10
+    local_count = int(np.ceil(n_genes * local_fraction))
+    ranks = result['rank']
+    for g, r in ranks.iteritems():
+        if r < local_count:
+            start, stop = 0, local_count
+        elif r > n_genes - local_count:
+            start, stop = n_genes - local_count, n_genes
+        else:
+            start = r - int(np.floor(local_count / 2.))
+            stop = r + int(np.ceil(local_count / 2.))
+        local = result.log2_ratio[ranks.between(start, stop)]
+        npt.assert_allclose(result.local_mean[g], np.mean(local))
+        npt.assert_allclose(result.local_std[g], np.std(local))
+        npt.assert_allclose(result.pValue[g], stats.norm.pdf(
+            result.log2_ratio[g], np.mean(local), np.std(local)) * n_genes)
+        npt.assert_allclose(result.local_z[g], (
+            result.log2_ratio[g] - np.mean(local)) / np.std(local))
+    assert len(result) == n_genes
+
+
+def test_benjamini_hochberg_q_values():
+    from flotilla.compute.expression import benjamini_hochberg_q_values
+
+    p_values = pd.Series(np.random.uniform(size=50) ** 3)
+    p_values[[3, 10]] = np.nan
+    q_values = benjamini_hochberg_q_values(p_values)
+
+    tested = p_values.dropna()
+    tested = tested.iloc[np.argsort(tested.values)]
+    n_tests = len(tested)
+    true_q_values = pd.Series(np.nan, index=p_values.index)
+    for rank, i in enumerate(tested.index):
+        true_q_values[i] = min(1, min(
+            tested.iloc[j] * n_tests / (j + 1) for j in range(rank, n_tests)))
+
+    pdt.assert_series_equal(q_values, true_q_values)
+    npt.assert_array_equal(
+        benjamini_hochberg_q_values(p_values.values), true_q_values.values)
+
+
+def test_two_way_comparisons(n_jobs):
+    from flotilla.compute.expression import TwoWayGeneComparisonLocal, \
+        two_way_comparisons
+
+    data = pd.DataFrame(np.random.lognormal(size=(4, 100)) * 10,
+                        index=['a', 'b', 'c', 'd'])
+    sample_pairs = [('a', 'b'), ('c', 'a'), ('d', 'b')]
+    p_value_cutoff = 0.5
+
+    summary, regulated = two_way_comparisons(
+        data, sample_pairs, p_value_cutoff=p_value_cutoff, n_jobs=n_jobs,
+        chunksize=2)
+
+    assert summary.index.tolist() == sample_pairs
+    for sample1, sample2 in sample_pairs:
+        comparison = TwoWayGeneComparisonLocal(
+            sample1, sample2, data, p_value_cutoff=p_value_cutoff)
+        pair = regulated[(regulated.sample1 == sample1)
+                         & (regulated.sample2 == sample2)]
+        assert set(pair.feature_id[pair.direction == 'up']) \
+            == comparison.upregulated_genes
+        assert set(pair.feature_id[pair.direction == 'down']) \
+            == comparison.downregulated_genes
+        npt.assert_array_equal(
+            summary.ix[(sample1, sample2)],
+            [comparison.n_genes, len(comparison.expressed_genes),
+             len(comparison.upregulated_genes),
+             len(comparison.downregulated_genes)])
+
+    summary, regulated = two_way_comparisons(data, n_jobs=n_jobs)
+    assert len(summary) == 6
+
+
+@pytest.fixture(params=['all_pairs', 'one_vs_rest', 'explicit'])
+def contrasts(request):
+    if request.param == 'explicit':
+        return [('c', 'a'), ('b', 'rest')]
+    return request.param
+
+
+def test_differential_expression_contrasts(contrasts, n_jobs):
+    from flotilla.compute.expression import \
+        differential_expression_contrasts, rank_sum_tests, \
+        benjamini_hochberg_q_values
+
+    groupby = pd.Series(np.arange(40) % 3, index=np.arange(40)).map(
+        {0: 'a', 1: 'b', 2: 'c'})
+    groupby[39] = np.nan
+    data = pd.DataFrame(np.random.randint(0, 6, size=(40, 15)).astype(float))
+    data.iloc[:, 5:] = np.random.normal(size=(40, 10))
+    data.iloc[:5, 0] = np.nan
+
+    test = differential_expression_contrasts(data, groupby, contrasts,
+                                             n_jobs=n_jobs)
+
+    if contrasts == 'all_pairs':
+        contrasts = [('a', 'b'), ('a', 'c'), ('b', 'c')]
+    elif contrasts == 'one_vs_rest':
+        contrasts = [('a', 'rest'), ('b', 'rest'), ('c', 'rest')]
+    assert len(test) == len(contrasts) * data.shape[1]
+    for group1, group2 in contrasts:
+        if group2 == 'rest':
+            groups = groupby.dropna().where(groupby == group1, 'rest')
+        else:
+            groups = groupby[groupby.isin([group1, group2])]
+        groups = groups.map({group1: 0, group2: 1})
+        statistics, p_values = rank_sum_tests(data.ix[groups.index], groups)
+
+        df = test[(test.group1 == group1) & (test.group2 == group2)]
+        npt.assert_array_equal(df.gene_id, data.columns)
+        npt.assert_allclose(df.U_statistic, statistics)
+        npt.assert_allclose(df.p_value, p_values)
+        npt.assert_allclose(df.q_value, benjamini_hochberg_q_values(p_values))
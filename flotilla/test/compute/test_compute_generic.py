@@ -1,11 +1,87 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+import pandas.util.testing as pdt
+import pytest
+from scipy import stats
+
+
+@pytest.fixture(params=[stats.pearsonr, stats.spearmanr])
+def correlation_method(request):
+    return request.param
+
+
+@pytest.fixture(params=['naive', 'fast'])
+def dcor_method(request):
+    return request.param
+
+
+def _dcov_all(x, y):
+    """Distance statistics from the double-centered distance matrices"""
+    a = np.abs(x[:, np.newaxis] - x[np.newaxis, :])
+    b = np.abs(y[:, np.newaxis] - y[np.newaxis, :])
+    A = a - a.mean(axis=0) - a.mean(axis=1)[:, np.newaxis] + a.mean()
+    B = b - b.mean(axis=0) - b.mean(axis=1)[:, np.newaxis] + b.mean()
+    dc = np.sqrt((A * B).mean())
+    dvx = np.sqrt((A * A).mean())
+    dvy = np.sqrt((B * B).mean())
+    return dc, dc / np.sqrt(dvx * dvy), dvx, dvy
+
+
+@pytest.fixture
+def X():
+    X = pd.DataFrame(np.random.normal(size=(40, 30)),
+                     index=['sample_{}'.format(i) for i in range(40)])
+    X.iloc[:, 3] = np.round(X.iloc[:, 3])
+    X.iloc[:30, 5] = np.nan
+    X.iloc[::4, 6:10] = np.nan
+    return X
+
+
+@pytest.fixture
+def y(X):
+    y = pd.Series(np.random.uniform(size=40), index=X.index, name='event')
+    y[::7] = np.nan
+    return y
+
+
+def test_get_regressor(X, y):
+    from flotilla.compute.generic import get_regressor
+    from sklearn.ensemble import ExtraTreesRegressor
+
+    x = X.fillna(0)
+    y = y.fillna(0)
+    clf, oob_scores = get_regressor(x, y, n_estimators=20, n_tries=3,
+                                    n_jobs=2, margin=np.inf)
+
+    assert list(oob_scores.columns) == [4, 8, 12, 16, 20]
+    for i, score in oob_scores[20].iteritems():
+        true = ExtraTreesRegressor(n_estimators=20, oob_score=True,
+                                   bootstrap=True, max_features='sqrt',
+                                   random_state=i).fit(x, y)
+        npt.assert_allclose(score, true.oob_score_)
+    assert clf.oob_score_ == oob_scores[20].max()
+    pdt.assert_index_equal(clf.feature_importances.index, x.columns)
+
+
+def test_get_regressor_early_stopping(X, y):
+    from flotilla.compute.generic import get_regressor
+
+    x = X.fillna(0)
+    y = y.fillna(0)
+    clf, oob_scores = get_regressor(x, y, n_estimators=20, n_tries=4,
+                                    margin=0)
+
+    # Only the tries tied with the best keep growing after each stage
+    for previous, n in zip(oob_scores.columns[:-1], oob_scores.columns[1:]):
+        kept = oob_scores[previous] == oob_scores[previous].max()
+        assert oob_scores[n].notnull().equals(kept)
+    assert clf.oob_score_ == oob_scores.iloc[:, -1].max()
+
 
-# def test_get_regressor():
-#     pass
-#
-#
 # def test_get_boosting_regressor():
 #     pass
 #
@@ -14,10 +90,15 @@ from __future__ import (absolute_import, division,
 #     pass
 #
 #
-# def test_get_slope():
-#     pass
-#
-#
+def test_get_slope():
+    from flotilla.compute.generic import get_slope
+
+    x = np.random.normal(size=20)
+    y = x * 2 + np.random.normal(size=20)
+
+    npt.assert_allclose(get_slope(x, y), stats.linregress(x, y)[0])
+
+
 # def test_do_r():
 #     pass
 #
@@ -26,26 +107,128 @@ from __future__ import (absolute_import, division,
 #     pass
 #
 #
-# def test_get_dcor():
-#     pass
-#
-#
-# def test_apply_calc_rs():
-#     pass
-#
-#
-# def test_apply_calc_robust():
-#     pass
-#
-#
-# def test_apply_calc_slope():
-#     pass
-#
-#
-# def test_apply_dcor():
-#     pass
-#
-#
+def test_get_dcor():
+    from flotilla.compute.generic import get_dcor
+
+    x = np.random.normal(size=20)
+    y = x ** 2 + np.random.normal(size=20)
+
+    npt.assert_allclose(get_dcor(x, y), _dcov_all(x, y))
+
+
+def test_distance_correlation(X, y, dcor_method):
+    from flotilla.compute.generic import distance_correlation
+
+    test = distance_correlation(X, y.round(1), method=dcor_method,
+                                chunksize=7)
+
+    assert list(test.columns) == ['dc', 'dr', 'dvx', 'dvy']
+    for feature_id, x in X.iteritems():
+        measured = (x.notnull() & y.notnull()).values
+        true = _dcov_all(x.values[measured], y.round(1).values[measured])
+        npt.assert_allclose(test.ix[feature_id], true, rtol=1e-8)
+
+
+def test_distance_correlation_n_jobs(X, y):
+    from flotilla.compute.generic import distance_correlation
+
+    test = distance_correlation(X, y, chunksize=4, n_jobs=2)
+
+    pdt.assert_frame_equal(test, distance_correlation(X, y))
+
+
+def test_correlations(X, y, correlation_method):
+    from flotilla.compute.generic import correlations, do_r
+
+    Y = pd.DataFrame({'event1': y, 'event2': X.iloc[:, 0] ** 2})
+    r, p = correlations(X, Y, method=correlation_method)
+
+    assert r.shape == (X.shape[1], 2)
+    for feature_id, x in X.iteritems():
+        for event_id, y_ in Y.iteritems():
+            true_r, true_p = do_r(x, y_, method=correlation_method)
+            npt.assert_allclose(r.ix[feature_id, event_id], true_r)
+            npt.assert_allclose(p.ix[feature_id, event_id], true_p)
+    assert r.iloc[5].isnull().all()
+
+
+def test_apply_calc_rs(X, y, correlation_method):
+    from flotilla.compute.generic import apply_calc_rs, do_r
+
+    r, p = apply_calc_rs(X, y, method=correlation_method)
+
+    true_r, true_p = zip(*[do_r(x, y, method=correlation_method)
+                           for _, x in X.iteritems()])
+    pdt.assert_series_equal(r, pd.Series(true_r, index=X.columns,
+                                         name=y.name))
+    pdt.assert_series_equal(p, pd.Series(true_p, index=X.columns,
+                                         name=y.name))
+
+
+def test_robust_linear_regression(X, y):
+    import statsmodels.api as sm
+    from flotilla.compute.generic import robust_linear_regression
+
+    X = X.copy()
+    X.iloc[:, 1] = y * 3 + np.random.standard_t(2, size=len(y))
+    results = robust_linear_regression(X, y)
+
+    for feature_id, x in X.iteritems():
+        if (x.notnull() & y.notnull()).sum() < 3:
+            assert results.ix[feature_id].isnull().all()
+            continue
+        r = sm.RLM(y.values, sm.add_constant(x.values),
+                   missing='drop').fit()
+        true = [r.params[0], r.params[1], r.tvalues[0], r.tvalues[1],
+                r.pvalues[0], r.pvalues[1]]
+        npt.assert_allclose(results.ix[feature_id], true, rtol=1e-5)
+
+
+def test_apply_calc_robust(X, y):
+    from flotilla.compute.generic import apply_calc_robust, \
+        robust_linear_regression
+
+    test = apply_calc_robust(X, y)
+
+    results = robust_linear_regression(X, y)
+    for test_series, column in zip(
+            test, ['intercept', 'slope', 'intercept_t', 'intercept_p']):
+        pdt.assert_series_equal(test_series, results[column].rename(y.name))
+
+
+def test_linear_regression(X, y):
+    from flotilla.compute.generic import linear_regression
+
+    Y = pd.DataFrame({'event1': y, 'event2': X.iloc[:, 0] * 2 + 1})
+    test = linear_regression(X, Y)
+
+    for feature_id, x in X.iteritems():
+        for event_id, y_ in Y.iteritems():
+            measured = x.notnull() & y_.notnull()
+            true = stats.linregress(x[measured], y_[measured])
+            npt.assert_allclose([t.ix[feature_id, event_id] for t in test],
+                                true[:5], atol=1e-8)
+
+
+def test_apply_calc_slope(X, y):
+    from flotilla.compute.generic import apply_calc_slope, linear_regression
+
+    test = apply_calc_slope(X, y)
+
+    pdt.assert_series_equal(test, linear_regression(X, y)[0])
+    assert test.name == y.name
+
+
+def test_apply_dcor(X, y):
+    from flotilla.compute.generic import apply_dcor, distance_correlation
+
+    test = apply_dcor(X, y)
+
+    results = distance_correlation(X, y)
+    for test_series, column in zip(test, ['dc', 'dr', 'dvx', 'dvy']):
+        pdt.assert_series_equal(test_series, results[column].rename(y.name))
+
+
 # def test_dropna_mean():
 #     pass
 #
@@ -54,5 +237,50 @@ from __future__ import (absolute_import, division,
 #     pass
 #
 #
-# def test_spearmanr_dataframe():
-#     pass
+def test_spearmanr_dataframe():
+    from flotilla.compute.generic import spearmanr_dataframe
+
+    A = pd.DataFrame(np.random.randn(100).reshape(20, 5))
+    B = pd.DataFrame(np.random.randn(220).reshape(20, 11))
+    spearman_r, spearman_p = spearmanr_dataframe(A, B, block_size=2)
+
+    assert spearman_r.shape == (11, 5)
+    for a, x in A.iteritems():
+        for b, y in B.iteritems():
+            true_r, true_p = stats.spearmanr(x, y)
+            npt.assert_allclose(spearman_r.ix[b, a], true_r)
+            npt.assert_allclose(spearman_p.ix[b, a], true_p)
+
+
+def test_spearmanr_dataframe_missing():
+    from flotilla.compute.generic import spearmanr_dataframe
+
+    A = pd.DataFrame(np.random.randn(100).reshape(20, 5))
+    B = pd.DataFrame(np.random.randn(220).reshape(20, 11))
+    A.iloc[::3, 1] = np.nan
+    B.iloc[1::4, 2:5] = np.nan
+    spearman_r, spearman_p = spearmanr_dataframe(A, B, block_size=2)
+
+    for a, x in A.iteritems():
+        for b, y in B.iteritems():
+            measured = x.notnull() & y.notnull()
+            true_r, true_p = stats.spearmanr(x[measured], y[measured])
+            npt.assert_allclose(spearman_r.ix[b, a], true_r, atol=1e-12)
+            npt.assert_allclose(spearman_p.ix[b, a], true_p)
+
+
+def test_spearmanr_dataframe_top_k():
+    from flotilla.compute.generic import spearmanr_dataframe
+
+    A = pd.DataFrame(np.random.randn(100).reshape(20, 5))
+    B = pd.DataFrame(np.random.randn(220).reshape(20, 11))
+    spearman_r, spearman_p = spearmanr_dataframe(A, B)
+    test_r, test_p = spearmanr_dataframe(A, B, top_k=3, block_size=2)
+
+    for a in A.columns:
+        # Ties of the absolute correlations stay in the order of B
+        order = np.argsort(-spearman_r[a].abs().values, kind='mergesort')
+        top = spearman_r.index[order[:3]]
+        npt.assert_array_equal(test_r[a].index, top)
+        npt.assert_allclose(test_r[a].values, spearman_r[a][top].values)
+        npt.assert_allclose(test_p[a].values, spearman_p[a][top].values)
@@ -59,6 +59,23 @@ def test_binify(bins, df1):
     pdt.assert_frame_equal(binned, true_binned)
 
 
+def test_binify_counts_with_nan(bins, df1):
+    from flotilla.compute.infotheory import bin_range_strings, binify
+
+    df = df1.copy()
+    df.iloc[:3, 0] = np.nan
+    df.iloc[:, 1] = np.nan
+    df.iloc[3, 2] = bins[-1]
+
+    binned = binify(df, bins, normalize=False)
+
+    true_binned = df.apply(
+        lambda x: pd.Series(np.histogram(x.dropna(), bins=bins)[0]))
+    true_binned.index = bin_range_strings(bins)
+
+    pdt.assert_frame_equal(binned, true_binned)
+
+
 def test_kld(p, q):
     from flotilla.compute.infotheory import kld
 
@@ -100,3 +117,170 @@ def test_entropy(p, base):
     true_result = -((np.log(p) / np.log(base)) * p).sum(axis=0)
 
     pdt.assert_series_equal(result, true_result)
+
+
+@pytest.fixture
+def groupby(df1):
+    return pd.Series(['a'] * 4 + ['b'] * 6, index=df1.index)
+
+
+def test__bootstrap_weights():
+    from flotilla.compute.infotheory import _bootstrap_weights
+
+    n_samples, n_iter = 9, 20
+    weights1, weights2 = _bootstrap_weights(n_samples, n_iter,
+                                            np.random.RandomState(0))
+
+    npt.assert_equal(weights1.shape, (n_iter, n_samples))
+    npt.assert_array_equal(weights1.sum(axis=1), 5)
+    npt.assert_array_equal(weights2.sum(axis=1), 4)
+
+    # The two halves of each iteration never share a sample
+    assert not np.any((weights1 > 0) & (weights2 > 0))
+
+
+def test_cross_phenotype_jsd(df1, bins, groupby, n_jobs):
+    from flotilla.compute.infotheory import (binify_and_jsd,
+                                             cross_phenotype_jsd,
+                                             _bootstrap_weights,
+                                             BOOTSTRAP_BLOCK_SIZE)
+    n_iter = 15
+    result = cross_phenotype_jsd(df1, groupby, bins, n_iter=n_iter,
+                                 random_state=0, n_jobs=n_jobs)
+
+    # Bootstrap each group one iteration at a time with the same draws
+    random_state = np.random.RandomState(0)
+    block_sizes = [BOOTSTRAP_BLOCK_SIZE, n_iter - BOOTSTRAP_BLOCK_SIZE]
+    seriess = []
+    for phenotype, df in df1.groupby(groupby):
+        seeds = random_state.randint(np.iinfo(np.int32).max, size=2)
+        iterations = []
+        for size, seed in zip(block_sizes, seeds):
+            weights1, weights2 = _bootstrap_weights(
+                df.shape[0], size, np.random.RandomState(seed))
+            iterations.extend(binify_and_jsd(
+                df.iloc[np.repeat(np.arange(df.shape[0]), w1)],
+                df.iloc[np.repeat(np.arange(df.shape[0]), w2)], None, bins)
+                for w1, w2 in zip(weights1, weights2))
+        series = pd.concat(iterations, axis=1).mean(axis=1)
+        series.name = (phenotype, phenotype)
+        seriess.append(series)
+    df_a, df_b = [df for phenotype, df in df1.groupby(groupby)]
+    seriess.insert(1, binify_and_jsd(df_a, df_b, ('a', 'b'), bins))
+    true_result = pd.concat(seriess, axis=1)
+
+    pdt.assert_frame_equal(result, true_result)
+
+
+def test_cross_phenotype_jsd_random_state(df1, bins, groupby):
+    from flotilla.compute.infotheory import cross_phenotype_jsd
+
+    result1 = cross_phenotype_jsd(df1, groupby, bins, n_iter=5,
+                                  random_state=1)
+    result2 = cross_phenotype_jsd(df1, groupby, bins, n_iter=5,
+                                  random_state=1)
+    pdt.assert_frame_equal(result1, result2)
+
+
+@pytest.fixture(params=[1, 3, 20])
+def chunksize(request):
+    return request.param
+
+
+def test_cross_phenotype_jsd_chunksize(df1, bins, groupby, chunksize):
+    from flotilla.compute.infotheory import cross_phenotype_jsd
+
+    result = cross_phenotype_jsd(df1, groupby, bins, n_iter=15,
+                                 random_state=0, chunksize=chunksize)
+    true_result = cross_phenotype_jsd(df1, groupby, bins, n_iter=15,
+                                      random_state=0)
+    pdt.assert_frame_equal(result, true_result)
+
+
+def test_jsd_permutation_test(df1, bins, groupby, n_jobs):
+    from flotilla.compute.infotheory import (binify_and_jsd,
+                                             jsd_permutation_test)
+
+    n_permutations = 20
+    result = jsd_permutation_test(df1, groupby, bins,
+                                  n_permutations=n_permutations,
+                                  random_state=0, n_jobs=n_jobs)
+
+    df_a, df_b = [df for phenotype, df in df1.groupby(groupby)]
+    observed = binify_and_jsd(df_a, df_b, None, bins)
+
+    # Shuffle the labels one permutation at a time with the same draws
+    seed = np.random.RandomState(0).randint(np.iinfo(np.int32).max, size=1)
+    random_state = np.random.RandomState(seed[0])
+    both = pd.concat([df_a, df_b])
+    labels = np.argsort(random_state.rand(n_permutations, both.shape[0]),
+                        axis=1)
+    n_extreme = sum(
+        binify_and_jsd(both.iloc[ind[:df_a.shape[0]]],
+                       both.iloc[ind[df_a.shape[0]:]], None, bins) >=
+        observed - 1e-10 for ind in labels)
+    true_p_values = (1 + n_extreme) / (1. + n_permutations)
+
+    npt.assert_array_equal(result.columns, ['phenotype1', 'phenotype2',
+                                            'feature_id', 'jsd', 'p_value',
+                                            'q_value'])
+    npt.assert_array_equal(result.feature_id, df1.columns)
+    npt.assert_allclose(result.jsd, observed)
+    npt.assert_allclose(result.p_value, true_p_values)
+    assert (result.q_value >= result.p_value).all()
+
+
+def test_jsd_permutation_test_chunksize(df1, bins, groupby, chunksize):
+    from flotilla.compute.infotheory import jsd_permutation_test
+
+    result = jsd_permutation_test(df1, groupby, bins, n_permutations=20,
+                                  random_state=0, chunksize=chunksize)
+    true_result = jsd_permutation_test(df1, groupby, bins, n_permutations=20,
+                                       random_state=0)
+    pdt.assert_frame_equal(result, true_result)
+
+
+def test_jsd_default_chunksize(df1, bins, groupby, monkeypatch):
+    import flotilla.compute.infotheory as infotheory
+
+    true_jsd = infotheory.cross_phenotype_jsd(df1, groupby, bins, n_iter=5,
+                                              random_state=0)
+    true_test = infotheory.jsd_permutation_test(
+        df1, groupby, bins, n_permutations=20, random_state=0)
+
+    # Only the one-hot bin codes of three features fit at a time
+    n_bins = len(bins) - 1
+    monkeypatch.setattr(infotheory, 'JSD_CHUNK_ELEMENTS',
+                        3 * df1.shape[0] * n_bins)
+    assert infotheory._jsd_chunksize(df1.shape[0], n_bins) == 3
+
+    pdt.assert_frame_equal(infotheory.cross_phenotype_jsd(
+        df1, groupby, bins, n_iter=5, random_state=0), true_jsd)
+    pdt.assert_frame_equal(infotheory.jsd_permutation_test(
+        df1, groupby, bins, n_permutations=20, random_state=0), true_test)
+
+
+@pytest.fixture(params=[np.float64, np.float32])
+def dtype(request):
+    return request.param
+
+
+def test__jsd(p, q, dtype):
+    from flotilla.compute.infotheory import _jsd, _kld
+
+    p = p.values.astype(dtype)
+    q = q.values.astype(dtype)
+    result = _jsd(p, q)
+
+    m = 0.5 * (p + q)
+    true_result = 0.5 * _kld(p, m) + 0.5 * _kld(q, m)
+
+    assert result.dtype == dtype
+    npt.assert_allclose(result, true_result, rtol=1e-4, atol=1e-6)
+
+
+def test_jsd_not_prob_dist(p, q):
+    from flotilla.compute.infotheory import jsd
+
+    assert np.isnan(jsd(p * 2, q))
+    assert np.isnan(jsd(p, -q))
@@ -44,3 +44,97 @@ def test_get_switchy_score_order(splicing_data):
     true_score_order = np.argsort(switchy_scores)
 
     npt.assert_array_equal(test_score_order, true_score_order)
+
+
+def test_switchy_scores(splicing_data):
+    from flotilla.compute.splicing import switchy_score, switchy_scores
+
+    test_scores = switchy_scores(splicing_data)
+
+    true_scores = np.apply_along_axis(switchy_score, axis=0,
+                                      arr=splicing_data)
+    npt.assert_allclose(test_scores, true_scores)
+
+
+def test_switchy_scores_all_nan():
+    from flotilla.compute.splicing import switchy_scores
+
+    x = np.array([[0.1, np.nan], [0.9, np.nan]])
+    test_scores = switchy_scores(x)
+
+    assert not np.isnan(test_scores[0])
+    assert np.isnan(test_scores[1])
+
+
+def test_modality_models():
+    from flotilla.compute.splicing import modality_models, MODALITIES
+
+    models = modality_models(excluded_max=0.2, included_min=0.8, mass=0.9)
+
+    assert set(models.keys()) == set(MODALITIES)
+    npt.assert_allclose(models['~0'].cdf(0.2), 0.9)
+    npt.assert_allclose(models['~1'].sf(0.8), 0.9)
+
+
+def test_estimate_modalities(modality_models, n_jobs):
+    import pandas as pd
+    import pandas.util.testing as pdt
+    from flotilla.compute.splicing import estimate_modalities
+    from flotilla.compute.infotheory import _bin_codes, _count_bin_codes
+
+    random_state = np.random.RandomState(0)
+    names = {'Psi~0': '~0', 'Psi~1': '~1', 'middle': 'middle',
+             'bimodal': 'bimodal', 'ambiguous': 'multimodal'}
+    true_modalities = pd.Series(
+        [names[name] for name in sorted(names)] * 4,
+        index=['event{}'.format(i) for i in range(20)])
+    n = 40
+    data = pd.DataFrame(
+        np.vstack([modality_models[name].rvs(2 * n,
+                                             random_state=random_state)
+                   for name in sorted(names)] * 4).T,
+        columns=true_modalities.index)
+    data.iloc[:n - 5, -1] = np.nan
+    groupby = pd.Series(['a'] * n + ['b'] * n, index=data.index)
+    bins = np.arange(0, 1.1, 0.1)
+
+    test_modalities = estimate_modalities(data, groupby, bins,
+                                          n_jobs=n_jobs)
+
+    # The last event only has 5 samples in phenotype "a"
+    assert len(test_modalities) == 2 * len(data.columns) - 1
+    assert set(test_modalities.phenotype) == set(['a', 'b'])
+    npt.assert_array_equal(
+        test_modalities.modality.values,
+        true_modalities[test_modalities.feature_id].values)
+
+    codes = _bin_codes(data.values, bins)
+    counts = dict((phenotype, _count_bin_codes(codes[indices], 10))
+                  for phenotype, indices in
+                  data.groupby(groupby).indices.items())
+    pdt.assert_frame_equal(
+        estimate_modalities(data, groupby, bins, counts=counts),
+        test_modalities)
+
+
+def test_summed_abs_differences():
+    from flotilla.compute.splicing import summed_abs_differences
+
+    random_state = np.random.RandomState(0)
+    x = random_state.uniform(size=(30, 20))
+    x[random_state.uniform(size=x.shape) < 0.3] = np.nan
+    x[:, 0] = np.nan
+    y = random_state.uniform(size=(3, 20))
+    y[random_state.uniform(size=y.shape) < 0.2] = np.nan
+    y[0, 1] = x[np.isfinite(x[:, 1]), 1][0]
+    y[1, 2] = -1
+
+    test_summed, test_n_measured = summed_abs_differences(x, y)
+
+    true_summed = np.array([np.nansum(np.abs(x - row), axis=0)
+                            for row in y])
+    true_n_measured = np.isfinite(x).sum(axis=0)
+    true_summed[np.isnan(y)] = np.nan
+    true_summed[:, true_n_measured == 0] = np.nan
+    npt.assert_allclose(test_summed, true_summed)
+    npt.assert_array_equal(test_n_measured, true_n_measured)
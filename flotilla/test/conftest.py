@@ -29,6 +29,12 @@ def RANDOM_STATE():
     return 0
 
 
+@fixture(params=[1, 2])
+def n_jobs(request):
+    """Number of processes to spread parallel computations across"""
+    return request.param
+
+
 #######################################################
 # samples
 ########
@@ -32,3 +32,16 @@ class TestExpressionData:
         pdt.assert_frame_equal(expression.data_original,
                                expression_data_no_na)
         pdt.assert_frame_equal(expression.data, data)
+
+    def test_two_way_comparisons(self, expression_data_no_na, groupby):
+        from flotilla.data_model import ExpressionData
+        from flotilla.compute.expression import two_way_comparisons
+
+        expression = ExpressionData(expression_data_no_na.copy())
+        test_summary, test_regulated = expression.two_way_comparisons(
+            groupby=groupby)
+
+        means = expression_data_no_na.groupby(groupby).mean()
+        true_summary, true_regulated = two_way_comparisons(means)
+        pdt.assert_frame_equal(test_summary, true_summary)
+        pdt.assert_frame_equal(test_regulated, true_regulated)
@@ -5,11 +5,15 @@ No computation or visualization tests yet.
 
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
+from itertools import chain
 
 import matplotlib.pyplot as plt
 import numpy as np
+import numpy.testing as npt
+import pandas as pd
 import pandas.util.testing as pdt
 import pytest
+from six import iteritems
 
 
 @pytest.fixture
@@ -80,6 +84,156 @@ class TestSplicingData:
         splicing.plot_lavalamp(group_to_color)
         plt.close('all')
 
+    def test_modalities(self, splicing, groupby):
+        from flotilla.compute.splicing import estimate_modalities
+
+        test_modalities = splicing.modalities(groupby)
+
+        true_modalities = estimate_modalities(
+            splicing.singles, groupby, splicing.bins,
+            excluded_max=splicing.excluded_max,
+            included_min=splicing.included_min)
+        pdt.assert_frame_equal(test_modalities, true_modalities)
+
+    def test_nmf_space_positions(self, splicing, groupby):
+        n = 5
+        test_positions = splicing.nmf_space_positions(groupby, n=n)
+
+        reducer = splicing.binned_reducer
+        singles = splicing.singles
+        sample_id_to_phenotype = pd.Series(groupby)
+        for (event, phenotype), position in test_positions.iterrows():
+            sample_ids = sample_id_to_phenotype.index[
+                sample_id_to_phenotype == phenotype]
+            psi = singles.ix[singles.index.isin(sample_ids), event]
+            assert psi.count() >= n
+            binned = splicing.binify(psi.to_frame(), splicing.bins)
+            true_position = reducer.transform(binned.T).iloc[0]
+            npt.assert_allclose(position.values, true_position.values)
+        assert splicing.binned_reducer is reducer
+
+    def test_nmf_space_transitions(self, splicing, groupby):
+        phenotypes = sorted(set(pd.Series(groupby)[splicing.singles.index]))
+        phenotype_transitions = list(zip(phenotypes[:-1], phenotypes[1:]))
+
+        test_transitions = splicing.nmf_space_transitions(
+            groupby, phenotype_transitions, n=5)
+
+        positions = splicing.nmf_space_positions(groupby, n=5)
+        for event, distances in test_transitions.iterrows():
+            for (phenotype1, phenotype2), distance in distances.iteritems():
+                try:
+                    true_distance = np.linalg.norm(
+                        positions.ix[(event, phenotype2)]
+                        - positions.ix[(event, phenotype1)])
+                except KeyError:
+                    assert np.isnan(distance)
+                else:
+                    npt.assert_allclose(distance, true_distance)
+
+    def test__diff_from_singles(self, splicing):
+        singles, pooled, not_measured_in_pooled, diff_from_singles, \
+            diff_from_singles_scaled = splicing._diff_from_singles(
+                splicing.data)
+        if pooled is None:
+            assert diff_from_singles is None
+            assert diff_from_singles_scaled is None
+            return
+
+        pooled = pooled.dropna(how='all', axis=1)
+        true_diff = pooled.apply(
+            lambda x: (singles - x.values).abs().sum(), axis=1)
+        true_diff[pooled.isnull()] = np.nan
+        true_diff = true_diff.dropna(axis=1, how='all')
+        true_diff_scaled = (true_diff / singles.count().astype(float)).dropna(
+            axis=1, how='all')
+
+        pdt.assert_frame_equal(diff_from_singles, true_diff)
+        pdt.assert_frame_equal(diff_from_singles_scaled, true_diff_scaled)
+
+    def test_event_gene_incidence(self, splicing):
+        if splicing.feature_data is None:
+            event_gene_ids = pd.Series(index=splicing.data.columns)
+        else:
+            event_gene_ids = splicing.feature_data[
+                splicing.feature_expression_id_col].reindex(
+                splicing.data.columns)
+        gene_ids = sorted(set(','.join(event_gene_ids.dropna()).split(',')))
+        gene_ids = [gene for gene in gene_ids[::2] if gene] + ['not_a_gene']
+
+        test_incidence = splicing.event_gene_incidence(gene_ids).toarray()
+
+        assert test_incidence.shape == (splicing.data.shape[1],
+                                        len(gene_ids))
+        for i, event in enumerate(splicing.data.columns):
+            try:
+                event_genes = event_gene_ids[event].split(',')
+            except AttributeError:
+                event_genes = []
+            true_row = [gene in event_genes for gene in gene_ids]
+            npt.assert_array_equal(test_incidence[i], true_row)
+
+    def test_splicing_to_expression_id(self, splicing):
+        if splicing.feature_data is None:
+            assert splicing.splicing_to_expression_id(
+                splicing.data.columns) == []
+            return
+        event_gene_ids = splicing.feature_data[
+            splicing.feature_expression_id_col]
+        feature_ids = list(splicing.data.columns[::3]) + ['not_an_event']
+
+        test_ids = splicing.splicing_to_expression_id(feature_ids)
+
+        true_ids = list(chain(*event_gene_ids.reindex(
+            feature_ids).dropna().str.split(',').values))
+        assert test_ids == true_ids
+
+    def test_expression_to_splicing_id(self, splicing):
+        if splicing.feature_data is None:
+            assert len(splicing.expression_to_splicing_id(['gene'])) == 0
+            return
+        event_gene_ids = splicing.feature_data[
+            splicing.feature_expression_id_col]
+        expression_ids = pd.Index(
+            list(splicing.expression_ids[::2]) + ['not_a_gene'])
+
+        test_ids = splicing.expression_to_splicing_id(expression_ids)
+
+        ind = event_gene_ids.map(
+            lambda x: expression_ids.isin(x.split(',')).any()
+            if isinstance(x, str) else False)
+        true_ids = splicing.feature_data.index[ind.values.astype(bool)]
+        pdt.assert_index_equal(test_ids, true_ids)
+
+    def test_expression_id_pairs(self, splicing):
+        test_pairs = splicing.expression_id_pairs()
+
+        if splicing.feature_data is None:
+            assert len(test_pairs) == 0
+            return
+        s = splicing.feature_data[splicing.feature_expression_id_col].dropna()
+        pairs = [(k, gene) for k, v in iteritems(s) for gene in v.split(',')]
+        index, data = zip(*pairs)
+        true_pairs = pd.Series(data, index=index)
+        pdt.assert_series_equal(test_pairs, true_pairs)
+
+    def test_switchy_score_order(self, splicing):
+        from flotilla.compute.splicing import get_switchy_score_order
+
+        psi = splicing.data.dropna(how='all', axis=1)
+        test_order = splicing.switchy_score_order(psi)
+        true_order = get_switchy_score_order(psi.values)
+
+        np.testing.assert_array_equal(test_order, true_order)
+        assert len(splicing.switchy_score_cache) == 1
+
+        splicing.switchy_score_order(psi)
+        assert len(splicing.switchy_score_cache) == 1
+
+        splicing.data = splicing.data.copy()
+        splicing.switchy_score_order(psi)
+        assert len(splicing.switchy_score_cache) == 2
+
     def test_plot_two_features(self, splicing, groupby,
                                group_to_color):
         ind = splicing.data.count() > 10
@@ -397,6 +397,42 @@ class TestStudy(object):
                 columns=columns, index=index, values='psi')
         pdt.assert_frame_equal(true_filtered_splicing, test_filtered_splicing)
 
+    def test_splicing_event_expression(self, study):
+        test = study.splicing_event_expression
+
+        columns = study._maybe_get_axis_name(study.splicing.data, axis=1,
+                                             alt_name=study._event_name)
+        index = study._maybe_get_axis_name(study.splicing.data, axis=0,
+                                           alt_name=study._sample_id)
+        true = study.tidy_splicing_with_expression.pivot_table(
+            values='expression', index=index, columns=columns,
+            aggfunc='max')
+        true = true.reindex(index=study.splicing.data.index,
+                            columns=study.splicing.data.columns)
+
+        # The tidy table only has events with a psi score in a sample
+        test = test[study.splicing.data.notnull()]
+        npt.assert_array_equal(test.values, true.values)
+
+    def test_expression_vs_inconsistent_splicing(self, study):
+        bins = [-np.inf, 2, 5]
+        test = study.expression_vs_inconsistent_splicing(bins=bins)
+
+        groups = study.metadata.data.groupby(study.sample_id_to_phenotype,
+                                             axis=0).groups
+        for i, expression_thresh in enumerate(bins):
+            filtered = study.filter_splicing_on_expression(expression_thresh)
+            for phenotype, sample_ids in groups.items():
+                data = filtered.reindex(index=sample_ids)
+                singles, pooled, not_measured_in_pooled, \
+                    pooled_inconsistent = study.splicing.pooled_inconsistent(
+                        data)
+                percent = study.splicing._divide_inconsistent_and_pooled(
+                    pooled, pooled_inconsistent)
+                npt.assert_equal(test[phenotype, 'percent'][i], percent)
+                npt.assert_equal(test[phenotype, 'n_events'][i],
+                                 data.shape[1])
+
     def test_plot_gene(self, study):
         feature_id = study.expression.data.columns[0]
         study.plot_gene(feature_id)
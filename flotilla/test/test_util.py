@@ -6,9 +6,125 @@ e.g. links to gene lists
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+import threading
+import time
+
+from joblib import Parallel, delayed
+import pandas.util.testing as pdt
+import pytest
+
 
 def test_timeout():
-    pass
+    from flotilla.util import timeout, TimeoutError, TimeoutStats
+
+    stats = TimeoutStats()
+
+    @timeout(0.1, key=lambda seconds: ('event', seconds), stats=stats)
+    def sleep(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    assert sleep(0) == 0
+    with pytest.raises(TimeoutError):
+        sleep(1)
+
+    assert stats.timed_out == [('sleep', ('event', 1))]
+    summary = stats.summary()
+    assert summary.ix['sleep', 'n_calls'] == 2
+    assert summary.ix['sleep', 'n_timeouts'] == 1
+
+    stats.clear()
+    assert len(stats.summary()) == 0
+
+
+def test_timeout_threads():
+    from flotilla.util import timeout, TimeoutError, TimeoutStats
+
+    stats = TimeoutStats()
+
+    @timeout(0.1, stats=stats)
+    def sleep(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    results = []
+
+    def target(seconds):
+        try:
+            results.append(sleep(seconds))
+        except TimeoutError:
+            results.append('timeout')
+
+    threads = [threading.Thread(target=target, args=(seconds,))
+               for seconds in (0, 0, 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results, key=str) == [0, 0, 'timeout']
+    assert stats.summary().ix['sleep', 'n_timeouts'] == 1
+
+
+def test_timeout_cancels():
+    from flotilla.util import timeout, TimeoutError
+
+    counter = {'n': 0}
+
+    @timeout(0.1, stats=None)
+    def spin():
+        while True:
+            counter['n'] += 1
+
+    with pytest.raises(TimeoutError):
+        spin()
+
+    time.sleep(0.1)
+    n = counter['n']
+    time.sleep(0.1)
+    assert counter['n'] == n
+    assert not any(thread.name == 'timeout-spin'
+                   for thread in threading.enumerate())
+
+
+def _sleep(seconds):
+    from flotilla.util import call_with_timeout, TimeoutError
+
+    try:
+        return call_with_timeout(time.sleep, 0.1, args=(seconds,),
+                                 key=seconds)
+    except TimeoutError:
+        return 'timeout'
+
+
+def test_collect_timeout_stats(n_jobs):
+    from flotilla.util import collect_timeout_stats, timeout_stats
+
+    before = timeout_stats.summary()
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(collect_timeout_stats)(_sleep, seconds)
+        for seconds in (0, 0, 1))
+    pdt.assert_frame_equal(timeout_stats.summary(), before)
+
+    assert [result for result, stats in results] == [None, None, 'timeout']
+    for result, stats in results:
+        timeout_stats.update(stats)
+    try:
+        assert timeout_stats.timed_out[-1] == ('sleep', 1)
+        summary = timeout_stats.summary()
+        assert summary.ix['sleep', 'n_calls'] \
+            == before.n_calls.get('sleep', 0) + 3
+        assert summary.ix['sleep', 'n_timeouts'] \
+            == before.n_timeouts.get('sleep', 0) + 1
+    finally:
+        timeout_stats.clear()
+
+
+def test_call_with_timeout_raises():
+    from flotilla.util import call_with_timeout
+
+    with pytest.raises(ZeroDivisionError):
+        call_with_timeout(lambda x: 1 / x, 1, args=(0,), stats=None)
 
 
 def test_serve_ipython():
@@ -30,6 +146,30 @@ def test_dict_to_str():
 #
 # def test_cached_property():
 #     pass
+
+
+def test_memory_bounded_cache():
+    from flotilla.util import MemoryBoundedCache
+
+    cache = MemoryBoundedCache(max_bytes=100)
+    cache.set('a', 1, nbytes=40)
+    cache.set('b', 2, nbytes=40)
+
+    # Using "a" makes "b" the least recently used value
+    assert cache.get('a') == 1
+    cache.set('c', 3, nbytes=40)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.nbytes == 80
+
+    # Too large to be stored
+    cache.set('d', 4, nbytes=200)
+    assert 'd' not in cache
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
 #
 #
 # def test_as_numpy():
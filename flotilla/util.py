@@ -5,16 +5,19 @@ General use utilities
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 
+from collections import Counter, OrderedDict
 import datetime
 from functools import wraps
+import ctypes
 import errno
 import os
 import re
-import signal
 import sys
 import subprocess
+import threading
 import functools
 import time
+import six
 from six.moves import cPickle as pickle
 import gzip
 import tempfile
@@ -29,19 +32,252 @@ class TimeoutError(Exception):
     pass
 
 
-def timeout(seconds=10, error_message=os.strerror(errno.ETIME)):
-    def decorator(func):
-        def _handle_timeout(signum, frame):
-            raise TimeoutError(error_message)
+class _Cancelled(BaseException):
+    """Raised inside a call which timed out, to stop it
+
+    Not an Exception, so ``except Exception`` clauses of the call don't
+    catch it.
+    """
+    pass
+
+
+class TimeoutStats(object):
+    """Thread-safe tally of the calls made through :py:func:`timeout`
+
+    Keeps the number of calls, the number of timeouts and the total time
+    of each function, and the keys (e.g. (event, gene) pairs) of the calls
+    which timed out, so they can be inspected after a run. Tallies can be
+    pickled and added together with :py:meth:`update`, e.g. to fold the
+    tallies of joblib process workers made by
+    :py:func:`collect_timeout_stats` into ``timeout_stats``.
+
+    >>> stats = TimeoutStats()
+    >>> stats.record('do_r', 0.5)
+    >>> stats.record('do_r', 5, timed_out=True, key=('event', 'gene'))
+    >>> stats.timed_out
+    [('do_r', ('event', 'gene'))]
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __getstate__(self):
+        with self._lock:
+            return {'n_calls': self.n_calls, 'n_timeouts': self.n_timeouts,
+                    'seconds': self.seconds, 'timed_out': self.timed_out}
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self.__dict__.update(state)
+
+    def record(self, name, seconds, timed_out=False, key=None):
+        """Add a call of the function ``name`` which took ``seconds``"""
+        with self._lock:
+            self.n_calls[name] += 1
+            self.seconds[name] += seconds
+            if timed_out:
+                self.n_timeouts[name] += 1
+                self.timed_out.append((name, key))
+
+    def update(self, other):
+        """Add the calls recorded in another TimeoutStats"""
+        other = other.__getstate__()
+        with self._lock:
+            self.n_calls.update(other['n_calls'])
+            self.n_timeouts.update(other['n_timeouts'])
+            self.seconds.update(other['seconds'])
+            self.timed_out.extend(other['timed_out'])
+
+    def summary(self):
+        """Number of calls, timeouts and total seconds of each function
+
+        Returns
+        -------
+        summary : pandas.DataFrame
+            A (n_functions, 3) DataFrame with the columns n_calls,
+            n_timeouts and seconds
+        """
+        with self._lock:
+            names = sorted(self.n_calls)
+            return pd.DataFrame(
+                {'n_calls': [self.n_calls[name] for name in names],
+                 'n_timeouts': [self.n_timeouts[name] for name in names],
+                 'seconds': [self.seconds[name] for name in names]},
+                index=names, columns=['n_calls', 'n_timeouts', 'seconds'])
+
+    def clear(self):
+        """Forget all recorded calls"""
+        with self._lock:
+            self.n_calls = Counter()
+            self.n_timeouts = Counter()
+            self.seconds = Counter()
+            self.timed_out = []
+
+
+timeout_stats = TimeoutStats()
+
+# Tallies which collect_timeout_stats collects in place of timeout_stats,
+# per thread
+_collecting = threading.local()
+
+
+def collect_timeout_stats(func, *args, **kwargs):
+    """Call a function, returning the tally of its calls through timeout
+
+    Use this to run functions in joblib workers, and fold the returned
+    tallies into ``timeout_stats`` in the parent, so that it covers the
+    calls of all the workers, including those in other processes. While
+    ``func`` runs, the calls in this thread which would be recorded in
+    ``timeout_stats`` are recorded in the returned tally instead, so they
+    are counted only once with the threading backend, too.
+
+    Parameters
+    ----------
+    func : callable
+        Function to call with the remaining arguments
+
+    Returns
+    -------
+    result
+        The return value of the function
+    stats : TimeoutStats
+        The calls made through :py:func:`timeout` while it ran
+
+    Examples
+    --------
+    >>> from joblib import Parallel, delayed
+    >>> results = Parallel(n_jobs=2)(
+    ...     delayed(collect_timeout_stats)(apply_calc_rs, X, y, method)
+    ...     for X in chunks)  # doctest: +SKIP
+    >>> for result, stats in results:
+    ...     timeout_stats.update(stats)  # doctest: +SKIP
+    """
+    previous = getattr(_collecting, 'stats', None)
+    stats = _collecting.stats = TimeoutStats()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        _collecting.stats = previous
+    return result, stats
+
+
+def _cancel(thread):
+    """Raise _Cancelled in another thread, as soon as it runs Python code
+
+    Like ``signal.alarm`` did, this stops code which hangs in Python, but
+    not a single long call into C, which finishes before it is stopped.
+    """
+    ident = ctypes.c_long(thread.ident)
+    n_threads = ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ident, ctypes.py_object(_Cancelled))
+    if n_threads > 1:
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ident, None)
+
+
+def call_with_timeout(func, seconds, args=(), kwargs=None,
+                      error_message=os.strerror(errno.ETIME), key=None,
+                      stats=timeout_stats):
+    """Call a function, raising TimeoutError if it takes too long
+
+    The function runs in a daemon worker thread while the calling thread
+    waits for at most ``seconds``, so unlike ``signal.alarm``, this works
+    from any thread, not just the main thread, and from joblib workers. If
+    the call times out, it is cancelled: an exception is raised in the
+    worker thread to stop it, and its result is discarded.
+
+    Parameters
+    ----------
+    func : callable
+        Function to call
+    seconds : float
+        Maximum number of seconds to wait for the result
+    args : tuple, optional
+        Positional arguments of the function
+    kwargs : dict, optional
+        Keyword arguments of the function
+    error_message : str, optional
+        Message of the TimeoutError
+    key : object, optional
+        Identifier of this call to report if it times out, e.g. an
+        (event, gene) pair
+    stats : TimeoutStats, optional
+        Where to record the call. By default, the module-level
+        ``timeout_stats``, or the tally of the enclosing
+        :py:func:`collect_timeout_stats`. If None, the call is not recorded
 
+    Returns
+    -------
+    result
+        The return value of the function
+
+    Raises
+    ------
+    TimeoutError
+        If the function didn't return within ``seconds``. Exceptions
+        raised by the function are re-raised in the calling thread
+    """
+    kwargs = {} if kwargs is None else kwargs
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func(*args, **kwargs)
+        except _Cancelled:
+            pass
+        except BaseException:
+            outcome['error'] = sys.exc_info()
+
+    thread = threading.Thread(target=target, name='timeout-{}'.format(
+        getattr(func, '__name__', 'call')))
+    thread.daemon = True
+    start = time.time()
+    thread.start()
+    thread.join(seconds)
+    timed_out = thread.is_alive()
+    if timed_out and not outcome:
+        _cancel(thread)
+    if stats is timeout_stats:
+        stats = getattr(_collecting, 'stats', None) or stats
+    if stats is not None:
+        stats.record(getattr(func, '__name__', repr(func)),
+                     time.time() - start, timed_out=timed_out, key=key)
+    if timed_out:
+        if key is not None:
+            error_message = '{}: {}'.format(error_message, key)
+        raise TimeoutError(error_message)
+    if 'error' in outcome:
+        six.reraise(*outcome['error'])
+    return outcome['result']
+
+
+def timeout(seconds=10, error_message=os.strerror(errno.ETIME), key=None,
+            stats=timeout_stats):
+    """Decorate a function to raise TimeoutError if it takes too long
+
+    Parameters
+    ----------
+    seconds : float, optional
+        Maximum number of seconds to wait for each call
+    error_message : str, optional
+        Message of the TimeoutError
+    key : callable, optional
+        Called with the arguments of each call to get the identifier of the
+        call to report if it times out, e.g. an (event, gene) pair
+    stats : TimeoutStats, optional
+        Where to record the calls
+
+    See Also
+    --------
+    call_with_timeout
+        This calls the decorated function
+    """
+    def decorator(func):
         def wrapper(*args, **kwargs):
-            signal.signal(signal.SIGALRM, _handle_timeout)
-            signal.alarm(seconds)
-            try:
-                result = func(*args, **kwargs)
-            finally:
-                signal.alarm(0)
-            return result
+            call_key = None if key is None else key(*args, **kwargs)
+            return call_with_timeout(func, seconds, args, kwargs,
+                                     error_message=error_message,
+                                     key=call_key, stats=stats)
 
         return wraps(func)(wrapper)
 
@@ -166,6 +402,63 @@ class cached_property(object):
         return value
 
 
+class MemoryBoundedCache(object):
+    """Least-recently-used cache which holds at most ``max_bytes`` of values
+
+    Values are usually numpy arrays, or containers of numpy arrays, whose
+    size can't be found with ``sys.getsizeof``, so the size of each value
+    is given when it is added. When adding a value makes the cache too
+    large, the least recently used values are dropped.
+
+    >>> cache = MemoryBoundedCache(max_bytes=100)
+    >>> cache.set('a', 'value', nbytes=60)
+    >>> cache.get('a')
+    'value'
+    >>> cache.set('b', 'other value', nbytes=60)
+    >>> cache.get('a') is None
+    True
+    """
+
+    def __init__(self, max_bytes=2 ** 28):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._values = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        """Get the value stored at key, and mark it as recently used"""
+        try:
+            value, nbytes = self._values.pop(key)
+        except KeyError:
+            return default
+        self._values[key] = value, nbytes
+        return value
+
+    def set(self, key, value, nbytes):
+        """Store a value of size nbytes, dropping least recently used values
+
+        Values larger than ``max_bytes`` are not stored at all
+        """
+        if key in self._values:
+            self.nbytes -= self._values.pop(key)[1]
+        if nbytes > self.max_bytes:
+            return
+        while self._values and self.nbytes + nbytes > self.max_bytes:
+            self.nbytes -= self._values.popitem(last=False)[1][1]
+        self._values[key] = value, nbytes
+        self.nbytes += nbytes
+
+    def clear(self):
+        """Drop all stored values"""
+        self._values.clear()
+        self.nbytes = 0
+
+
 def as_numpy(x):
     """Given either a pandas dataframe or a numpy array, always return a
     numpy array.
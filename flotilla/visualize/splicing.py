@@ -26,7 +26,7 @@ seaborn_colors = map(mpl.colors.rgb2hex, sns.color_palette('deep'))
 def lavalamp(psi, yticks=(0, 0.5, 1), x_offset=0, title='', ax=None,
              switchy_score_psi=None, marker='o', markersize=10,
              markeredgewidth=0.1, markeredgecolor='#262626',
-             rasterized=True, alpha=0.2, **kwargs):
+             rasterized=True, alpha=0.2, switchy_score_order=None, **kwargs):
     """Make a 'lavalamp' scatter plot of many splicing events
 
     Useful for visualizing many splicing events at once.
@@ -63,6 +63,10 @@ def lavalamp(psi, yticks=(0, 0.5, 1), x_offset=0, title='', ax=None,
         vector-based) plot to save space. True by default.
     alpha : float
         How transparent to plot the markers (1 is opaque)
+    switchy_score_order : array, optional
+        Precomputed plotting order of the events (after removing events
+        without any values), e.g. from a cache. If not provided,
+        calculated from ``switchy_score_psi``
     kwargs : dict
         Keyword arguments to supply to plot()
 
@@ -79,12 +83,14 @@ def lavalamp(psi, yticks=(0, 0.5, 1), x_offset=0, title='', ax=None,
 
     y = as_numpy(psi.dropna(how='all', axis=1))
 
-    if switchy_score_psi is not None:
-        switchy_score_y = as_numpy(switchy_score_psi)
+    if switchy_score_order is not None:
+        order = switchy_score_order
     else:
-        switchy_score_y = y
-
-    order = get_switchy_score_order(switchy_score_y)
+        if switchy_score_psi is not None:
+            switchy_score_y = as_numpy(switchy_score_psi)
+        else:
+            switchy_score_y = y
+        order = get_switchy_score_order(switchy_score_y)
     y = y[:, order]
 
     n_samples, n_events = y.shape
@@ -40,7 +40,6 @@ setup(
                       "networkx",
                       "tornado >= 3.2.1",
                       "pyzmq",
-                      # "dcor_cpy' #needs to be built with extutils",
                       "six",
                       "pytest-cov",
                       "python-coveralls",